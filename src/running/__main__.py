@@ -1,19 +1,45 @@
 #!/usr/env/bin python3
+from typing import List, Optional
 import logging
 import argparse
 
 from running.__version__ import __VERSION__
-from running.command import fillin, runbms, minheap, log_preprocessor
-from running.suite import set_dry_run
+import importlib
 import importlib.resources
 import os
+import sys
 
 logger = logging.getLogger(__name__)
 
-MODULES = [fillin, runbms, minheap, log_preprocessor]
+# The subcommands and the modules that implement them
+# A module is only imported when its subcommand is used, so that, for example,
+# `running fillin` does not pay for importing the benchmark suites and runtimes
+COMMANDS = {
+    "fillin": "running.command.fillin",
+    "runbms": "running.command.runbms",
+    "minheap": "running.command.minheap",
+    "preproc": "running.command.log_preprocessor",
+    "analyze": "running.command.analyze",
+    "compare": "running.command.compare",
+    "curve": "running.command.curve",
+    "compile-config": "running.command.compile_config",
+    "preflight": "running.command.preflight",
+}
 
 
-def setup_parser():
+def get_command(argv: List[str]) -> Optional[str]:
+    """The subcommand in the command line, if any
+
+    The options before the subcommand do not take values, so the subcommand
+    is the first argument that is not an option.
+    """
+    for arg in argv:
+        if not arg.startswith("-"):
+            return arg if arg in COMMANDS else None
+    return None
+
+
+def setup_parser(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="change logging level to DEBUG"
@@ -23,8 +49,13 @@ def setup_parser():
     )
     parser.add_argument("-d", "--dry-run", action="store_true", help="dry run")
     subparsers = parser.add_subparsers()
-    for m in MODULES:
-        m.setup_parser(subparsers)
+    command = get_command(sys.argv[1:] if argv is None else argv)
+    for name, module in COMMANDS.items():
+        if name == command:
+            importlib.import_module(module).setup_parser(subparsers)
+        else:
+            # So that the subcommand is listed by --help
+            subparsers.add_parser(name)
     return parser
 
 
@@ -43,13 +74,13 @@ def main():
     )
 
     if args.get("dry_run") == True:
+        from running.suite import set_dry_run
+
         set_dry_run(True)
+    command = args.get("which")
     with importlib.resources.path(__package__, "config") as config_path:
         os.environ["RUNNING_NG_PACKAGE_DATA"] = str(config_path)
-        for m in MODULES:
-            if m.run(args):
-                break
-        else:
+        if command is None or not importlib.import_module(COMMANDS[command]).run(args):
             parsers.print_help()
 
 
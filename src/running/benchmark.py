@@ -1,17 +1,30 @@
 import logging
 import subprocess
 import sys
-from time import sleep
-from typing import Callable, Sequence, TypeVar, List, Optional, Tuple, Union, Dict
+import threading
+from time import monotonic, sleep
+from typing import (
+    Any,
+    Callable,
+    Sequence,
+    TypeVar,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    Dict,
+)
 from running.runtime import D8, JavaScriptCore, Runtime, DummyRuntime, SpiderMonkey
 from running.modifier import *
 from running.util import smart_quote, split_quoted
 from pathlib import Path
-from copy import deepcopy
 import os
 from enum import Enum
 
 COMPANION_WAIT_START = 2.0
+# How often a cancellable benchmark checks whether it has been cancelled
+CANCEL_POLL_INTERVAL = 0.1
+READ_SIZE = 65536
 
 
 class SubprocessrExit(Enum):
@@ -19,12 +32,32 @@ class SubprocessrExit(Enum):
     Error = 2
     Timeout = 3
     Dryrun = 4
+    Cancelled = 5
+    Killed = 6
 
 
 B = TypeVar("B", bound="Benchmark")
 
 
 class Benchmark(object):
+    """A command to run a benchmark
+
+    Benchmarks are values that are not changed after they are created, so the
+    arguments are tuples, and attaching modifiers creates a new benchmark that
+    shares the fields the modifiers do not change.
+    """
+
+    __slots__ = (
+        "name",
+        "suite_name",
+        "env_args",
+        "wrapper",
+        "companion",
+        "timeout",
+        "override_cwd",
+        "runtime_specific_modifiers_strategy",
+    )
+
     def __init__(
         self,
         suite_name: str,
@@ -42,15 +75,16 @@ class Benchmark(object):
         self.suite_name = suite_name
         self.env_args: Dict[str, str]
         self.env_args = {}
-        self.wrapper: List[str]
+        self.wrapper: Tuple[str, ...]
         if wrapper is not None:
-            self.wrapper = split_quoted(wrapper)
+            self.wrapper = tuple(split_quoted(wrapper))
         else:
-            self.wrapper = []
+            self.wrapper = ()
+        self.companion: Tuple[str, ...]
         if companion is not None:
-            self.companion = split_quoted(companion)
+            self.companion = tuple(split_quoted(companion))
         else:
-            self.companion = []
+            self.companion = ()
         self.timeout = timeout
         # ignore the current working directory provided by commands like runbms or minheap
         # certain benchmarks expect to be invoked from certain directories
@@ -81,20 +115,45 @@ class Benchmark(object):
     def get_runtime_specific_modifiers(self, runtime: Runtime) -> Sequence[Modifier]:
         return self.runtime_specific_modifiers_strategy(runtime)
 
+    def copy_with(self: B, **changes: Any) -> B:
+        """A copy of the benchmark with some of the fields replaced
+
+        The fields that are not replaced are shared with this benchmark.
+        """
+        b = object.__new__(type(self))
+        for cls in type(self).__mro__:
+            for field in getattr(cls, "__slots__", ()):
+                setattr(b, field, changes.get(field, getattr(self, field)))
+        return b
+
+    def extend(self, changes: Dict[str, Any], field: str, val: Sequence[Any]):
+        changes[field] = changes.get(field, getattr(self, field)) + tuple(val)
+
+    def apply_modifier(self, m: Modifier, changes: Dict[str, Any]):
+        """Record how a modifier changes the fields of the benchmark in changes
+
+        Subclasses handle the modifiers specific to them, and leave the rest
+        to this.
+        """
+        if type(m) == Wrapper:
+            self.extend(changes, "wrapper", m.val)
+        elif type(m) == Companion:
+            self.extend(changes, "companion", m.val)
+        elif type(m) == EnvVar:
+            changes["env_args"] = {
+                **changes.get("env_args", self.env_args),
+                m.var: m.val,
+            }
+        elif type(m) == ModifierSet:
+            logging.warning("ModifierSet should have been flattened")
+
     def attach_modifiers(self: B, modifiers: Sequence[Modifier]) -> B:
-        b = deepcopy(self)
+        changes: Dict[str, Any]
+        changes = {}
         for m in modifiers:
-            if not m.should_attach(self.suite_name, self.name):
-                continue
-            elif type(m) == Wrapper:
-                b.wrapper.extend(m.val)
-            elif type(m) == Companion:
-                b.companion.extend(m.val)
-            elif type(m) == EnvVar:
-                b.env_args[m.var] = m.val
-            elif type(m) == ModifierSet:
-                logging.warning("ModifierSet should have been flattened")
-        return b
+            if m.should_attach(self.suite_name, self.name):
+                self.apply_modifier(m, changes)
+        return self.copy_with(**changes) if changes else self
 
     def to_string(self, runtime: Runtime) -> str:
         return "{} {}".format(
@@ -107,9 +166,28 @@ class Benchmark(object):
             ),
         )
 
+    def get_env(self) -> Dict[str, str]:
+        """The environment the benchmark runs with, which is inherited from
+        running-ng, with env_args added"""
+        env = os.environ.copy()
+        env.update({k: os.path.expandvars(v) for k, v in self.env_args.items()})
+        return env
+
     def run(
-        self, runtime: Runtime, cwd: Optional[Path] = None
+        self,
+        runtime: Runtime,
+        cwd: Optional[Path] = None,
+        cancel: Optional[threading.Event] = None,
+        monitor: Optional[Callable[[bytes], bool]] = None,
     ) -> Tuple[bytes, bytes, SubprocessrExit]:
+        """Run the benchmark
+
+        If cancel is given, the benchmark is killed as soon as cancel is set,
+        and the exit is SubprocessrExit.Cancelled.
+        If monitor is given, it is called with the output as it arrives, and
+        the benchmark is killed as soon as it returns True, and the exit is
+        SubprocessrExit.Killed.
+        """
         from running import suite
 
         if suite.is_dry_run():
@@ -118,11 +196,7 @@ class Benchmark(object):
         else:
             cmd = self.get_full_args(runtime)
             cmd = [os.path.expandvars(x) for x in cmd]
-            env_args_to_add = {
-                k: os.path.expandvars(v) for k, v in self.env_args.items()
-            }
-            env_args = os.environ.copy()
-            env_args.update(env_args_to_add)
+            env_args = self.get_env()
             companion_out = b""
             stdout: Optional[bytes]
             if self.companion:
@@ -131,16 +205,25 @@ class Benchmark(object):
                 )
                 sleep(COMPANION_WAIT_START)
             try:
-                p = subprocess.run(
-                    cmd,
-                    env=env_args,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    timeout=self.timeout,
-                    cwd=self.override_cwd if self.override_cwd else cwd,
-                )
-                subprocess_exit = SubprocessrExit.Normal
-                stdout = p.stdout
+                if cancel is not None or monitor is not None:
+                    stdout, subprocess_exit = self.run_cancellable(
+                        cmd,
+                        env_args,
+                        self.override_cwd if self.override_cwd else cwd,
+                        cancel,
+                        monitor,
+                    )
+                else:
+                    p = subprocess.run(
+                        cmd,
+                        env=env_args,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        timeout=self.timeout,
+                        cwd=self.override_cwd if self.override_cwd else cwd,
+                    )
+                    subprocess_exit = SubprocessrExit.Normal
+                    stdout = p.stdout
             except subprocess.CalledProcessError as e:
                 subprocess_exit = SubprocessrExit.Error
                 stdout = e.stdout
@@ -165,31 +248,83 @@ class Benchmark(object):
 
             return stdout if stdout else b"", companion_out, subprocess_exit
 
+    def run_cancellable(
+        self,
+        cmd: Sequence[Union[str, Path]],
+        env: Dict[str, str],
+        cwd: Optional[Path],
+        cancel: Optional[threading.Event],
+        monitor: Optional[Callable[[bytes], bool]],
+    ) -> Tuple[bytes, SubprocessrExit]:
+        deadline = monotonic() + self.timeout if self.timeout is not None else None
+        chunks: List[bytes]
+        chunks = []
+        killed = threading.Event()
+        p = subprocess.Popen(
+            cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd
+        )
+        assert p.stdout is not None
+        stdout = p.stdout
+
+        def read():
+            # The reader owns the pipe, which might outlive the benchmark if a
+            # grandchild still holds it open
+            try:
+                for chunk in iter(lambda: os.read(stdout.fileno(), READ_SIZE), b""):
+                    chunks.append(chunk)
+                    if monitor is not None and not killed.is_set() and monitor(chunk):
+                        killed.set()
+            finally:
+                stdout.close()
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        while True:
+            try:
+                p.wait(timeout=CANCEL_POLL_INTERVAL)
+                reader.join()
+                return b"".join(chunks), SubprocessrExit.Normal
+            except subprocess.TimeoutExpired:
+                if cancel is not None and cancel.is_set():
+                    subprocess_exit = SubprocessrExit.Cancelled
+                elif killed.is_set():
+                    subprocess_exit = SubprocessrExit.Killed
+                elif deadline is not None and monotonic() > deadline:
+                    subprocess_exit = SubprocessrExit.Timeout
+                else:
+                    continue
+            p.kill()
+            p.wait()
+            reader.join(timeout=CANCEL_POLL_INTERVAL)
+            return b"".join(chunks), subprocess_exit
+
 
 class BinaryBenchmark(Benchmark):
-    def __init__(self, program: Path, program_args: List[Union[str, Path]], **kwargs):
+    __slots__ = ("program", "program_args")
+
+    def __init__(
+        self, program: Path, program_args: Sequence[Union[str, Path]], **kwargs
+    ):
         super().__init__(**kwargs)
         self.program = program
-        self.program_args = program_args
+        self.program_args: Tuple[Union[str, Path], ...]
+        self.program_args = tuple(program_args)
         assert program.exists()
 
     def __str__(self) -> str:
         return self.to_string(DummyRuntime(""))
 
-    def attach_modifiers(self, modifiers: Sequence[Modifier]) -> "BinaryBenchmark":
-        bb = super().attach_modifiers(modifiers)
-        for m in modifiers:
-            if not m.should_attach(self.suite_name, self.name):
-                continue
-            elif type(m) == ProgramArg:
-                bb.program_args.extend(m.val)
-            elif type(m) == JVMArg:
-                logging.warning("JVMArg not respected by BinaryBenchmark")
-            elif isinstance(m, JVMClasspathAppend) or type(m) == JVMClasspathPrepend:
-                logging.warning("JVMClasspath not respected by BinaryBenchmark")
-            elif type(m) == JSArg:
-                logging.warning("JSArg not respected by BinaryBenchmark")
-        return bb
+    def apply_modifier(self, m: Modifier, changes: Dict[str, Any]):
+        if type(m) == ProgramArg:
+            self.extend(changes, "program_args", m.val)
+        elif type(m) == JVMArg:
+            logging.warning("JVMArg not respected by BinaryBenchmark")
+        elif isinstance(m, JVMClasspathAppend) or type(m) == JVMClasspathPrepend:
+            logging.warning("JVMClasspath not respected by BinaryBenchmark")
+        elif type(m) == JSArg:
+            logging.warning("JSArg not respected by BinaryBenchmark")
+        else:
+            super().apply_modifier(m, changes)
 
     def get_full_args(self, _runtime: Runtime) -> List[Union[str, Path]]:
         cmd = super().get_full_args(_runtime)
@@ -199,13 +334,22 @@ class BinaryBenchmark(Benchmark):
 
 
 class JavaBenchmark(Benchmark):
+    __slots__ = ("jvm_args", "program_args", "cp")
+
     def __init__(
-        self, jvm_args: List[str], program_args: List[str], cp: List[str], **kwargs
+        self,
+        jvm_args: Sequence[str],
+        program_args: Sequence[str],
+        cp: Sequence[str],
+        **kwargs,
     ):
         super().__init__(**kwargs)
-        self.jvm_args = jvm_args
-        self.program_args = program_args
-        self.cp = cp
+        self.jvm_args: Tuple[str, ...]
+        self.jvm_args = tuple(jvm_args)
+        self.program_args: Tuple[str, ...]
+        self.program_args = tuple(program_args)
+        self.cp: Tuple[str, ...]
+        self.cp = tuple(cp)
 
     def get_classpath_args(self) -> List[str]:
         return ["-cp", ":".join(self.cp)] if self.cp else []
@@ -213,22 +357,19 @@ class JavaBenchmark(Benchmark):
     def __str__(self) -> str:
         return self.to_string(DummyRuntime("java"))
 
-    def attach_modifiers(self, modifiers: Sequence[Modifier]) -> "JavaBenchmark":
-        jb = super().attach_modifiers(modifiers)
-        for m in modifiers:
-            if not m.should_attach(self.suite_name, self.name):
-                continue
-            if type(m) == JVMArg:
-                jb.jvm_args.extend(m.val)
-            elif type(m) == ProgramArg:
-                jb.program_args.extend(m.val)
-            elif isinstance(m, JVMClasspathAppend):
-                jb.cp.extend(m.val)
-            elif type(m) == JVMClasspathPrepend:
-                jb.cp = m.val + jb.cp
-            elif type(m) == JSArg:
-                logging.warning("JSArg not respected by JavaBenchmark")
-        return jb
+    def apply_modifier(self, m: Modifier, changes: Dict[str, Any]):
+        if type(m) == JVMArg:
+            self.extend(changes, "jvm_args", m.val)
+        elif type(m) == ProgramArg:
+            self.extend(changes, "program_args", m.val)
+        elif isinstance(m, JVMClasspathAppend):
+            self.extend(changes, "cp", m.val)
+        elif type(m) == JVMClasspathPrepend:
+            changes["cp"] = tuple(m.val) + changes.get("cp", self.cp)
+        elif type(m) == JSArg:
+            logging.warning("JSArg not respected by JavaBenchmark")
+        else:
+            super().apply_modifier(m, changes)
 
     def get_full_args(self, runtime: Runtime) -> List[Union[str, Path]]:
         cmd = super().get_full_args(runtime)
@@ -240,31 +381,36 @@ class JavaBenchmark(Benchmark):
 
 
 class JavaScriptBenchmark(Benchmark):
+    __slots__ = ("js_args", "program", "program_args")
+
     def __init__(
-        self, js_args: List[str], program: str, program_args: List[str], **kwargs
+        self,
+        js_args: Sequence[str],
+        program: str,
+        program_args: Sequence[str],
+        **kwargs,
     ):
         super().__init__(**kwargs)
-        self.js_args = js_args
+        self.js_args: Tuple[str, ...]
+        self.js_args = tuple(js_args)
         self.program = program
-        self.program_args = program_args
+        self.program_args: Tuple[str, ...]
+        self.program_args = tuple(program_args)
 
     def __str__(self) -> str:
         return self.to_string(DummyRuntime("js"))
 
-    def attach_modifiers(self, modifiers: Sequence[Modifier]) -> "JavaScriptBenchmark":
-        jb = super().attach_modifiers(modifiers)
-        for m in modifiers:
-            if not m.should_attach(self.suite_name, self.name):
-                continue
-            if type(m) == ProgramArg:
-                jb.program_args.extend(m.val)
-            elif type(m) == JVMArg:
-                logging.warning("JVMArg not respected by JavaScriptBenchmark")
-            elif isinstance(m, JVMClasspathAppend) or type(m) == JVMClasspathPrepend:
-                logging.warning("JVMClasspath not respected by JavaScriptBenchmark")
-            elif type(m) == JSArg:
-                jb.js_args.extend(m.val)
-        return jb
+    def apply_modifier(self, m: Modifier, changes: Dict[str, Any]):
+        if type(m) == ProgramArg:
+            self.extend(changes, "program_args", m.val)
+        elif type(m) == JVMArg:
+            logging.warning("JVMArg not respected by JavaScriptBenchmark")
+        elif isinstance(m, JVMClasspathAppend) or type(m) == JVMClasspathPrepend:
+            logging.warning("JVMClasspath not respected by JavaScriptBenchmark")
+        elif type(m) == JSArg:
+            self.extend(changes, "js_args", m.val)
+        else:
+            super().apply_modifier(m, changes)
 
     def get_full_args(self, runtime: Runtime) -> List[Union[str, Path]]:
         cmd = super().get_full_args(runtime)
@@ -288,25 +434,32 @@ class JavaScriptBenchmark(Benchmark):
 
 
 class JuliaBenchmark(Benchmark):
+    __slots__ = ("julia_args", "suite_path", "program_args")
+
     def __init__(
-        self, julia_args: List[str], suite_path: Path, program_args: List[str], **kwargs
+        self,
+        julia_args: Sequence[str],
+        suite_path: Path,
+        program_args: Sequence[str],
+        **kwargs,
     ):
         super().__init__(**kwargs)
-        self.julia_args = julia_args
+        self.julia_args: Tuple[str, ...]
+        self.julia_args = tuple(julia_args)
         self.suite_path = suite_path
-        self.program_args = program_args
+        self.program_args: Tuple[str, ...]
+        self.program_args = tuple(program_args)
 
     def __str__(self) -> str:
         return self.to_string(DummyRuntime("julia"))
 
-    def attach_modifiers(self, modifiers: Sequence[Modifier]) -> "JuliaBenchmark":
-        jb = super().attach_modifiers(modifiers)
-        for m in modifiers:
-            if type(m) == JuliaArg:
-                jb.julia_args.extend(m.val)
-            elif type(m) == ProgramArg:
-                jb.program_args.extend(m.val)
-        return jb
+    def apply_modifier(self, m: Modifier, changes: Dict[str, Any]):
+        if type(m) == JuliaArg:
+            self.extend(changes, "julia_args", m.val)
+        elif type(m) == ProgramArg:
+            self.extend(changes, "program_args", m.val)
+        else:
+            super().apply_modifier(m, changes)
 
     def get_full_args(self, runtime: Runtime) -> List[Union[str, Path]]:
         cmd = super().get_full_args(runtime)
@@ -0,0 +1,178 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import sys
+from running.expression import parse_definitions
+from running.results import ResultTable, load_run, write_table, TABLE_FORMATS
+from running.util import config_str_encode
+
+HEADER = [
+    "suite",
+    "benchmark",
+    "hfac",
+    "config",
+    "metric",
+    "n",
+    "mean",
+    "median",
+    "geomean",
+    "ci_low",
+    "ci_high",
+]
+NORMALIZED_HEADER = ["norm_mean", "norm_ci_low", "norm_ci_high"]
+
+
+def setup_parser(subparsers):
+    f = subparsers.add_parser("analyze")
+    f.set_defaults(which="analyze")
+    f.add_argument("RUN_DIR", type=Path)
+    f.add_argument(
+        "-m",
+        "--metric",
+        action="append",
+        dest="metrics",
+        help="only analyze this metric (can be repeated)",
+    )
+    f.add_argument(
+        "-d",
+        "--derive",
+        action="append",
+        metavar="NAME=EXPRESSION",
+        help="add a derived metric computed from the other metrics of each "
+        "invocation (can be repeated)",
+    )
+    f.add_argument("-b", "--baseline", help="normalize to this config")
+    f.add_argument("-f", "--format", choices=TABLE_FORMATS, default="tsv")
+    f.add_argument("-o", "--output", type=Path)
+    f.add_argument(
+        "--bootstrap",
+        type=int,
+        default=1000,
+        help="number of bootstrap resamples for the confidence intervals",
+    )
+    f.add_argument("--confidence", type=float, default=0.95)
+    f.add_argument("--seed", type=int, default=0)
+
+
+def import_stats() -> Any:
+    try:
+        from running import stats
+    except ImportError:
+        raise RuntimeError(
+            "Statistical analysis requires numpy. "
+            "Try pip install running-ng[analysis] to install the extra dependencies."
+        )
+    return stats
+
+
+def cell_sort_key(cell: Tuple[str, ...]) -> Tuple[Any, ...]:
+    # cell is (suite, benchmark, hfac, config, metric), and hfac is numeric
+    suite, bm, hfac, config, metric = cell
+    return suite, bm, int(hfac), config, metric
+
+
+def analyze(
+    table: ResultTable,
+    baseline: Optional[str],
+    iterations: int,
+    confidence: float,
+    seed: int,
+) -> Tuple[List[str], List[List[str]]]:
+    stats = import_stats()
+    keys = [
+        (wu.suite, wu.benchmark, wu.hfac, wu.config, m)
+        for wu, m in zip(table.work_units, table.metrics)
+    ]
+    groups = stats.Groups(keys, table.values)
+    means = groups.mean()
+    medians = groups.median()
+    geomeans = groups.geomean()
+    lows, highs = groups.bootstrap_ci(iterations, confidence, stats.make_rng(seed))
+    fmt = stats.format_float
+
+    header = list(HEADER)
+    baseline_means: Dict[Tuple[str, ...], float]
+    baseline_means = {}
+    if baseline is not None:
+        header.extend(NORMALIZED_HEADER)
+        for i, (suite, bm, hfac, config, metric) in enumerate(groups.keys):
+            if config == baseline:
+                baseline_means[(suite, bm, hfac, metric)] = means[i]
+        if not baseline_means:
+            logging.warning("Baseline {} not found in the results".format(baseline))
+
+    rows = []
+    summary_keys = []
+    summary_values = []
+    for i in sorted(range(len(groups)), key=lambda i: cell_sort_key(groups.keys[i])):
+        suite, bm, hfac, config, metric = groups.keys[i]
+        row = [
+            suite,
+            bm,
+            hfac,
+            config,
+            metric,
+            str(groups.counts[i]),
+            fmt(means[i]),
+            fmt(medians[i]),
+            fmt(geomeans[i]),
+            fmt(lows[i]),
+            fmt(highs[i]),
+        ]
+        if baseline is not None:
+            base = baseline_means.get((suite, bm, hfac, metric), float("nan"))
+            if base == 0:
+                base = float("nan")
+            row.extend(
+                [fmt(means[i] / base), fmt(lows[i] / base), fmt(highs[i] / base)]
+            )
+            summary_keys.append((hfac, config, metric))
+            summary_values.append(means[i] / base)
+        rows.append(row)
+
+    if baseline is not None:
+        # Geometric means of the normalized means across all benchmarks
+        summary = stats.Groups(summary_keys, summary_values)
+        geomeans = summary.geomean()
+        for i in sorted(
+            range(len(summary)),
+            key=lambda i: cell_sort_key(("", "") + summary.keys[i]),
+        ):
+            hfac, config, metric = summary.keys[i]
+            row = ["", "geomean", hfac, config, metric, str(summary.counts[i])]
+            row.extend([""] * (len(HEADER) - len(row)))
+            row.extend([fmt(geomeans[i]), "", ""])
+            rows.append(row)
+    return header, rows
+
+
+def run(args):
+    if args.get("which") != "analyze":
+        return False
+    run_dir = args.get("RUN_DIR")
+    metrics = args.get("metrics")
+    definitions = parse_definitions(args.get("derive") or [])
+    # The derived metrics might need any of the metrics
+    table = load_run(run_dir, None if definitions else metrics)
+    logging.info("Loaded {} results from {}".format(len(table), run_dir))
+    if definitions:
+        import_stats().derive_metrics(table, definitions)
+        if metrics:
+            table = table.select(metrics + [name for (name, _) in definitions])
+    baseline = args.get("baseline")
+    if baseline is not None:
+        baseline = config_str_encode(baseline)
+    header, rows = analyze(
+        table,
+        baseline,
+        args.get("bootstrap"),
+        args.get("confidence"),
+        args.get("seed"),
+    )
+    output = args.get("output")
+    if output:
+        with output.open("w") as fd:
+            write_table(fd, header, rows, args.get("format"))
+    else:
+        write_table(sys.stdout, header, rows, args.get("format"))
+    return True
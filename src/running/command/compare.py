@@ -0,0 +1,176 @@
+from pathlib import Path
+from typing import List, Tuple
+import logging
+import sys
+from running.command.analyze import import_stats, cell_sort_key
+from running.results import ResultTable, load_run, write_table, TABLE_FORMATS
+
+HEADER = [
+    "suite",
+    "benchmark",
+    "hfac",
+    "config",
+    "metric",
+    "n_a",
+    "n_b",
+    "mean_a",
+    "mean_b",
+    "speedup",
+    "ci_low",
+    "ci_high",
+    "p_value",
+    "verdict",
+]
+# Number of cells bootstrapped at once
+CHUNK = 4096
+
+
+def setup_parser(subparsers):
+    f = subparsers.add_parser("compare")
+    f.set_defaults(which="compare")
+    f.add_argument("RUN_A", type=Path)
+    f.add_argument("RUN_B", type=Path)
+    f.add_argument(
+        "-m",
+        "--metric",
+        action="append",
+        dest="metrics",
+        help="compare this metric (can be repeated, default: time)",
+    )
+    f.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.02,
+        help="relative slowdown of RUN_B below which a change is not a regression",
+    )
+    f.add_argument("-f", "--format", choices=TABLE_FORMATS, default="tsv")
+    f.add_argument("-o", "--output", type=Path)
+    f.add_argument("--bootstrap", type=int, default=1000)
+    f.add_argument("--confidence", type=float, default=0.95)
+    f.add_argument("--seed", type=int, default=0)
+    f.add_argument(
+        "--exit-code",
+        type=int,
+        default=1,
+        metavar="CODE",
+        help="exit with CODE (default: 1) if any regression is found",
+    )
+
+
+def cell_keys(table: ResultTable) -> List[Tuple[str, ...]]:
+    return [
+        (wu.suite, wu.benchmark, wu.hfac, wu.config, m)
+        for wu, m in zip(table.work_units, table.metrics)
+    ]
+
+
+def compare(
+    table_a: ResultTable,
+    table_b: ResultTable,
+    threshold: float,
+    iterations: int,
+    confidence: float,
+    seed: int,
+) -> Tuple[List[List[str]], int]:
+    """Compare the cells present in both runs
+
+    The speedup is mean_a / mean_b, so a speedup less than one means the
+    metric increased (e.g., it took longer) in RUN_B.
+    A cell is a regression if the speedup is significantly less than one,
+    and RUN_B is slower by more than the threshold.
+    Returns the rows of the table and the number of regressions.
+    """
+    stats = import_stats()
+    import numpy as np
+
+    groups_a = stats.Groups(cell_keys(table_a), table_a.values)
+    groups_b = stats.Groups(cell_keys(table_b), table_b.values)
+    index_a = {k: i for (i, k) in enumerate(groups_a.keys) if groups_a.counts[i]}
+    index_b = {k: i for (i, k) in enumerate(groups_b.keys) if groups_b.counts[i]}
+    cells = sorted(index_a.keys() & index_b.keys(), key=cell_sort_key)
+    unmatched = len(index_a) + len(index_b) - 2 * len(cells)
+    if unmatched:
+        logging.warning("{} cells only exist in one of the runs".format(unmatched))
+    ia = np.array([index_a[c] for c in cells], dtype=np.int64)
+    ib = np.array([index_b[c] for c in cells], dtype=np.int64)
+    means_a = groups_a.mean()[ia]
+    means_b = groups_b.mean()[ib]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        speedups = means_a / means_b
+    lows = np.full(len(cells), np.nan)
+    highs = np.full(len(cells), np.nan)
+    p_values = np.full(len(cells), np.nan)
+    rng = stats.make_rng(seed)
+    if iterations > 0:
+        for start in range(0, len(cells), CHUNK):
+            end = min(start + CHUNK, len(cells))
+            # The two runs are resampled independently
+            boot_a = groups_a.bootstrap_means(ia[start:end], iterations, rng)
+            boot_b = groups_b.bootstrap_means(ib[start:end], iterations, rng)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                boot = boot_a / boot_b
+            lows[start:end], highs[start:end] = stats.percentile_ci(boot, confidence)
+            # Two-sided bootstrap test of the null hypothesis speedup = 1
+            below = np.mean(boot <= 1, axis=0)
+            above = np.mean(boot >= 1, axis=0)
+            p_values[start:end] = np.minimum(1, 2 * np.minimum(below, above))
+    alpha = 1 - confidence
+    significant = p_values < alpha
+    regressions = significant & (speedups < 1 / (1 + threshold))
+    improvements = significant & (speedups > 1 + threshold)
+
+    fmt = stats.format_float
+    rows = []
+    for i, (suite, bm, hfac, config, metric) in enumerate(cells):
+        if regressions[i]:
+            verdict = "regression"
+        elif improvements[i]:
+            verdict = "improvement"
+        else:
+            verdict = ""
+        rows.append(
+            [
+                suite,
+                bm,
+                hfac,
+                config,
+                metric,
+                str(groups_a.counts[ia[i]]),
+                str(groups_b.counts[ib[i]]),
+                fmt(means_a[i]),
+                fmt(means_b[i]),
+                fmt(speedups[i]),
+                fmt(lows[i]),
+                fmt(highs[i]),
+                fmt(p_values[i]),
+                verdict,
+            ]
+        )
+    return rows, int(regressions.sum())
+
+
+def run(args):
+    if args.get("which") != "compare":
+        return False
+    metrics = args.get("metrics") or ["time"]
+    table_a = load_run(args.get("RUN_A"), metrics)
+    table_b = load_run(args.get("RUN_B"), metrics)
+    rows, regressions = compare(
+        table_a,
+        table_b,
+        args.get("threshold"),
+        args.get("bootstrap"),
+        args.get("confidence"),
+        args.get("seed"),
+    )
+    output = args.get("output")
+    if output:
+        with output.open("w") as fd:
+            write_table(fd, HEADER, rows, args.get("format"))
+    else:
+        write_table(sys.stdout, HEADER, rows, args.get("format"))
+    if regressions:
+        logging.error("{} regressions found".format(regressions))
+        sys.exit(args.get("exit_code"))
+    return True
@@ -0,0 +1,30 @@
+from pathlib import Path
+import logging
+import os
+from running.config import Configuration, COMPILED_KEY
+
+
+def setup_parser(subparsers):
+    f = subparsers.add_parser("compile-config")
+    f.set_defaults(which="compile-config")
+    f.add_argument("CONFIG", type=str)
+    f.add_argument("OUTPUT", type=Path)
+
+
+def run(args):
+    if args.get("which") != "compile-config":
+        return False
+    configuration = Configuration.from_file(Path(os.getcwd()), args.get("CONFIG"))
+    compiled = configuration.compile()
+    compiled.validate()
+    output = args.get("OUTPUT")
+    with output.open("w") as fd:
+        compiled.save_to_file(fd)
+    logging.info(
+        "Compiled {} configs into {}, fingerprint {}".format(
+            len(compiled.get(COMPILED_KEY)["configs"]),
+            output,
+            compiled.get(COMPILED_KEY)["fingerprint"],
+        )
+    )
+    return True
@@ -0,0 +1,162 @@
+from pathlib import Path
+from typing import Dict, List, Optional, TextIO, Tuple
+import logging
+import sys
+from running.command.minheap import get_journal_file, read_journal
+from running.results import write_table, TABLE_FORMATS
+
+HEADER = ["config", "suite", "benchmark", "heapsize", "hfac", "passes", "runs"]
+CURVE_FORMATS = ["chart"] + TABLE_FORMATS
+# Width of the longest bar of a chart
+BAR_WIDTH = 50
+
+
+def setup_parser(subparsers):
+    f = subparsers.add_parser("curve")
+    f.set_defaults(which="curve")
+    f.add_argument("RESULT", type=Path)
+    f.add_argument(
+        "-m",
+        "--metric",
+        default="duration",
+        help="the metric of the passing runs to plot against the heap size "
+        "(default: duration, the wall-clock time of a run)",
+    )
+    f.add_argument("-f", "--format", choices=CURVE_FORMATS, default="chart")
+    f.add_argument("-o", "--output", type=Path)
+
+
+class Curve(object):
+    """The probes of the minheap search of one benchmark with one config"""
+
+    def __init__(self):
+        self.minheap: Optional[float]
+        self.minheap = None
+        # heap size -> (number of runs, values of the metric of passing runs)
+        self.points: Dict[int, Tuple[int, List[float]]]
+        self.points = {}
+
+    def add_probe(self, heapsize: int, value: Optional[float]):
+        runs, values = self.points.get(heapsize, (0, []))
+        if value is not None:
+            values.append(value)
+        self.points[heapsize] = (runs + 1, values)
+
+    def get_hfac(self, heapsize: int) -> Optional[float]:
+        if not self.minheap or self.minheap == float("inf"):
+            return None
+        return heapsize / self.minheap
+
+    def rows(self) -> List[Tuple[int, Optional[float], int, int, Optional[float]]]:
+        """(heapsize, hfac, passes, runs, mean) sorted by the heap size"""
+        rows = []
+        for heapsize in sorted(self.points):
+            runs, values = self.points[heapsize]
+            mean = sum(values) / len(values) if values else None
+            rows.append((heapsize, self.get_hfac(heapsize), len(values), runs, mean))
+        return rows
+
+
+def load_curves(journal_file: Path, metric: str) -> Dict[Tuple[str, str, str], Curve]:
+    """Collect the probes in a minheap journal by (config, suite, benchmark)
+
+    Both the probes of the searches and of the confirmation are used.
+    Only the runs that passed have a value, and the ones that do not report
+    the metric are counted as runs without one.
+    """
+    curves: Dict[Tuple[str, str, str], Curve]
+    curves = {}
+    for record in read_journal(journal_file):
+        key = (record["config"], record["suite"], record["benchmark"])
+        curve = curves.setdefault(key, Curve())
+        if record["type"] == "minheap":
+            curve.minheap = record["minheap"]
+        elif record["type"] == "probe":
+            value = None
+            if record.get("exit") == "pass":
+                if metric == "duration":
+                    value = record.get("duration")
+                else:
+                    value = record.get("metrics", {}).get(metric)
+            curve.add_probe(record["heapsize"], value)
+    return curves
+
+
+def format_number(x: Optional[float], fmt: str = "{:.3f}") -> str:
+    return "" if x is None else fmt.format(x)
+
+
+def write_chart(fd: TextIO, curves: Dict[Tuple[str, str, str], Curve], metric: str):
+    for (config, suite, bm), curve in sorted(curves.items()):
+        rows = curve.rows()
+        means = [mean for (_, _, _, _, mean) in rows if mean is not None]
+        longest = max(means, default=0)
+        fd.write(
+            "{} {}-{} minheap {} ({})\n".format(
+                config, suite, bm, format_number(curve.minheap, "{}"), metric
+            )
+        )
+        for heapsize, hfac, passes, runs, mean in rows:
+            bar = ""
+            if mean is not None and longest > 0:
+                bar = "#" * max(1, round(BAR_WIDTH * mean / longest))
+            fd.write(
+                "{:>8} {:>6} {:>5} {:>12} {}\n".format(
+                    "{}M".format(heapsize),
+                    format_number(hfac, "{:.2f}x"),
+                    "{}/{}".format(passes, runs),
+                    format_number(mean),
+                    bar,
+                )
+            )
+        fd.write("\n")
+
+
+def table_rows(curves: Dict[Tuple[str, str, str], Curve]) -> List[List[str]]:
+    rows = []
+    for (config, suite, bm), curve in sorted(curves.items()):
+        for heapsize, hfac, passes, runs, mean in curve.rows():
+            rows.append(
+                [
+                    config,
+                    suite,
+                    bm,
+                    str(heapsize),
+                    format_number(hfac),
+                    str(passes),
+                    str(runs),
+                    format_number(mean),
+                ]
+            )
+    return rows
+
+
+def write_curves(
+    fd: TextIO, curves: Dict[Tuple[str, str, str], Curve], metric: str, fmt: str
+):
+    if fmt == "chart":
+        write_chart(fd, curves, metric)
+    else:
+        write_table(fd, HEADER + [metric], table_rows(curves), fmt)
+
+
+def run(args):
+    if args.get("which") != "curve":
+        return False
+    result_file = args.get("RESULT")
+    # Either the RESULT of minheap or its journal
+    journal_file = result_file
+    if result_file.suffix != ".jsonl":
+        journal_file = get_journal_file(result_file)
+    if not journal_file.exists():
+        raise ValueError("Minheap journal not found at {}".format(journal_file))
+    metric = args.get("metric")
+    curves = load_curves(journal_file, metric)
+    logging.info("Loaded {} curves from {}".format(len(curves), journal_file))
+    output = args.get("output")
+    if output:
+        with output.open("w") as fd:
+            write_curves(fd, curves, metric, args.get("format"))
+    else:
+        write_curves(sys.stdout, curves, metric, args.get("format"))
+    return True
@@ -1,20 +1,31 @@
-from copy import deepcopy
 from pathlib import Path
 import gzip
 import enum
-from typing import Any, Callable, Dict, List
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 import functools
+import hashlib
+import json
+import logging
+import multiprocessing
 import re
+import sys
+import time
 from running.config import Configuration
+from running.expression import Expression, parse_definitions
+from running.results import MMTk_HEADER, MMTk_FOOTER
+from running.__version__ import __VERSION__
 import os
 
-MMTk_HEADER = (
-    "============================ MMTk Statistics Totals ============================"
-)
-MMTk_FOOTER = (
-    "------------------------------ End MMTk Statistics -----------------------------"
-)
-
 
 class EditingMode(enum.Enum):
     NotEditing = 1
@@ -29,25 +40,65 @@ def setup_parser(subparsers):
     f.add_argument("CONFIG", type=Path)
     f.add_argument("SOURCE", type=Path)
     f.add_argument("TARGET", type=Path)
+    f.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of files to process in parallel",
+    )
+    f.add_argument(
+        "--force",
+        action="store_true",
+        help="process all logs, including the ones that are up to date",
+    )
+    f.add_argument(
+        "--watch",
+        type=float,
+        nargs="?",
+        const=30.0,
+        metavar="INTERVAL",
+        help="keep processing new logs every INTERVAL (default: 30) seconds",
+    )
+
+
+# Each preprocessing function updates the statistics of a block in place,
+# and returns the same dictionary
+Stats = Dict[str, float]
 
 
 def filter_stats(predicate: Callable[[str], bool]):
-    def inner(stats: Dict[str, float]):
-        return {k: v for (k, v) in stats.items() if predicate(k)}
+    def inner(stats: Stats):
+        for k in [k for k in stats if not predicate(k)]:
+            del stats[k]
+        return stats
 
     return inner
 
 
-def reduce_stats(pattern: str, new_column: str, func):
+def memoize(predicate: Callable[[str], bool]) -> Callable[[str], bool]:
+    # Blocks from the same log almost always have the same names, so the
+    # outcome of a predicate on a name is worth remembering
+    return functools.lru_cache(maxsize=None)(predicate)
+
+
+def matcher(pattern: str) -> Callable[[str], bool]:
     compiled = re.compile(pattern)
+    return memoize(lambda name: compiled.match(name) is not None)
+
+
+def contains_any(patterns: List[str]) -> Callable[[str], bool]:
+    return memoize(lambda name: any(p in name for p in patterns))
 
-    def inner(stats: Dict[str, float]):
-        to_reduce = [v for (k, v) in stats.items() if compiled.match(k)]
-        if not to_reduce:
-            return stats
-        new_stats = deepcopy(stats)
-        new_stats[new_column] = functools.reduce(func, to_reduce)
-        return new_stats
+
+def reduce_stats(pattern: str, new_column: str, func):
+    match = matcher(pattern)
+
+    def inner(stats: Stats):
+        to_reduce = [v for (k, v) in stats.items() if match(k)]
+        if to_reduce:
+            stats[new_column] = functools.reduce(func, to_reduce)
+        return stats
 
     return inner
 
@@ -61,37 +112,38 @@ def sum_work_perf_event(event_name):
 def ratio_work_perf_event(event_name: str):
     pattern = "work\\.\\w+\\.{}\\.total".format(event_name)
     aggregated_column = "work.{}.total".format(event_name)
-    compiled = re.compile(pattern)
+    match = matcher(pattern)
 
-    def inner(stats: Dict[str, float]):
-        new_stats = deepcopy(stats)
-        for k, v in stats.items():
-            if compiled.match(k):
-                new_column = k.replace(".total", ".ratio")
-                new_stats[new_column] = v / stats[aggregated_column]
-        return new_stats
+    def inner(stats: Stats):
+        matched = [(k, v) for (k, v) in stats.items() if match(k)]
+        if matched:
+            total = stats[aggregated_column]
+            for k, v in matched:
+                stats[k.replace(".total", ".ratio")] = v / total
+        return stats
 
     return inner
 
 
 def ratio_event(event_name: str):
-    def inner(stats: Dict[str, float]):
-        new_stats = deepcopy(stats)
-        stw_key = "{}.stw".format(event_name)
-        other_key = "{}.other".format(event_name)
+    stw_key = "{}.stw".format(event_name)
+    other_key = "{}.other".format(event_name)
+    stw_ratio_key = "{}.ratio".format(stw_key)
+    other_ratio_key = "{}.ratio".format(other_key)
+
+    def inner(stats: Stats):
         if stw_key in stats and other_key in stats:
             gc = stats[stw_key]
             mu = stats[other_key]
             total = gc + mu
-            new_stats["{}.ratio".format(stw_key)] = gc / total
-            new_stats["{}.ratio".format(other_key)] = mu / total
-        return new_stats
+            stats[stw_ratio_key] = gc / total
+            stats[other_ratio_key] = mu / total
+        return stats
 
     return inner
 
 
-def calc_ipc(stats: Dict[str, float]):
-    new_stats = deepcopy(stats)
+def calc_ipc(stats: Stats):
     for phase in ["mu", "gc"]:
         inst = stats.get("PERF_COUNT_HW_INSTRUCTIONS.{}".format(phase))
         cycles = stats.get("PERF_COUNT_HW_CPU_CYCLES.{}".format(phase))
@@ -99,108 +151,345 @@ def calc_ipc(stats: Dict[str, float]):
             if cycles == 0:
                 assert inst == 0
                 continue
-            new_stats["INSTRUCTIONS_PER_CYCLE.{}".format(phase)] = inst / cycles
-    return new_stats
+            stats["INSTRUCTIONS_PER_CYCLE.{}".format(phase)] = inst / cycles
+    return stats
 
 
-def calc_work_ipc(stats: Dict[str, float]):
-    pattern = "work\\.\\w+\\.PERF_COUNT_HW_INSTRUCTIONS\\.total"
-    compiled = re.compile(pattern)
-    new_stats = deepcopy(stats)
-    for k, v in stats.items():
-        if compiled.match(k):
-            cycles = k.replace("PERF_COUNT_HW_INSTRUCTIONS", "PERF_COUNT_HW_CPU_CYCLES")
-            ipc = k.replace(
-                "PERF_COUNT_HW_INSTRUCTIONS.total", "INSTRUCTIONS_PER_CYCLE.ratio"
-            )
-            new_stats[ipc] = stats[k] / stats[cycles]
-    return new_stats
+is_work_instructions = matcher("work\\.\\w+\\.PERF_COUNT_HW_INSTRUCTIONS\\.total")
 
 
-def stat_sort_helper(key: str, value: float):
-    if len(key.split(".")) > 1:
-        return key.split(".")[-2], -value
+def calc_work_ipc(stats: Stats):
+    for k in [k for k in stats if is_work_instructions(k)]:
+        cycles = k.replace("PERF_COUNT_HW_INSTRUCTIONS", "PERF_COUNT_HW_CPU_CYCLES")
+        ipc = k.replace(
+            "PERF_COUNT_HW_INSTRUCTIONS.total", "INSTRUCTIONS_PER_CYCLE.ratio"
+        )
+        stats[ipc] = stats[k] / stats[cycles]
+    return stats
+
+
+def derive(definitions: List[Tuple[str, Expression]]):
+    def inner(stats: Stats):
+        for name, expression in definitions:
+            try:
+                stats[name] = expression(stats)
+            except KeyError:
+                # Like the other preprocessing functions, skip the blocks
+                # without the statistics needed
+                continue
+        return stats
+
+    return inner
+
+
+@functools.lru_cache(maxsize=None)
+def stat_sort_group(key: str) -> str:
+    parts = key.split(".")
+    if len(parts) > 1:
+        return parts[-2]
     else:
-        return key, -value
+        return key
 
 
-def process_lines(configuration: Configuration, lines: List[str]):
-    new_lines = []
-    editing = EditingMode.NotEditing
-    names = []
+def stat_sort_helper(key: str, value: float):
+    return stat_sort_group(key), -value
+
+
+def compile_preprocessing(configuration: Configuration) -> Callable[[Stats], Stats]:
+    """Turn the preprocessing section of the configuration into one function
+
+    This is done once, rather than once per block or per file.
+    """
     funcs: List[Any]
     funcs = []
-    if configuration.get("preprocessing") is None:
-        funcs = []
-    else:
-        for f in configuration.get("preprocessing"):
-            if f["name"] == "sum_work_perf_event":
-                for v in f["val"].split(","):
-                    funcs.append(sum_work_perf_event(v))
-            elif f["name"] == "ratio_work_perf_event":
-                for v in f["val"].split(","):
-                    funcs.append(ratio_work_perf_event(v))
-            elif f["name"] == "calc_work_ipc":
-                funcs.append(calc_work_ipc)
-            elif f["name"] == "ratio_event":
-                for v in f["val"].split(","):
-                    funcs.append(ratio_event(v))
-            elif f["name"] == "filter_stats":
-                patterns_to_keep = f["val"].split(",")
-                funcs.append(
-                    filter_stats(lambda n: any([p in n for p in patterns_to_keep]))
-                )
-            elif f["name"] == "calc_ipc":
-                funcs.append(calc_ipc)
-            else:
-                raise ValueError("Not supported preprocessing functionality")
+    for f in configuration.get("preprocessing") or []:
+        if f["name"] == "sum_work_perf_event":
+            for v in f["val"].split(","):
+                funcs.append(sum_work_perf_event(v))
+        elif f["name"] == "ratio_work_perf_event":
+            for v in f["val"].split(","):
+                funcs.append(ratio_work_perf_event(v))
+        elif f["name"] == "calc_work_ipc":
+            funcs.append(calc_work_ipc)
+        elif f["name"] == "ratio_event":
+            for v in f["val"].split(","):
+                funcs.append(ratio_event(v))
+        elif f["name"] == "filter_stats":
+            funcs.append(filter_stats(contains_any(f["val"].split(","))))
+        elif f["name"] == "calc_ipc":
+            funcs.append(calc_ipc)
+        elif f["name"] == "derive":
+            funcs.append(derive(parse_definitions(f["val"])))
+        else:
+            raise ValueError("Not supported preprocessing functionality")
+
+    def pipeline(stats: Stats) -> Stats:
+        for func in funcs:
+            stats = func(stats)
+        return stats
+
+    return pipeline
+
+
+def format_stats(stats: Stats) -> Tuple[str, str]:
+    if not stats:
+        return "empty_after_preprocessing\n", "0\n"
+    new_stat_list = sorted(stats.items(), key=lambda x: stat_sort_helper(x[0], x[1]))
+    new_names, new_values = list(zip(*new_stat_list))
+    return (
+        "{}\n".format("\t".join(new_names)),
+        "{}\n".format("\t".join(map(str, new_values))),
+    )
+
+
+def process_lines(
+    configuration: Configuration,
+    lines: Iterable[str],
+    pipeline: Optional[Callable[[Stats], Stats]] = None,
+) -> Iterator[str]:
+    """Preprocess the MMTk statistics blocks in a stream of lines
+
+    The other lines are passed through as they are read, so only one block is
+    ever held in memory.
+    """
+    if pipeline is None:
+        pipeline = compile_preprocessing(configuration)
+    editing = EditingMode.NotEditing
+    names: List[str]
+    names = []
     for line in lines:
-        if line.strip() == MMTk_HEADER:
-            new_lines.append(line)
+        # The substring search filters out almost all lines cheaply.
+        # A header starts a new block in any state, because the previous
+        # block might be truncated, for example by a crash.
+        if MMTk_HEADER in line and line.strip() == MMTk_HEADER:
             editing = EditingMode.Names
-            continue
-        elif line.strip() == MMTk_FOOTER:
-            assert editing == EditingMode.TotalTime
-            new_lines.append(line)
-            editing = EditingMode.NotEditing
-            continue
-        if editing == EditingMode.Names:
+            yield line
+        elif editing is EditingMode.NotEditing:
+            yield line
+        elif editing is EditingMode.Names:
             names = line.strip().split("\t")
             editing = EditingMode.Values
-        elif editing == EditingMode.Values:
+        elif editing is EditingMode.Values:
             values = map(float, line.strip().split("\t"))
-            stats = dict(zip(names, values))
-            new_stats = functools.reduce(lambda accum, val: val(accum), funcs, stats)
-            if len(new_stats):
-                new_stat_list = list(new_stats.items())
-                new_stat_list.sort(key=lambda x: stat_sort_helper(x[0], x[1]))
-                new_names, new_values = list(zip(*new_stat_list))
-                new_lines.append("{}\n".format("\t".join(new_names)))
-                new_lines.append("{}\n".format("\t".join(map(str, new_values))))
-            else:
-                new_lines.append("empty_after_preprocessing\n")
-                new_lines.append("0\n")
+            stats = pipeline(dict(zip(names, values)))
+            yield from format_stats(stats)
             editing = EditingMode.TotalTime
-        elif editing == EditingMode.TotalTime:
-            new_lines.append(line)
         else:
-            new_lines.append(line)
+            if line.strip() == MMTk_FOOTER:
+                editing = EditingMode.NotEditing
+            yield line
 
-    return new_lines
 
-
-def process_one_file(configuration: Configuration, original: Path, targetfile: Path):
+def process_one_file(
+    configuration: Configuration,
+    original: Path,
+    targetfile: Path,
+    pipeline: Optional[Callable[[Stats], Stats]] = None,
+):
     # XXX DO NOT COPY the content of the log file
     # Tab might not be preserved (especially around line breaks)
     # https://unix.stackexchange.com/questions/324676/output-tab-character-on-terminal-window
+    # Compress as much as gzip(1) does by default for the logs from runbms,
+    # which is much faster than the maximum compression of gzip.open
     with gzip.open(original, "rt") as old:
-        with gzip.open(targetfile, "wt") as new:
-            new.writelines(process_lines(configuration, old.readlines()))
-
-
-def process(configuration: Configuration, source: Path, target: Path):
-    for file in source.glob("*.log.gz"):
-        process_one_file(configuration, file, target / file.name)
+        with gzip.open(targetfile, "wt", compresslevel=6) as new:
+            new.writelines(process_lines(configuration, old, pipeline))
+
+
+# The configuration of a worker process of the pool, and the preprocessing
+# pipeline compiled from it
+worker_configuration: Configuration
+worker_pipeline: Callable[[Stats], Stats]
+
+
+def init_worker(configuration: Configuration):
+    global worker_configuration
+    global worker_pipeline
+    worker_configuration = configuration
+    worker_pipeline = compile_preprocessing(configuration)
+
+
+def try_process_one_file(
+    configuration: Configuration,
+    pipeline: Callable[[Stats], Stats],
+    original: Path,
+    targetfile: Path,
+) -> Tuple[Path, Optional[str]]:
+    """Process a file, and return the error message if it fails
+
+    A partially written target file is removed.
+    """
+    try:
+        process_one_file(configuration, original, targetfile, pipeline)
+        return original, None
+    except Exception as e:
+        if targetfile.exists():
+            targetfile.unlink()
+        return original, "{}: {}".format(type(e).__name__, e)
+
+
+def try_process_task(task: Tuple[Path, Path]) -> Tuple[Path, Optional[str]]:
+    return try_process_one_file(worker_configuration, worker_pipeline, *task)
+
+
+class Manifest(object):
+    """Record of the sources of the preprocessed logs in a target directory
+
+    An output is up to date if its source has the same size and modification
+    time as when it was processed, and the preprocessing section of the
+    configuration has not changed since.
+    """
+
+    FILENAME = "preproc_manifest.json"
+
+    def __init__(self, target: Path, configuration: Configuration):
+        self.path = target / Manifest.FILENAME
+        self.fingerprint = Manifest.get_fingerprint(configuration)
+        self.entries: Dict[str, Dict[str, Any]]
+        self.entries = {}
+        if self.path.exists():
+            with self.path.open() as fd:
+                manifest = json.load(fd)
+            if manifest.get("fingerprint") == self.fingerprint:
+                self.entries = manifest.get("entries", {})
+            else:
+                logging.info("Preprocessing changed, all logs will be processed")
+
+    @staticmethod
+    def get_fingerprint(configuration: Configuration) -> str:
+        preprocessing = json.dumps(
+            [__VERSION__, configuration.get("preprocessing")], sort_keys=True
+        )
+        return hashlib.sha256(preprocessing.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def describe(original: Path) -> Dict[str, Any]:
+        st = original.stat()
+        return {
+            "source": str(original.resolve()),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        }
+
+    def is_up_to_date(self, original: Path, targetfile: Path) -> bool:
+        entry = self.entries.get(targetfile.name)
+        return (
+            entry is not None
+            and targetfile.exists()
+            and entry == Manifest.describe(original)
+        )
+
+    def record(self, original: Path, targetfile: Path):
+        self.entries[targetfile.name] = Manifest.describe(original)
+
+    def save(self):
+        # Write to a temporary file first so that an interrupted save does not
+        # corrupt the manifest
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w") as fd:
+            json.dump(
+                {"fingerprint": self.fingerprint, "entries": self.entries},
+                fd,
+                indent=1,
+                sort_keys=True,
+            )
+        os.replace(tmp, self.path)
+
+
+def is_complete(log: Path) -> bool:
+    # runbms compresses X.log into X.log.gz using gzip, which removes X.log
+    # once X.log.gz is completely written
+    return not log.with_suffix("").exists()
+
+
+def process(
+    configuration: Configuration,
+    source: Path,
+    target: Path,
+    jobs: int = 1,
+    manifest: Optional[Manifest] = None,
+) -> List[Tuple[Path, str]]:
+    """Process all logs under source, and return the ones that failed
+
+    The output of each file only depends on the file itself, so the output is
+    the same regardless of the number of jobs and the order of completion.
+    If a manifest is given, logs that have been processed are skipped, and
+    the logs processed successfully are recorded in the manifest.
+    """
+    files = [f for f in sorted(source.glob("*.log.gz")) if is_complete(f)]
+    tasks = [(file, target / file.name) for file in files]
+    if manifest is not None:
+        tasks = [t for t in tasks if not manifest.is_up_to_date(*t)]
+        if len(files) > len(tasks):
+            # Keep quiet when there is nothing new, e.g., in watch mode
+            log = logging.info if tasks else logging.debug
+            log("Skipping {} logs that are up to date".format(len(files) - len(tasks)))
+    failed = []
+
+    def progress(done: int, result: Tuple[Path, Optional[str]]):
+        original, error = result
+        if error is not None:
+            failed.append((original, error))
+        elif manifest is not None:
+            manifest.record(original, target / original.name)
+        print(
+            "\r{}/{} files processed, {} failed".format(done, len(tasks), len(failed)),
+            end="",
+            flush=True,
+        )
+
+    if jobs <= 1:
+        pipeline = compile_preprocessing(configuration)
+        for done, (original, targetfile) in enumerate(tasks, start=1):
+            result = try_process_one_file(configuration, pipeline, original, targetfile)
+            progress(done, result)
+    elif tasks:
+        with multiprocessing.Pool(
+            jobs, initializer=init_worker, initargs=(configuration,)
+        ) as pool:
+            results = pool.imap_unordered(try_process_task, tasks)
+            for done, result in enumerate(results, start=1):
+                progress(done, result)
+    if tasks:
+        print()
+    if manifest is not None:
+        manifest.save()
+    failed.sort()
+    return failed
+
+
+def report_failed(failed: List[Tuple[Path, str]]):
+    for original, error in failed:
+        logging.error("Failed to process {}: {}".format(original, error))
+    logging.error("{} files failed".format(len(failed)))
+
+
+def watch(
+    configuration: Configuration,
+    source: Path,
+    target: Path,
+    jobs: int,
+    manifest: Manifest,
+    interval: float,
+):
+    """Keep processing new logs (e.g., from an ongoing runbms) until interrupted"""
+    logging.info(
+        "Watching {} every {} seconds, press Ctrl-C to stop".format(source, interval)
+    )
+    reported: Set[Path]
+    reported = set()
+    try:
+        while True:
+            failed = process(configuration, source, target, jobs, manifest)
+            # A log that failed is retried in the next round, but only reported
+            # once
+            new_failed = [f for f in failed if f[0] not in reported]
+            if new_failed:
+                report_failed(new_failed)
+                reported.update(f[0] for f in new_failed)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        logging.info("Stopped watching {}".format(source))
 
 
 def run(args):
@@ -210,5 +499,16 @@ def run(args):
     source = args.get("SOURCE")
     target = args.get("TARGET")
     target.mkdir(parents=True, exist_ok=True)
-    process(configuration, source, target)
+    manifest = Manifest(target, configuration)
+    if args.get("force"):
+        manifest.entries = {}
+    if args.get("watch") is not None:
+        watch(
+            configuration, source, target, args.get("jobs"), manifest, args.get("watch")
+        )
+        return True
+    failed = process(configuration, source, target, args.get("jobs"), manifest)
+    if failed:
+        report_failed(failed)
+        sys.exit(1)
     return True
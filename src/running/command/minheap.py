@@ -1,15 +1,38 @@
-from typing import Any, Dict, Optional, DefaultDict
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    DefaultDict,
+)
 from running.config import Configuration
 from pathlib import Path
-from running.runtime import NativeExecutable, Runtime
+from running.runtime import Runtime
 from running.benchmark import Benchmark, SubprocessrExit
+from running.modifier import Modifier, Wrapper
+from running.results import parse_output
 from running.suite import BenchmarkSuite
 from running.util import parse_config_str, config_str_encode
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import fcntl
+import functools
+import hashlib
+import json
 import logging
+import math
+import queue
+import shutil
 import tempfile
+import threading
+import time
 import yaml
 from running.suite import is_dry_run
-from collections import defaultdict
+from collections import defaultdict, deque
 from enum import Enum
 import os
 
@@ -22,12 +45,139 @@ def setup_parser(subparsers):
     f.add_argument("CONFIG", type=Path)
     f.add_argument("RESULT", type=Path)
     f.add_argument("-a", "--attempts", type=int)
+    f.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of searches to run in parallel, each on its own set of CPUs",
+    )
+    f.add_argument(
+        "-k",
+        "--probes",
+        type=int,
+        default=1,
+        help="number of heap sizes each search probes at once",
+    )
+    f.add_argument(
+        "-w",
+        "--warm-start",
+        nargs="?",
+        const="",
+        metavar="SEED_CONFIG",
+        help="start each search from a known minheap value, "
+        "optionally the one of SEED_CONFIG",
+    )
+    f.add_argument(
+        "-p",
+        "--profile",
+        action="store_true",
+        help="start each search from the peak heap usage after GC "
+        "of a run with maxheap",
+    )
+    f.add_argument(
+        "--thrashing",
+        type=float,
+        metavar="GC_FRACTION",
+        help="kill a run as soon as GC pauses take GC_FRACTION of the time "
+        "over a window, and treat the heap as too small",
+    )
+    f.add_argument(
+        "--thrashing-window",
+        type=float,
+        default=10.0,
+        metavar="SECONDS",
+        help="the window for detecting thrashing (default: 10)",
+    )
+    f.add_argument(
+        "--thrashing-gc-rate",
+        type=float,
+        metavar="RATE",
+        help="also treat a run with RATE GCs per second over the window as thrashing",
+    )
+    f.add_argument(
+        "--confirm",
+        type=int,
+        default=0,
+        metavar="RUNS",
+        help="confirm the minheap found by each search with up to RUNS runs per size",
+    )
+    f.add_argument(
+        "--success-ratio",
+        type=float,
+        default=1.0,
+        help="fraction of the confirmation runs that have to pass (default: 1.0)",
+    )
+    f.add_argument(
+        "--compact",
+        action="store_true",
+        help="only compact the journal into RESULT without running any search",
+    )
+
+
+def print_inline(s: str):
+    print(s, end="", flush=True)
+
+
+class ThrashingDetector(object):
+    """Detect a run that spends most of its time in GC from its GC log
+
+    The detector is fed with the output of a run as it arrives, and the GC
+    pauses are timed by when they are logged.
+    A run is thrashing if, over the last window seconds, the GC pauses add up
+    to at least gc_fraction of the window, or (if gc_rate is given) there are
+    at least gc_rate GCs per second.
+    """
+
+    def __init__(
+        self,
+        runtime: Runtime,
+        window: float,
+        gc_fraction: float,
+        gc_rate: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.runtime = runtime
+        self.window = window
+        self.gc_fraction = gc_fraction
+        self.gc_rate = gc_rate
+        self.clock = clock
+        self.start = clock()
+        self.pauses: Deque[Tuple[float, float]]
+        self.pauses = deque()
+        self.paused = 0.0
+        self.partial_line = b""
+
+    def __call__(self, chunk: bytes) -> bool:
+        now = self.clock()
+        lines = (self.partial_line + chunk).split(b"\n")
+        self.partial_line = lines.pop()
+        for line in lines:
+            pause = self.runtime.get_gc_pause(line)
+            if pause is not None:
+                self.pauses.append((now, pause))
+                self.paused += pause
+        while self.pauses and self.pauses[0][0] < now - self.window:
+            self.paused -= self.pauses.popleft()[1]
+        if now - self.start < self.window:
+            # Not enough history yet, e.g., a burst of GCs during startup
+            return False
+        if self.paused >= self.gc_fraction * self.window:
+            return True
+        return (
+            self.gc_rate is not None and len(self.pauses) >= self.gc_rate * self.window
+        )
+
+
+# Creates a detector for each run if thrashing detection is enabled
+thrashing_detector: Optional[Callable[[Runtime], ThrashingDetector]] = None
 
 
 class ContinueSearch(Enum):
     Abort = 1
     HeapTooBig = 2
     HeapTooSmall = 3
+    Cancelled = 4
 
 
 def run_bm_with_retry(
@@ -36,26 +186,60 @@ def run_bm_with_retry(
     bm_with_heapsize: Benchmark,
     minheap_dir: Path,
     attempts: int,
+    log: Callable[[str], None] = print_inline,
+    cancel: Optional[threading.Event] = None,
+    details: Optional[Dict[str, Any]] = None,
 ) -> ContinueSearch:
-    def log(s):
-        return print(s, end="", flush=True)
+    """Run a benchmark at a heap size, retrying crashed runs
+
+    If details is given, it is filled with how the run that decided the
+    outcome exited, how long it took, and the metrics in its output.
+    """
+
+    def classify(exit: str, output: bytes, start: float):
+        if details is not None:
+            details["exit"] = exit
+            details["duration"] = round(time.monotonic() - start, 3)
+            details["metrics"] = parse_output(output.decode("utf-8", "replace"))
 
     log(" ")
+    gc_log = runtime.get_gc_log_modifiers() if thrashing_detector else []
+    if gc_log:
+        bm_with_heapsize = bm_with_heapsize.attach_modifiers(gc_log)
     for _ in range(attempts):
+        if cancel is not None and cancel.is_set():
+            log("c ")
+            return ContinueSearch.Cancelled
+        monitor = None
+        if thrashing_detector is not None and gc_log:
+            monitor = thrashing_detector(runtime)
+        start = time.monotonic()
         output, _companion_output, subprocess_exit = bm_with_heapsize.run(
-            runtime, cwd=minheap_dir
+            runtime, cwd=minheap_dir, cancel=cancel, monitor=monitor
         )
+        if subprocess_exit is SubprocessrExit.Cancelled:
+            # The outcome is no longer needed by the search
+            log("c ")
+            return ContinueSearch.Cancelled
+        if subprocess_exit is SubprocessrExit.Killed:
+            # Like a timeout, but without waiting for it
+            log("g ")
+            classify("thrashing", output, start)
+            return ContinueSearch.HeapTooSmall
         if runtime.is_oom(output):
             # if OOM is detected, we exit the loop regardless the exit statussour
             log("x ")
+            classify("oom", output, start)
             return ContinueSearch.HeapTooSmall
         if subprocess_exit is SubprocessrExit.Normal:
             if suite.is_passed(output):
                 log("o ")
+                classify("pass", output, start)
                 return ContinueSearch.HeapTooBig
         elif subprocess_exit is SubprocessrExit.Timeout:
             # A timeout is likely due to heap being too small and many GCs scheduled back to back
             log("t ")
+            classify("timeout", output, start)
             return ContinueSearch.HeapTooSmall
         # If not the above scenario, we treat this invocation as a crash or some kind of erroneous state
         log(".")
@@ -63,9 +247,122 @@ def run_bm_with_retry(
     # No successful invocation in the above attempts, but none OOMed either
     # Probably too many crashes, abort the binary search for this benchmark
     log(" ")
+    if details is not None:
+        details["exit"] = "crash"
     return ContinueSearch.Abort
 
 
+def bracket(
+    probe: Callable[[int], ContinueSearch], guess: int, heap: int
+) -> Optional[Tuple[int, int, float]]:
+    """Find an interval around a guess of the minheap
+
+    The first step is 10% of the guess, and it doubles each time until the
+    outcome changes.
+    Returns (lo, hi, minh) to continue the binary search from, or None if the
+    search should be aborted.
+    """
+    guess = min(max(guess, 3), heap - 1)
+    step = max(1, guess // 10)
+    result = probe(guess)
+    if result is ContinueSearch.Abort:
+        return None
+    elif result is ContinueSearch.HeapTooBig:
+        lo, hi = 2, guess
+        size = hi - step
+        while size > lo:
+            result = probe(size)
+            if result is ContinueSearch.Abort:
+                return None
+            elif result is ContinueSearch.HeapTooBig:
+                hi = size
+                step *= 2
+                size = hi - step
+            else:
+                lo = size
+                break
+        return lo, hi, hi
+    else:
+        lo, hi = guess, heap
+        size = lo + step
+        while size < hi:
+            result = probe(size)
+            if result is ContinueSearch.Abort:
+                return None
+            elif result is ContinueSearch.HeapTooSmall:
+                lo = size
+                step *= 2
+                size = lo + step
+            else:
+                return lo, size, size
+        return lo, hi, float("inf")
+
+
+def make_probe(
+    suite: BenchmarkSuite,
+    runtime: Runtime,
+    bm: Benchmark,
+    minheap_dir: Path,
+    attempts: int,
+    log: Callable[[str], None] = print_inline,
+    journal: Optional["SearchJournal"] = None,
+    phase: str = "search",
+) -> Callable[[int], ContinueSearch]:
+    def probe(size: int) -> ContinueSearch:
+        heapsize = runtime.get_heapsize_modifiers(size)
+        size_str = "{}M".format(size)
+        log(size_str)
+        bm_with_heapsize = bm.attach_modifiers(heapsize)
+        return run_probe(
+            journal,
+            size,
+            phase,
+            functools.partial(
+                run_bm_with_retry,
+                suite,
+                runtime,
+                bm_with_heapsize,
+                minheap_dir,
+                attempts,
+                log,
+            ),
+            log,
+        )
+
+    return probe
+
+
+def profile_peak_heap(
+    suite: BenchmarkSuite,
+    runtime: Runtime,
+    bm: Benchmark,
+    heap: int,
+    minheap_dir: Path,
+    log: Callable[[str], None] = print_inline,
+) -> Optional[int]:
+    """Estimate the minheap from the GC log of a run with a generous heap
+
+    Returns the peak heap usage after GC, or None if it is not available.
+    """
+    gc_log = runtime.get_gc_log_modifiers()
+    if not gc_log:
+        return None
+    log("profile {}M ".format(heap))
+    bm_with_gc_log = bm.attach_modifiers(runtime.get_heapsize_modifiers(heap) + gc_log)
+    output, _companion_output, subprocess_exit = bm_with_gc_log.run(
+        runtime, cwd=minheap_dir
+    )
+    if subprocess_exit is not SubprocessrExit.Normal or not suite.is_passed(output):
+        log("failed ")
+        return None
+    peak = runtime.get_peak_heap_after_gc(output)
+    if peak is None:
+        log("no GC ")
+        return None
+    log("peak {:.0f}M ".format(peak))
+    return max(2, math.ceil(peak))
+
+
 def minheap_one_bm(
     suite: BenchmarkSuite,
     runtime: Runtime,
@@ -73,19 +370,22 @@ def minheap_one_bm(
     heap: int,
     minheap_dir: Path,
     attempts: int,
+    log: Callable[[str], None] = print_inline,
+    guess: Optional[int] = None,
+    journal: Optional["SearchJournal"] = None,
 ) -> float:
+    probe = make_probe(suite, runtime, bm, minheap_dir, attempts, log, journal)
     lo = 2
     hi = heap
-    mid = (lo + hi) // 2
     minh = float("inf")
+    if guess is not None:
+        bracketed = bracket(probe, guess, heap)
+        if bracketed is None:
+            return float("inf")
+        lo, hi, minh = bracketed
+    mid = (lo + hi) // 2
     while hi - lo > 1:
-        heapsize = runtime.get_heapsize_modifiers(mid)
-        size_str = "{}M".format(mid)
-        print(size_str, end="", flush=True)
-        bm_with_heapsize = bm.attach_modifiers(heapsize)
-        result = run_bm_with_retry(
-            suite, runtime, bm_with_heapsize, minheap_dir, attempts
-        )
+        result = probe(mid)
         if result is ContinueSearch.Abort:
             return float("inf")
         elif result is ContinueSearch.HeapTooBig:
@@ -100,44 +400,710 @@ def minheap_one_bm(
     return minh
 
 
+def wilson_lower_bound(passes: int, runs: int, z: float = 1.645) -> float:
+    """One-sided lower confidence bound (95% by default) of the pass rate"""
+    if runs == 0:
+        return 0.0
+    p = passes / runs
+    denominator = 1 + z * z / runs
+    centre = p + z * z / (2 * runs)
+    margin = z * math.sqrt(p * (1 - p) / runs + z * z / (4 * runs * runs))
+    return max(0.0, (centre - margin) / denominator)
+
+
+def confirm(
+    probe: Callable[[int], ContinueSearch],
+    minh: int,
+    heap: int,
+    runs: int,
+    ratio: float,
+) -> Dict[str, Any]:
+    """Confirm the minheap found by a search using repeated runs
+
+    A single run near the boundary can pass or fail by chance, so a size is
+    confirmed if at least ratio of up to runs runs pass.
+    The runs at a size stop as soon as the outcome is known.
+    Starting from the size found by the search, move up (doubling the step)
+    until a size is confirmed, narrow down again by bisection, and finally
+    make sure the size one step below is not confirmed.
+    """
+    need = math.ceil(ratio * runs)
+    trials: Dict[int, Tuple[int, int]]
+    trials = {}
+
+    def confirmed(size: int) -> bool:
+        if size not in trials:
+            passes = n = 0
+            while passes < need and n - passes <= runs - need:
+                n += 1
+                if probe(size) is ContinueSearch.HeapTooBig:
+                    passes += 1
+            trials[size] = (passes, n)
+        return trials[size][0] >= need
+
+    lo, hi = minh - 1, minh
+    step = 1
+    while not confirmed(hi):
+        if hi >= heap:
+            return {"minheap": float("inf")}
+        lo = hi
+        hi = min(hi + step, heap)
+        step *= 2
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if confirmed(mid):
+            hi = mid
+        else:
+            lo = mid
+    while hi > 2 and confirmed(hi - 1):
+        hi -= 1
+    passes, n = trials[hi]
+    confirmation = {
+        "minheap": hi,
+        "passes": passes,
+        "runs": n,
+        "pass_rate_lower_bound": round(wilson_lower_bound(passes, n), 3),
+    }
+    if hi - 1 in trials:
+        confirmation["below_passes"], confirmation["below_runs"] = trials[hi - 1]
+    return confirmation
+
+
+def format_confirmation(confirmation: Dict[str, Any]) -> str:
+    if confirmation["minheap"] == float("inf"):
+        return "not confirmed "
+    below = ""
+    if "below_runs" in confirmation:
+        below = ", {}/{} one step below".format(
+            confirmation["below_passes"], confirmation["below_runs"]
+        )
+    return "confirmed {}/{} passed{} ".format(
+        confirmation["passes"], confirmation["runs"], below
+    )
+
+
+def partition_cpus(jobs: int) -> List[List[int]]:
+    """Split the CPUs this process can run on into one set per job
+
+    Returns an empty list if the CPUs cannot be split.
+    """
+    if not hasattr(os, "sched_getaffinity") or shutil.which("taskset") is None:
+        logging.warning(
+            "Cannot pin searches to CPUs without sched_getaffinity and taskset"
+        )
+        return []
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < jobs:
+        logging.warning(
+            "Not pinning searches to CPUs, {} jobs but only {} CPUs".format(
+                jobs, len(cpus)
+            )
+        )
+        return []
+    return [
+        cpus[i * len(cpus) // jobs : (i + 1) * len(cpus) // jobs] for i in range(jobs)
+    ]
+
+
+class Slot(object):
+    """Where a search runs when searches are run in parallel
+
+    Each slot has its own working directory, so that the scratch files of
+    concurrent benchmarks do not clash, and possibly its own set of CPUs.
+    """
+
+    def __init__(self, minheap_dir: Path, index: int, cpus: List[int]):
+        self.minheap_dir = minheap_dir / "slot{}".format(index)
+        self.minheap_dir.mkdir(exist_ok=True)
+        self.modifiers: List[Modifier]
+        self.modifiers = []
+        if cpus:
+            self.modifiers.append(
+                Wrapper(
+                    name="minheap_cpus",
+                    val="taskset -c {}".format(",".join(map(str, cpus))),
+                )
+            )
+
+
+def speculative_sizes(lo: int, hi: int, k: int) -> List[int]:
+    """Up to k heap sizes that split (lo, hi) into roughly equal parts"""
+    sizes = {lo + (hi - lo) * i // (k + 1) for i in range(1, k + 1)}
+    return sorted(x for x in sizes if lo < x < hi)
+
+
+def minheap_speculative(
+    suite: BenchmarkSuite,
+    runtime: Runtime,
+    bm: Benchmark,
+    heap: int,
+    slots: List[Slot],
+    attempts: int,
+    log: Callable[[str], None] = print_inline,
+    guess: Optional[int] = None,
+    journal: Optional["SearchJournal"] = None,
+) -> float:
+    """Search for the minimum heap size probing one size per slot at once
+
+    Each round splits the interval into len(slots) + 1 parts.
+    As probes finish, the interval is narrowed, and the probes that no longer
+    fall into the interval are cancelled, so a round takes as long as the
+    probes that are relevant.
+    """
+    lo = 2
+    hi = heap
+    minh = float("inf")
+    if guess is not None:
+        # Each step of bracketing depends on the previous one
+        probe = make_probe(
+            suite,
+            runtime,
+            bm.attach_modifiers(slots[0].modifiers),
+            slots[0].minheap_dir,
+            attempts,
+            log,
+            journal,
+        )
+        bracketed = bracket(probe, guess, heap)
+        if bracketed is None:
+            return float("inf")
+        lo, hi, minh = bracketed
+    with ThreadPoolExecutor(max_workers=len(slots)) as executor:
+        while hi - lo > 1:
+            probes = {}
+            for size, slot in zip(speculative_sizes(lo, hi, len(slots)), slots):
+                output: List[str]
+                output = []
+                cancel = threading.Event()
+                bm_with_heapsize = bm.attach_modifiers(
+                    runtime.get_heapsize_modifiers(size) + slot.modifiers
+                )
+                future = executor.submit(
+                    run_probe,
+                    journal,
+                    size,
+                    "search",
+                    functools.partial(
+                        run_bm_with_retry,
+                        suite,
+                        runtime,
+                        bm_with_heapsize,
+                        slot.minheap_dir,
+                        attempts,
+                        output.append,
+                        cancel,
+                    ),
+                    output.append,
+                )
+                probes[future] = (size, cancel, output)
+            aborted = False
+            pending = set(probes)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    size, _, _ = probes[future]
+                    result = future.result()
+                    if result is ContinueSearch.Abort:
+                        aborted = True
+                    elif result is ContinueSearch.HeapTooBig and lo < size < hi:
+                        minh = size
+                        hi = size
+                    elif result is ContinueSearch.HeapTooSmall and lo < size < hi:
+                        lo = size
+                for future in pending:
+                    size, cancel, _ = probes[future]
+                    if aborted or not lo < size < hi:
+                        cancel.set()
+            for size, _, output in sorted(probes.values(), key=lambda p: p[0]):
+                log("{}M{}".format(size, "".join(output)))
+            if aborted:
+                return float("inf")
+    return minh
+
+
+def get_confirmation_file(result_file: Path) -> Path:
+    return result_file.with_name(result_file.stem + ".confirmation.yml")
+
+
+def save_result(result: Dict[str, Any], result_file: Path):
+    # Never leave a half-written file behind, so that it can always be resumed
+    tmp = result_file.with_name(result_file.name + ".tmp")
+    with tmp.open("w") as fd:
+        yaml.dump(result, fd)
+    os.replace(tmp, result_file)
+
+
+def get_journal_file(result_file: Path) -> Path:
+    return result_file.with_name(result_file.stem + ".journal.jsonl")
+
+
+def read_journal(path: Path) -> Iterator[Dict[str, Any]]:
+    """Read the records of a journal, skipping the malformed ones"""
+    with path.open() as fd:
+        for lineno, line in enumerate(fd, start=1):
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict) or "type" not in record:
+                    raise ValueError("not a record")
+            except ValueError:
+                # Most likely the last record of a crashed run
+                logging.warning(
+                    "Ignoring malformed record at {}:{}".format(path, lineno)
+                )
+                continue
+            yield record
+
+
+# How a probe replayed from the journal is reported
+REPLAYED_MARKS = {ContinueSearch.HeapTooBig: "o*", ContinueSearch.HeapTooSmall: "x*"}
+
+
+class Journal(object):
+    """An append-only log of the probes and the minheap values of a run
+
+    Each record is a line of JSON that is flushed to disk as soon as it is
+    written, so a crash loses at most the record being written, and RESULT is
+    compacted from the journal instead of being rewritten after every search.
+    Replaying the journal also restores the outcomes of the probes of the
+    searches that did not finish, so that they are not run again.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Outcomes of search probes, keyed by (config, suite, benchmark, size)
+        self.probes: Dict[Tuple[str, str, str, int], ContinueSearch]
+        self.probes = {}
+        self.fd: Optional[TextIO]
+        self.fd = None
+        # Whether the journal ends with a truncated record
+        self.truncated = False
+
+    def replay(self, result: Dict[str, Any], confirmations: Dict[str, Any]):
+        if not self.path.exists():
+            return
+        with self.path.open("rb") as fd:
+            if fd.seek(0, os.SEEK_END):
+                fd.seek(-1, os.SEEK_END)
+                self.truncated = fd.read(1) != b"\n"
+        for record in read_journal(self.path):
+            key = (record["config"], record["suite"], record["benchmark"])
+            if record["type"] == "probe" and record["phase"] == "search":
+                outcome = ContinueSearch[record["outcome"]]
+                if outcome in REPLAYED_MARKS:
+                    self.probes[key + (record["heapsize"],)] = outcome
+            elif record["type"] == "minheap":
+                c_encoded, suite_name, bm_name = key
+                result.setdefault(c_encoded, {}).setdefault(suite_name, {})[bm_name] = (
+                    record["minheap"]
+                )
+                if "confirmation" in record:
+                    confirmations.setdefault(c_encoded, {}).setdefault(suite_name, {})[
+                        bm_name
+                    ] = record["confirmation"]
+
+    def append(self, record: Dict[str, Any]):
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            if self.fd is None:
+                self.fd = self.path.open("a")
+                if self.truncated:
+                    # Do not append to the truncated record
+                    line = "\n" + line
+            self.fd.write(line)
+            self.fd.flush()
+            os.fsync(self.fd.fileno())
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                self.fd.close()
+                self.fd = None
+
+    def for_search(
+        self, c_encoded: str, suite_name: str, bm_name: str
+    ) -> "SearchJournal":
+        return SearchJournal(self, c_encoded, suite_name, bm_name)
+
+
+class SearchJournal(object):
+    """The records of the search of one (config, benchmark) pair"""
+
+    def __init__(self, journal: Journal, c_encoded: str, suite_name: str, bm_name: str):
+        self.journal = journal
+        self.key = (c_encoded, suite_name, bm_name)
+
+    def record(self, record: Dict[str, Any]):
+        record["config"], record["suite"], record["benchmark"] = self.key
+        record["time"] = time.time()
+        self.journal.append(record)
+
+    def probe(
+        self,
+        size: int,
+        phase: str,
+        run: Callable[..., ContinueSearch],
+        log: Callable[[str], None],
+    ) -> ContinueSearch:
+        if phase == "search":
+            replayed = self.journal.probes.get(self.key + (size,))
+            if replayed is not None:
+                log(" {} ".format(REPLAYED_MARKS[replayed]))
+                return replayed
+        details: Dict[str, Any]
+        details = {}
+        start = time.monotonic()
+        result = run(details=details)
+        if result is not ContinueSearch.Cancelled:
+            record = {
+                "type": "probe",
+                "heapsize": size,
+                "phase": phase,
+                "outcome": result.name,
+                "duration": round(time.monotonic() - start, 3),
+            }
+            # The duration of the run that decided the outcome, without retries
+            record.update(details)
+            self.record(record)
+        return result
+
+    def minheap(
+        self,
+        minheap: float,
+        duration: float,
+        confirmation: Optional[Dict[str, Any]] = None,
+    ):
+        record = {"type": "minheap", "minheap": minheap, "duration": round(duration, 3)}
+        if confirmation is not None:
+            record["confirmation"] = confirmation
+        self.record(record)
+
+
+def run_probe(
+    journal: Optional[SearchJournal],
+    size: int,
+    phase: str,
+    run: Callable[..., ContinueSearch],
+    log: Callable[[str], None],
+) -> ContinueSearch:
+    if journal is None:
+        return run()
+    return journal.probe(size, phase, run, log)
+
+
+def get_guess(
+    result: Dict[str, Any],
+    seed_config: str,
+    c_encoded: str,
+    suite: BenchmarkSuite,
+    bm_name: str,
+) -> Optional[int]:
+    """Find a known minheap value of a benchmark to start the search from
+
+    In order of preference, this is the value of the seed config, either in
+    the result or in the minheap values of the suite, the value of the same
+    config in the minheap values of the suite, and finally the minheap value
+    selected by the suite.
+    """
+    candidates: List[Any]
+    candidates = []
+    if seed_config:
+        candidates.append(result.get(seed_config, {}).get(suite.name, {}).get(bm_name))
+        candidates.append(suite.get_known_minheap(bm_name, seed_config))
+    candidates.append(suite.get_known_minheap(bm_name, c_encoded))
+    candidates.append(suite.get_known_minheap(bm_name))
+    for guess in candidates:
+        # Failed searches are recorded as inf
+        if guess is not None and guess != float("inf"):
+            return int(guess)
+    return None
+
+
+class MinheapCache(object):
+    """Minheap values measured on demand, shared by the runs on a machine
+
+    The values are keyed by a fingerprint of the command that runs the
+    benchmark (without the heap size), which includes the runtime and the
+    modifiers, and the files it uses, so that a value is measured again if the
+    runtime or the benchmark is rebuilt.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.values: Dict[str, Dict[str, Any]]
+        self.values = self.load()
+
+    @staticmethod
+    def get_fingerprint(runtime: Runtime, bm: Benchmark) -> str:
+        h = hashlib.sha256(bm.to_string(runtime).encode("utf-8"))
+        for arg in bm.get_full_args(runtime):
+            path = Path(os.path.expandvars(str(arg)))
+            if path.is_absolute() and path.is_file():
+                stat = path.stat()
+                h.update(
+                    "\0{}\0{}\0{}".format(path, stat.st_size, stat.st_mtime_ns).encode()
+                )
+        return h.hexdigest()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path.exists():
+            return {}
+        with self.path.open() as fd:
+            return yaml.safe_load(fd) or {}
+
+    def get(self, fingerprint: str) -> Optional[int]:
+        entry = self.values.get(fingerprint)
+        return entry["minheap"] if entry else None
+
+    def put(self, fingerprint: str, entry: Dict[str, Any]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Other runs might have added values since this one loaded the cache
+        with self.path.with_name(self.path.name + ".lock").open("w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.values = self.load()
+            self.values[fingerprint] = entry
+            save_result(self.values, self.path)
+
+
 def run_with_persistence(
     result: Dict[str, Any],
     minheap_dir: Path,
-    result_file: Optional[Path],
+    journal: Optional[Journal],
     attempts: int,
+    confirmations: Dict[str, Any],
+    jobs: int = 1,
+    probes: int = 1,
+    warm_start: Optional[str] = None,
+    confirm_runs: int = 0,
+    success_ratio: float = 1.0,
+    profile: bool = False,
 ):
     suites = configuration.get("suites")
     maxheap = configuration.get("maxheap")
-    for c in configuration.get("configs"):
-        c_encoded = config_str_encode(c)
-        if c_encoded not in result:
-            result[c_encoded] = {}
-        runtime, mods = parse_config_str(configuration, c)
-        print("{} ".format(c_encoded))
-        if isinstance(runtime, NativeExecutable):
-            logging.warning("Minheap measurement not supported for NativeExecutable")
-            continue
-        for suite_name, bms in configuration.get("benchmarks").items():
-            if suite_name not in result[c_encoded]:
-                result[c_encoded][suite_name] = {}
-            suite = suites[suite_name]
-            for b in bms:
-                # skip a benchmark if we have measured it
-                if b.name in result[c_encoded][suite_name]:
-                    continue
-                print("\t {}-{} ".format(b.suite_name, b.name), end="")
-                mod_b = b.attach_modifiers(mods)
-                mod_b = mod_b.attach_modifiers(
-                    b.get_runtime_specific_modifiers(runtime)
+    # Protects result and confirmations, which are shared by the searches
+    lock = threading.Lock()
+    # Each search uses a group of slots, one per concurrent probe
+    groups: queue.Queue
+    groups = queue.Queue()
+    parallel = jobs > 1 or probes > 1
+    if parallel:
+        cpus = partition_cpus(jobs * probes) or [[]] * (jobs * probes)
+        for i in range(jobs):
+            groups.put(
+                [
+                    Slot(minheap_dir, i * probes + j, cpus[i * probes + j])
+                    for j in range(probes)
+                ]
+            )
+
+    def get_search_journal(
+        c_encoded: str, suite_name: str, bm_name: str
+    ) -> Optional[SearchJournal]:
+        if journal is None:
+            return None
+        return journal.for_search(c_encoded, suite_name, bm_name)
+
+    def record(
+        search_journal: Optional[SearchJournal],
+        c_encoded: str,
+        suite_name: str,
+        bm_name: str,
+        minheap: float,
+        start: float,
+        confirmation: Optional[Dict[str, Any]] = None,
+    ):
+        with lock:
+            result[c_encoded][suite_name][bm_name] = minheap
+            if confirmation is not None:
+                confirmations.setdefault(c_encoded, {}).setdefault(suite_name, {})[
+                    bm_name
+                ] = confirmation
+        if search_journal is not None:
+            search_journal.minheap(minheap, time.monotonic() - start, confirmation)
+
+    def confirm_minheap(
+        probe: Callable[[int], ContinueSearch],
+        minheap: float,
+        log: Callable[[str], None],
+    ) -> Optional[Dict[str, Any]]:
+        if not confirm_runs or minheap == float("inf"):
+            return None
+        log("| ")
+        confirmation = confirm(
+            probe, int(minheap), maxheap, confirm_runs, success_ratio
+        )
+        log(format_confirmation(confirmation))
+        return confirmation
+
+    def search(
+        c_encoded: str,
+        suite_name: str,
+        runtime: Runtime,
+        mod_b: Benchmark,
+        guess: Optional[int],
+    ):
+        group = groups.get()
+        start = time.monotonic()
+        search_journal = get_search_journal(c_encoded, suite_name, mod_b.name)
+        try:
+            # Buffer the progress so that concurrent searches do not interleave
+            output: List[str]
+            output = []
+            if guess is None and profile:
+                guess = profile_peak_heap(
+                    suites[suite_name],
+                    runtime,
+                    mod_b.attach_modifiers(group[0].modifiers),
+                    maxheap,
+                    group[0].minheap_dir,
+                    output.append,
                 )
+            if probes > 1:
+                minheap = minheap_speculative(
+                    suites[suite_name],
+                    runtime,
+                    mod_b,
+                    maxheap,
+                    group,
+                    attempts,
+                    output.append,
+                    guess,
+                    search_journal,
+                )
+            else:
                 minheap = minheap_one_bm(
-                    suite, runtime, mod_b, maxheap, minheap_dir, attempts
+                    suites[suite_name],
+                    runtime,
+                    mod_b.attach_modifiers(group[0].modifiers),
+                    maxheap,
+                    group[0].minheap_dir,
+                    attempts,
+                    output.append,
+                    guess,
+                    search_journal,
+                )
+            confirmation = confirm_minheap(
+                make_probe(
+                    suites[suite_name],
+                    runtime,
+                    mod_b.attach_modifiers(group[0].modifiers),
+                    group[0].minheap_dir,
+                    attempts,
+                    output.append,
+                    search_journal,
+                    "confirm",
+                ),
+                minheap,
+                output.append,
+            )
+            if confirmation is not None:
+                minheap = confirmation["minheap"]
+            with lock:
+                print(
+                    "{} {}-{} {}minheap {}".format(
+                        c_encoded, suite_name, mod_b.name, "".join(output), minheap
+                    ),
+                    flush=True,
                 )
-                print("minheap {}".format(minheap))
-                result[c_encoded][suite_name][b.name] = minheap
-                if result_file:
-                    with result_file.open("w") as fd:
-                        yaml.dump(result, fd)
+            record(
+                search_journal,
+                c_encoded,
+                suite_name,
+                mod_b.name,
+                minheap,
+                start,
+                confirmation,
+            )
+        finally:
+            groups.put(group)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = []
+        for c in configuration.get("configs"):
+            c_encoded = config_str_encode(c)
+            if c_encoded not in result:
+                result[c_encoded] = {}
+            runtime, mods = parse_config_str(configuration, c)
+            if thrashing_detector is not None and not runtime.get_gc_log_modifiers():
+                logging.warning(
+                    "The runtime of {} has no GC log, "
+                    "so thrashing is not detected with it".format(c)
+                )
+            if not parallel:
+                print("{} ".format(c_encoded))
+            for suite_name, bms in configuration.get("benchmarks").items():
+                if suite_name not in result[c_encoded]:
+                    result[c_encoded][suite_name] = {}
+                suite = suites[suite_name]
+                for b in bms:
+                    # skip a benchmark if we have measured it
+                    if b.name in result[c_encoded][suite_name]:
+                        continue
+                    mod_b = b.attach_modifiers(mods)
+                    mod_b = mod_b.attach_modifiers(
+                        b.get_runtime_specific_modifiers(runtime)
+                    )
+                    guess = None
+                    if warm_start is not None:
+                        guess = get_guess(
+                            result,
+                            config_str_encode(warm_start),
+                            c_encoded,
+                            suite,
+                            b.name,
+                        )
+                    if parallel:
+                        futures.append(
+                            executor.submit(
+                                search, c_encoded, suite_name, runtime, mod_b, guess
+                            )
+                        )
+                        continue
+                    print("\t {}-{} ".format(b.suite_name, b.name), end="")
+                    start = time.monotonic()
+                    search_journal = get_search_journal(c_encoded, suite_name, b.name)
+                    if guess is None and profile:
+                        guess = profile_peak_heap(
+                            suite, runtime, mod_b, maxheap, minheap_dir
+                        )
+                    minheap = minheap_one_bm(
+                        suite,
+                        runtime,
+                        mod_b,
+                        maxheap,
+                        minheap_dir,
+                        attempts,
+                        guess=guess,
+                        journal=search_journal,
+                    )
+                    confirmation = confirm_minheap(
+                        make_probe(
+                            suite,
+                            runtime,
+                            mod_b,
+                            minheap_dir,
+                            attempts,
+                            journal=search_journal,
+                            phase="confirm",
+                        ),
+                        minheap,
+                        print_inline,
+                    )
+                    if confirmation is not None:
+                        minheap = confirmation["minheap"]
+                    print("minheap {}".format(minheap))
+                    record(
+                        search_journal,
+                        c_encoded,
+                        suite_name,
+                        b.name,
+                        minheap,
+                        start,
+                        confirmation,
+                    )
+        for future in futures:
+            # Propagate the exceptions raised by the searches
+            future.result()
 
 
 def print_best(result: Dict[str, Dict[str, Dict[str, float]]]):
@@ -186,11 +1152,49 @@ def run(args):
     attempts = configuration.get("attempts")
     if args.get("attempts"):
         attempts = args.get("attempts")
-    with tempfile.TemporaryDirectory(prefix="minheap-") as minheap_dir:
-        logging.info("Temporary directory: {}".format(minheap_dir))
-        if is_dry_run():
-            run_with_persistence(result, Path(minheap_dir), None, attempts)
-        else:
-            run_with_persistence(result, Path(minheap_dir), result_file, attempts)
+    global thrashing_detector
+    thrashing_detector = None
+    if args.get("thrashing") is not None:
+        thrashing_detector = functools.partial(
+            ThrashingDetector,
+            window=args.get("thrashing_window"),
+            gc_fraction=args.get("thrashing"),
+            gc_rate=args.get("thrashing_gc_rate"),
+        )
+    # The details of the confirmed minheap values are kept separately, so that
+    # the result can still be copied to the minheap_values of a suite
+    confirmations: Dict[str, Any]
+    confirmations = {}
+    if get_confirmation_file(result_file).exists():
+        with get_confirmation_file(result_file).open() as fd:
+            confirmations = yaml.safe_load(fd) or {}
+    journal = None
+    if not is_dry_run():
+        journal = Journal(get_journal_file(result_file))
+        journal.replay(result, confirmations)
+    try:
+        if not args.get("compact"):
+            with tempfile.TemporaryDirectory(prefix="minheap-") as minheap_dir:
+                logging.info("Temporary directory: {}".format(minheap_dir))
+                run_with_persistence(
+                    result,
+                    Path(minheap_dir),
+                    journal,
+                    attempts,
+                    confirmations,
+                    args.get("jobs"),
+                    args.get("probes"),
+                    args.get("warm_start"),
+                    args.get("confirm"),
+                    args.get("success_ratio"),
+                    args.get("profile"),
+                )
+    finally:
+        # Compact the journal, even if the searches are interrupted
+        if journal is not None:
+            journal.close()
+            save_result(result, result_file)
+            if confirmations:
+                save_result(confirmations, get_confirmation_file(result_file))
     print_best(result)
     return True
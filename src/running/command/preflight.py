@@ -0,0 +1,297 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from running.benchmark import Benchmark, SubprocessrExit
+from running.config import Configuration
+from running.suite import BenchmarkSuite, is_dry_run
+from running.util import (
+    config_index_to_chr,
+    config_filename_encode,
+    dont_emit_heapsize_modifier,
+    parse_config_str,
+)
+
+configuration: Configuration
+# What went wrong, keyed by what is checked, such as a config or a benchmark
+problems: Dict[str, List[str]]
+
+# The outcome of a smoke run
+PASS = "o"
+FAIL = "x"
+TIMEOUT = "t"
+DRY_RUN = "."
+# Not run because of a problem found by the static checks
+SKIPPED = "-"
+
+
+def setup_parser(subparsers):
+    f = subparsers.add_parser("preflight")
+    f.set_defaults(which="preflight")
+    f.add_argument("CONFIG", type=str)
+    f.add_argument(
+        "--smoke",
+        action="store_true",
+        help="also run each benchmark with each config once",
+    )
+    f.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of smoke runs to run in parallel (default: 1)",
+    )
+    f.add_argument(
+        "--timeout",
+        type=int,
+        default=60,
+        help="timeout of each smoke run in seconds (default: 60)",
+    )
+    f.add_argument(
+        "--hfac",
+        type=float,
+        default=1.5,
+        help="heap size of the smoke runs relative to the minheap (default: 1.5)",
+    )
+    f.add_argument(
+        "--log-dir", type=Path, help="where to keep the output of the smoke runs"
+    )
+
+
+class CaptureWarnings(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.messages: List[str]
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(record.getMessage())
+
+
+@contextmanager
+def check(subject: str) -> Iterator[None]:
+    """Record the warnings logged and the exception raised as problems of
+    subject
+
+    The classes only log warnings for problems such as a missing DaCapo jar,
+    so that a run can still go ahead.
+    """
+    handler = CaptureWarnings()
+    root = logging.getLogger()
+    root.addHandler(handler)
+    try:
+        yield
+    except Exception as e:
+        handler.messages.append("{}: {}".format(type(e).__name__, e))
+    finally:
+        root.removeHandler(handler)
+    for message in handler.messages:
+        if message not in problems.setdefault(subject, []):
+            problems[subject].append(message)
+
+
+def check_executable(subject: str, executable: Any):
+    if not executable:
+        return
+    if not Path(executable).exists() and shutil.which(str(executable)) is None:
+        problems.setdefault(subject, []).append(
+            "Executable {} not found".format(executable)
+        )
+
+
+def get_runtime_name(c: str) -> str:
+    return c.split("|")[0].strip()
+
+
+def check_configs(configs: List[str]):
+    runtimes = configuration.get("runtimes") or {}
+    for runtime_name in sorted({get_runtime_name(c) for c in configs}):
+        with check(runtime_name):
+            if runtime_name not in runtimes:
+                raise KeyError("Runtime '{}' not defined".format(runtime_name))
+            runtime = runtimes[runtime_name]
+        if runtime_name not in problems:
+            check_executable(runtime_name, runtime.get_executable())
+    for c in configs:
+        with check(c):
+            configuration.get_modifiers(c)
+
+
+def is_runnable(c: str) -> bool:
+    return c not in problems and get_runtime_name(c) not in problems
+
+
+def check_benchmarks(
+    with_heapsize: bool,
+) -> List[Tuple[BenchmarkSuite, Benchmark]]:
+    suites = configuration.get("suites")
+    benchmarks = configuration.get("benchmarks") or {}
+    checked = []
+    # Only the names, so that nothing is instantiated outside of a check
+    for suite_name in benchmarks:
+        with check(suite_name):
+            if suite_name not in suites:
+                raise KeyError("Benchmark suite '{}' not defined".format(suite_name))
+            suite = suites[suite_name]
+        if suite_name in problems:
+            continue
+        # The benchmarks of a suite are only resolved all at once
+        with check(suite_name):
+            bms = benchmarks[suite_name]
+        if suite_name in problems:
+            continue
+        for b in bms:
+            subject = "{}-{}".format(suite_name, b.name)
+            if with_heapsize:
+                with check(subject):
+                    suite.get_minheap(b)
+            checked.append((suite, b))
+    return checked
+
+
+def smoke_run(
+    suite: BenchmarkSuite,
+    b: Benchmark,
+    c: str,
+    hfac: float,
+    timeout: int,
+    log_dir: Optional[Path],
+) -> str:
+    runtime, mods = parse_config_str(configuration, c)
+    mod_b = b.attach_modifiers(mods)
+    mod_b = mod_b.attach_modifiers(b.get_runtime_specific_modifiers(runtime))
+    if not dont_emit_heapsize_modifier(configuration, c):
+        size = round(suite.get_minheap(b) * hfac)
+        mod_b = mod_b.attach_modifiers(runtime.get_heapsize_modifiers(size))
+    if b.timeout is None or b.timeout > timeout:
+        mod_b = mod_b.copy_with(timeout=timeout)
+    with tempfile.TemporaryDirectory(prefix="preflight-") as cwd:
+        output, companion_out, exit_status = mod_b.run(runtime, cwd=Path(cwd))
+    if log_dir is not None and not is_dry_run():
+        log = log_dir / "{}.{}.{}.log".format(
+            b.name.replace("/", "-"), config_filename_encode(c), b.suite_name
+        )
+        log.write_bytes(
+            mod_b.to_string(runtime).encode("utf-8") + b"\n" + output + companion_out
+        )
+    if exit_status is SubprocessrExit.Dryrun:
+        return DRY_RUN
+    elif exit_status is SubprocessrExit.Timeout:
+        return TIMEOUT
+    elif exit_status is SubprocessrExit.Normal and suite.is_passed(output):
+        return PASS
+    return FAIL
+
+
+def smoke_test(
+    checked: List[Tuple[BenchmarkSuite, Benchmark]],
+    configs: List[str],
+    jobs: int,
+    hfac: float,
+    timeout: int,
+    log_dir: Optional[Path],
+) -> Dict[Tuple[str, str], str]:
+    """Run each benchmark with each config that has no problem once, and
+    return the outcomes keyed by (benchmark, config)"""
+    outcomes = {}
+    futures = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for suite, b in checked:
+            subject = "{}-{}".format(b.suite_name, b.name)
+            for c in configs:
+                if not is_runnable(c):
+                    outcomes[(subject, c)] = SKIPPED
+                    continue
+                futures[(subject, c)] = executor.submit(
+                    smoke_run, suite, b, c, hfac, timeout, log_dir
+                )
+        for key, future in futures.items():
+            try:
+                outcomes[key] = future.result()
+            except Exception as e:
+                logging.exception("Smoke run of {} with {} failed".format(*key))
+                problems.setdefault(key[0], []).append(
+                    "{} with {}: {}".format(type(e).__name__, key[1], e)
+                )
+                outcomes[key] = FAIL
+    return outcomes
+
+
+def print_matrix(
+    checked: List[Tuple[BenchmarkSuite, Benchmark]],
+    configs: List[str],
+    outcomes: Dict[Tuple[str, str], str],
+):
+    codes = [config_index_to_chr(i) for i in range(len(configs))]
+    for code, c in zip(codes, configs):
+        print("{}: {}".format(code, c))
+    subjects = ["{}-{}".format(b.suite_name, b.name) for _, b in checked]
+    width = max([len(s) for s in subjects], default=0)
+    # More than 52 configs have codes of more than one letter
+    code_width = max([len(code) for code in codes], default=1)
+    print(
+        "{} {}".format(" " * width, " ".join(code.ljust(code_width) for code in codes))
+    )
+    for subject in subjects:
+        print(
+            "{} {}".format(
+                subject.ljust(width),
+                " ".join(
+                    outcomes[(subject, c)].ljust(code_width) for c in configs
+                ).rstrip(),
+            )
+        )
+
+
+def run(args):
+    if args.get("which") != "preflight":
+        return False
+    global configuration
+    configuration = Configuration.from_file(Path(os.getcwd()), args.get("CONFIG"))
+    # The problems are found and reported one by one by the checks below
+    configuration.resolve_class(lazy=True)
+    global problems
+    problems = {}
+    configs = configuration.get("configs") or []
+    check_configs(configs)
+    with_heapsize = any(
+        not dont_emit_heapsize_modifier(configuration, c)
+        for c in configs
+        if is_runnable(c)
+    )
+    checked = check_benchmarks(with_heapsize)
+    failed = False
+    if args.get("smoke"):
+        log_dir = args.get("log_dir")
+        if log_dir is not None:
+            log_dir.mkdir(parents=True, exist_ok=True)
+        outcomes = smoke_test(
+            checked,
+            configs,
+            args.get("jobs"),
+            args.get("hfac"),
+            args.get("timeout"),
+            log_dir,
+        )
+        print_matrix(checked, configs, outcomes)
+        failed = any(o in [FAIL, SKIPPED] for o in outcomes.values())
+        timeouts = sum(o == TIMEOUT for o in outcomes.values())
+        if timeouts:
+            # The smoke runs are the full workloads, which might just need
+            # more time than --timeout
+            logging.warning(
+                "{} smoke runs timed out after {} seconds, "
+                "try a longer --timeout".format(timeouts, args.get("timeout"))
+            )
+    for subject, messages in problems.items():
+        for message in messages:
+            print("{}: {}".format(subject, message))
+    if problems or failed:
+        sys.exit(1)
+    print("No problems found")
+    return True
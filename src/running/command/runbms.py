@@ -12,7 +12,7 @@ from typing import (
 )
 from running.suite import BenchmarkSuite, is_dry_run
 from running.benchmark import Benchmark, SubprocessrExit
-from running.config import Configuration
+from running.config import COMPILED_KEY, Configuration
 from pathlib import Path
 from running.util import (
     parse_config_str,
@@ -20,16 +20,24 @@ from running.util import (
     get_logged_in_users,
     config_index_to_chr,
     config_str_encode,
+    config_filename_encode,
+    CONFIG_NAMES_FILENAME,
     dont_emit_heapsize_modifier,
     detect_rogue_processes,
+    get_cache_dir,
 )
 import socket
+import gzip
+import hashlib
+import fnmatch
+import platform
 from datetime import datetime
 from running.runtime import Runtime
 import tempfile
 import subprocess
 import os
 from running.command.fillin import fillin
+from running.command.minheap import MinheapCache, minheap_one_bm
 import math
 import yaml
 from collections import defaultdict
@@ -50,6 +58,31 @@ randomize_configs: bool = False
 plugins: Dict[str, Any]
 resume: Optional[str]
 exit_on_failure_code: Optional[int] = None
+# Minheap values measured by --measure-minheap, keyed by (suite, benchmark)
+measured_minheap: Dict[Tuple[str, str], int] = {}
+# The upper bound of the search of --measure-minheap, unless overridden by
+# --maxheap or the maxheap of the configuration
+DEFAULT_MAXHEAP = 16384
+result_cache: Optional["ResultCache"] = None
+# The environment variables of the shell that do not change how a benchmark
+# runs, so that they do not prevent an invocation from being reused
+RESULT_CACHE_IGNORED_ENV = [
+    "_",
+    "PWD",
+    "OLDPWD",
+    "SHLVL",
+    "TERM",
+    "TERM_*",
+    "COLORTERM",
+    "DISPLAY",
+    "SSH_*",
+    "TMUX",
+    "TMUX_*",
+    "STY",
+    "WINDOW",
+    "XDG_SESSION_*",
+    "LS_COLORS",
+]
 
 
 def setup_parser(subparsers):
@@ -83,6 +116,34 @@ def setup_parser(subparsers):
         action="store_true",
         help="Randomize the order of configs for each benchmark run",
     )
+    f.add_argument(
+        "--measure-minheap",
+        action="store_true",
+        help="measure the minheap values missing from the benchmark suites "
+        "before running with heap factors",
+    )
+    f.add_argument(
+        "--maxheap",
+        type=int,
+        help="the largest heap size in MB that --measure-minheap tries "
+        "(default: maxheap in the config file, or {})".format(DEFAULT_MAXHEAP),
+    )
+    f.add_argument(
+        "--minheap-cache",
+        type=Path,
+        help="where the measured minheap values are cached "
+        "(default: minheap.yml in the cache directory of running-ng)",
+    )
+    f.add_argument(
+        "--result-cache",
+        nargs="?",
+        const="",
+        type=str,
+        metavar="CACHE_DIR",
+        help="reuse the passing invocations of earlier runs with the same "
+        "command, files and host, and cache the ones of this run "
+        "(default: results in the cache directory of running-ng)",
+    )
 
 
 def getid() -> str:
@@ -137,6 +198,158 @@ def spread(spread_factor: int, N: int, n: int) -> float:
     return n + spread_factor / (N - 1) * sum_1_n_minus_1
 
 
+def get_minheap(suite: BenchmarkSuite, bm: Benchmark) -> int:
+    measured = measured_minheap.get((suite.name, bm.name))
+    if measured is not None:
+        return measured
+    return suite.get_minheap(bm)
+
+
+def measure_missing_minheap(
+    suites: Dict[str, BenchmarkSuite],
+    benchmarks: Dict[str, List[Benchmark]],
+    c: str,
+    cache: MinheapCache,
+    maxheap: int,
+):
+    """Measure the minheap values the suites do not know with config c
+
+    The values are looked up in the cache first, and the ones measured are
+    added to it.
+    Raises RuntimeError if any value cannot be measured, so that the
+    benchmarks are not run with a made-up heap size.
+    """
+    runtime, mods = parse_config_str(configuration, c)
+    attempts = configuration.get("attempts") or 1
+    failed = []
+    with tempfile.TemporaryDirectory(prefix="runbms-minheap-") as minheap_dir:
+        for suite_name, bms in benchmarks.items():
+            suite = suites[suite_name]
+            for b in bms:
+                # Suites such as SPECjbb2015 have a fixed minheap by design
+                if not suite.has_minheap_values():
+                    continue
+                if suite.get_known_minheap(b.name) is not None:
+                    continue
+                mod_b = b.attach_modifiers(mods)
+                mod_b = mod_b.attach_modifiers(
+                    b.get_runtime_specific_modifiers(runtime)
+                )
+                fingerprint = MinheapCache.get_fingerprint(runtime, mod_b)
+                minheap = cache.get(fingerprint)
+                if minheap is None:
+                    if is_dry_run():
+                        logging.info(
+                            "Would measure the minheap of {}-{}".format(
+                                suite_name, b.name
+                            )
+                        )
+                        continue
+                    print(
+                        "Measuring the minheap of {}-{} with {} ".format(
+                            suite_name, b.name, c
+                        ),
+                        end="",
+                    )
+                    measured = minheap_one_bm(
+                        suite, runtime, mod_b, maxheap, Path(minheap_dir), attempts
+                    )
+                    print("minheap {}".format(measured))
+                    if measured == float("inf"):
+                        failed.append("{}-{}".format(suite_name, b.name))
+                        continue
+                    minheap = int(measured)
+                    cache.put(
+                        fingerprint,
+                        {
+                            "config": c,
+                            "suite": suite_name,
+                            "benchmark": b.name,
+                            "minheap": minheap,
+                            "measured": datetime.now().isoformat(timespec="seconds"),
+                        },
+                    )
+                measured_minheap[(suite_name, b.name)] = minheap
+    if failed:
+        raise RuntimeError(
+            "Failed to measure the minheap of {} with maxheap {} MB".format(
+                ", ".join(failed), maxheap
+            )
+        )
+
+
+def get_host_fingerprint() -> str:
+    cpu = system("cat /proc/cpuinfo | grep 'model name' | head -1", check=False)
+    return "\0".join(
+        [socket.gethostname(), *platform.uname()[:3], cpu.strip(), str(os.cpu_count())]
+    )
+
+
+class ResultCache(object):
+    """The logs of the invocations that passed, shared by the runs on a machine
+
+    The logs are keyed by a fingerprint of the command that runs the
+    benchmark (with the heap size and the arguments), the environment it
+    runs with (except for RESULT_CACHE_IGNORED_ENV), the content of the files
+    it uses, and the host, and then by the number of the invocation.
+    An invocation of a later run with the same key imports the log instead
+    of running the benchmark again.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.host = get_host_fingerprint()
+        # Hashing a large file, such as a DaCapo jar, takes a while
+        self.digests: Dict[Tuple[str, int, int], str]
+        self.digests = {}
+
+    def get_digest(self, path: Path) -> str:
+        stat = path.stat()
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        if key not in self.digests:
+            h = hashlib.sha256()
+            with path.open("rb") as fd:
+                for chunk in iter(lambda: fd.read(1 << 20), b""):
+                    h.update(chunk)
+            self.digests[key] = h.hexdigest()
+        return self.digests[key]
+
+    def get_key(self, runtime: Runtime, bm: Benchmark) -> str:
+        h = hashlib.sha256(self.host.encode("utf-8"))
+        h.update(b"\0" + bm.to_string(runtime).encode("utf-8"))
+        for k, v in sorted(bm.get_env().items()):
+            if not any(fnmatch.fnmatchcase(k, p) for p in RESULT_CACHE_IGNORED_ENV):
+                h.update("\0{}={}".format(k, v).encode("utf-8", "surrogateescape"))
+        files = list(runtime.get_artifacts())
+        for arg in bm.get_full_args(runtime):
+            # Classpaths are : separated
+            for part in os.path.expandvars(str(arg)).split(":"):
+                files.append(Path(part))
+        for path in files:
+            if path.is_absolute() and path.is_file():
+                h.update("\0{}\0{}".format(path, self.get_digest(path)).encode())
+        return h.hexdigest()
+
+    def get_file(self, key: str, invocation: int) -> Path:
+        return self.path / key[:2] / key / "{}.log.gz".format(invocation)
+
+    def get(self, key: str, invocation: int) -> Optional[bytes]:
+        try:
+            with gzip.open(self.get_file(key, invocation), "rb") as fd:
+                return fd.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, invocation: int, log: bytes):
+        cache_file = self.get_file(key, invocation)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_name("{}.{}.tmp".format(cache_file.name, os.getpid()))
+        with gzip.open(tmp, "wb") as fd:
+            fd.write(log)
+        # Another run might have cached the same invocation
+        os.replace(tmp, cache_file)
+
+
 def hfac_str(hfac: float) -> str:
     return str(int(hfac * 1000))
 
@@ -154,14 +367,21 @@ def get_hfacs(
     return [spread(spread_factor, N, n) / divisor + start for n in ns]
 
 
-def run_benchmark_with_config(
-    c: str, b: Benchmark, runbms_dir: Path, size: Optional[int], fd: Optional[BinaryIO]
-) -> Tuple[bytes, SubprocessrExit]:
+def get_benchmark_with_config(
+    c: str, b: Benchmark, size: Optional[int]
+) -> Tuple[Runtime, Benchmark]:
     runtime, mods = parse_config_str(configuration, c)
     mod_b = b.attach_modifiers(mods)
     mod_b = mod_b.attach_modifiers(b.get_runtime_specific_modifiers(runtime))
     if size is not None:
         mod_b = mod_b.attach_modifiers(runtime.get_heapsize_modifiers(size))
+    return runtime, mod_b
+
+
+def run_benchmark_with_config(
+    c: str, b: Benchmark, runbms_dir: Path, size: Optional[int], fd: Optional[BinaryIO]
+) -> Tuple[bytes, SubprocessrExit]:
+    runtime, mod_b = get_benchmark_with_config(c, b, size)
     if fd:
         prologue = get_log_prologue(runtime, mod_b)
         fd.write(prologue.encode("ascii"))
@@ -188,11 +408,32 @@ def get_filename_no_ext(
         # to match filenames
         hfac_str(hfac) if hfac is not None else "0",
         size if size is not None else "0",
-        config_str_encode(config),
+        config_filename_encode(config),
         bm.suite_name,
     )
 
 
+def save_config_names(configs: List[str], log_dir: Path):
+    """Map the hashed config names in the log filenames back to the configs"""
+    path = log_dir / CONFIG_NAMES_FILENAME
+    names: Dict[str, str]
+    names = {}
+    if path.exists():
+        with path.open() as fd:
+            names = yaml.safe_load(fd) or {}
+    for c in configs:
+        name = config_filename_encode(c)
+        if name == config_str_encode(c):
+            continue
+        if names.setdefault(name, c) != c:
+            raise ValueError(
+                "Configs {} and {} have the same name {}".format(names[name], c, name)
+            )
+    if names:
+        with path.open("w") as fd:
+            yaml.dump(names, fd)
+
+
 def get_filename(
     bm: Benchmark, hfac: Optional[float], size: Optional[int], config: str
 ) -> str:
@@ -276,7 +517,7 @@ def run_one_benchmark(
     size: Optional[int]  # heap size measured in MB
     if hfac is not None:
         print(hfac_str(hfac), end=" ")
-        size = get_heapsize(hfac, suite.get_minheap(bm))
+        size = get_heapsize(hfac, get_minheap(suite, bm))
         print(size, end=" ")
     else:
         size = None
@@ -303,6 +544,19 @@ def run_one_benchmark(
             )
         )
     ever_ran = [False] * len(configs)
+    # The letters of more than 52 configs would not be readable, so a passing
+    # config is printed as o, and the failing ones are listed at the end of
+    # each invocation instead
+    compact = len(configs) > 52
+    failed: List[int] = []
+
+    def print_passed(j: int):
+        print("o" if compact else config_index_to_chr(j), end="", flush=True)
+
+    def print_failed(j: int):
+        failed.append(j)
+        print(".", end="", flush=True)
+
     for i in range(0, invocations):
         for p in plugins.values():
             p.start_invocation(hfac, size, bm, i)
@@ -319,23 +573,42 @@ def run_one_benchmark(
             for p in plugins.values():
                 p.start_config(hfac, size, bm, i, c, j)
             if skip_oom is not None and oomed_count[c] >= skip_oom:
-                print(".", end="", flush=True)
+                print_failed(j)
                 if exit_on_failure_code is not None:
                     sys.exit(exit_on_failure_code)
                 continue
             if skip_timeout is not None and timeout_count[c] >= skip_timeout:
-                print(".", end="", flush=True)
+                print_failed(j)
                 if exit_on_failure_code is not None:
                     sys.exit(exit_on_failure_code)
                 continue
             if resume:
                 log_filename_completed = get_filename_completed(bm, hfac, size, c)
                 if (log_dir / log_filename_completed).exists():
-                    print(config_index_to_chr(j), end="", flush=True)
+                    print_passed(j)
                     continue
             log_filename = get_filename(bm, hfac, size, c)
             logging.debug("Running with log filename {}".format(log_filename))
             runtime, _ = parse_config_str(configuration, c)
+            cache_key = None
+            if result_cache is not None and not is_dry_run():
+                cache_key = result_cache.get_key(
+                    *get_benchmark_with_config(c, bm, size)
+                )
+                cached = result_cache.get(cache_key, i)
+                if cached is not None:
+                    logging.debug(
+                        "Imported invocation {} from the result cache {}".format(
+                            i, cache_key
+                        )
+                    )
+                    with (log_dir / log_filename).open("ab") as cached_fd:
+                        cached_fd.write(cached)
+                    ever_ran[j] = True
+                    print_passed(j)
+                    for p in plugins.values():
+                        p.end_config(hfac, size, bm, i, c, j, True)
+                    continue
             if is_dry_run():
                 output, exit_status = run_benchmark_with_config(
                     c, bm, runbms_dir, size, None
@@ -344,6 +617,8 @@ def run_one_benchmark(
             else:
                 fd: BinaryIO
                 with (log_dir / log_filename).open("ab") as fd:
+                    # Where the log of this invocation starts
+                    log_start = fd.tell()
                     output, exit_status = run_benchmark_with_config(
                         c, bm, runbms_dir, size, fd
                     )
@@ -352,19 +627,23 @@ def run_one_benchmark(
                 oomed_count[c] += 1
             if exit_status is SubprocessrExit.Timeout:
                 timeout_count[c] += 1
-                print(".", end="", flush=True)
+                print_failed(j)
                 if exit_on_failure_code is not None:
                     sys.exit(exit_on_failure_code)
             elif exit_status is SubprocessrExit.Error:
-                print(".", end="", flush=True)
+                print_failed(j)
                 if exit_on_failure_code is not None:
                     sys.exit(exit_on_failure_code)
             elif exit_status is SubprocessrExit.Normal:
                 if suite.is_passed(output):
                     config_passed = True
-                    print(config_index_to_chr(j), end="", flush=True)
+                    print_passed(j)
+                    if result_cache is not None and cache_key is not None:
+                        with (log_dir / log_filename).open("rb") as log_fd:
+                            log_fd.seek(log_start)
+                            result_cache.put(cache_key, i, log_fd.read())
                 else:
-                    print(".", end="", flush=True)
+                    print_failed(j)
                     if exit_on_failure_code is not None:
                         sys.exit(exit_on_failure_code)
             elif exit_status is SubprocessrExit.Dryrun:
@@ -374,6 +653,13 @@ def run_one_benchmark(
             for p in plugins.values():
                 p.end_config(hfac, size, bm, i, c, j, config_passed)
 
+        if compact and failed:
+            print(
+                "[{}]".format(",".join(config_index_to_chr(j) for j in sorted(failed))),
+                end="",
+                flush=True,
+            )
+        failed.clear()
         for p in plugins.values():
             p.end_invocation(hfac, size, bm, i)
     for p in plugins.values():
@@ -461,13 +747,24 @@ def run(args):
         exit_on_failure_code = args.get("exit_on_failure")
         global randomize_configs
         randomize_configs = args.get("randomize_configs")
+        global result_cache
+        result_cache = None
+        if args.get("result_cache") is not None:
+            result_cache = ResultCache(
+                Path(args.get("result_cache") or get_cache_dir() / "results")
+            )
         # Load from configuration file
         global configuration
         configuration = Configuration.from_file(Path(os.getcwd()), args.get("CONFIG"))
-        # Save metadata
+        # Save metadata, with the configs flattened, so that runbms.yml
+        # records exactly what is run
         if not is_dry_run():
+            if configuration.get(COMPILED_KEY) is None:
+                compiled = configuration.compile()
+            else:
+                compiled = configuration
             with (log_dir / "runbms.yml").open("w") as fd:
-                configuration.save_to_file(fd)
+                compiled.save_to_file(fd)
         configuration.resolve_class()
         # Read from configuration, override with command line arguments if
         # needed
@@ -485,6 +782,8 @@ def run(args):
         if benchmarks is None:
             benchmarks = {}
         configs = configuration.get("configs")
+        if not is_dry_run():
+            save_config_names(configs, log_dir)
         global remote_host
         remote_host = configuration.get("remote_host")
         if not is_dry_run() and remote_host is not None:
@@ -526,6 +825,20 @@ def run(args):
             # early return
             return True
 
+        if args.get("measure_minheap") and configs_with_heapsize:
+            minheap_cache = args.get("minheap_cache")
+            if minheap_cache is None:
+                minheap_cache = get_cache_dir() / "minheap.yml"
+            # The same minheap values are used for all configs, as with the
+            # minheap_values of a suite, so measure them with the first one
+            measure_missing_minheap(
+                suites,
+                benchmarks,
+                configs_with_heapsize[0],
+                MinheapCache(minheap_cache),
+                args.get("maxheap") or configuration.get("maxheap") or DEFAULT_MAXHEAP,
+            )
+
         # In all other cases, we will first run configs that don't want
         # implicit heapsize modifiers
         if configs_no_heapsize:
@@ -1,17 +1,64 @@
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
 import yaml
+from running.__version__ import __VERSION__
 from running.suite import BenchmarkSuite
 from running.runtime import Runtime
-from running.modifier import Modifier
+from running.modifier import Modifier, ModifierSet
+from running.util import (
+    expand_modifier_strs,
+    get_cache_dir,
+    parse_modifier_strs,
+)
 from pathlib import Path
-import functools
 import copy
+import hashlib
+import json
 import logging
 import os
+import pickle
+
+# libyaml is much faster than the pure Python loader, if PyYAML is built with it
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+# Set to 0 to always parse the configuration files
+CONFIG_CACHE_ENV = "RUNNING_NG_CONFIG_CACHE"
+# (the folder of the includer, the path as written, the path it resolves to,
+# and the SHA-256 of the content) for each configuration file read
+ConfigFile = Tuple[str, str, str, str]
+# The key of the metadata of a compiled configuration
+COMPILED_KEY = "compiled"
+
+
+class LazyMapping(Mapping[str, Any]):
+    """A mapping from names to objects that are created from their definitions
+    when they are first looked up
+
+    This way, only the definitions that are used, such as the runtimes of the
+    configs being run, are ever instantiated.
+    """
+
+    def __init__(self, definitions: Dict[str, Any], factory: Callable[[str, Any], Any]):
+        self.definitions = definitions
+        self.factory = factory
+        self.resolved: Dict[str, Any]
+        self.resolved = {}
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.resolved:
+            self.resolved[key] = self.factory(key, self.definitions[key])
+        return self.resolved[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.definitions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.definitions)
+
+    def __len__(self) -> int:
+        return len(self.definitions)
 
 
 def load_class(cls, config):
-    return {k: cls.from_config(k, v) for (k, v) in config.items()}
+    return LazyMapping(config, cls.from_config)
 
 
 KEY_CLASS_MAPPING = {
@@ -26,50 +73,223 @@ class Configuration(object):
         assert "includes" not in kv_pairs
         assert "overrides" not in kv_pairs
         self.__items = kv_pairs
+        # Memoized expansions of modifier strings and config strings
+        self.__expanded_modifiers: Dict[
+            Tuple[str, Tuple[str, ...]], List[Tuple[str, Modifier]]
+        ]
+        self.__expanded_modifiers = {}
+        self.__expanded_configs: Dict[str, List[Modifier]]
+        self.__expanded_configs = {}
 
     def save_to_file(self, fd):
         yaml.dump(self.__items, fd)
 
-    def resolve_class(self):
+    def resolve_class(self, lazy: bool = False):
         """Resolve the values by instantiating instances of classes
 
         For example, self.values["suites"] is a Dict[str, Dict[str, str]],
         where in the inner dictionary contains the string representation of a
         benchmark suite.
         After this function returns, self.values["suites"] becomes a
-        Dict[str, BenchmarkSuite].
+        Mapping[str, BenchmarkSuite].
+        The runtimes and modifiers used by the configs, and the benchmark
+        suites and benchmarks listed in benchmarks, are instantiated right
+        away (see instantiate_used), unless lazy is set.
+        The other definitions are only instantiated when they are first looked
+        up, so the ones that are not used are never instantiated.
 
         Change the KEY_CLASS_MAPPING to change which classes get resolved.
         """
+        self.__expanded_modifiers.clear()
+        self.__expanded_configs.clear()
         for cls_name, cls in KEY_CLASS_MAPPING.items():
             if cls_name in self.__items:
                 self.__items[cls_name] = load_class(cls, self.__items[cls_name])
         if "benchmarks" in self.__items:
-            for suite_name, bms in self.__items["benchmarks"].items():
-                suite = self.__items["suites"][suite_name]
-                benchmarks = []
-                for b in bms:
-                    benchmarks.append(suite.get_benchmark(b))
-                self.__items["benchmarks"][suite_name] = benchmarks
+            suites = self.__items["suites"]
+            self.__items["benchmarks"] = LazyMapping(
+                self.__items["benchmarks"],
+                lambda suite_name, bms: [
+                    suites[suite_name].get_benchmark(b) for b in bms
+                ],
+            )
+        if not lazy:
+            self.instantiate_used()
+
+    def instantiate_used(self):
+        """Instantiate the runtimes, modifiers, benchmark suites and benchmarks
+        that are used, so that mistakes are reported before running anything
+
+        The classes should have been resolved.
+        """
+        runtimes = self.__items.get("runtimes") or {}
+        for c in self.__items.get("configs") or []:
+            runtime_name = c.split("|")[0].strip()
+            if runtime_name not in runtimes:
+                raise KeyError("Runtime '{}' not defined".format(runtime_name))
+            runtimes[runtime_name]
+            self.get_modifiers(c)
+        suites = self.__items.get("suites") or {}
+        benchmarks = self.__items.get("benchmarks") or {}
+        for suite_name in benchmarks:
+            if suite_name not in suites:
+                raise KeyError("Benchmark suite '{}' not defined".format(suite_name))
+            benchmarks[suite_name]
 
     def get(self, name: str) -> Any:
         return self.__items.get(name)
 
+    def get_modifier_strs(self, c: str) -> List[str]:
+        """The modifiers of a config string
+
+        If the configuration is compiled, the modifier sets have already been
+        flattened.
+        """
+        compiled = self.__items.get(COMPILED_KEY)
+        if compiled is not None and c in compiled["configs"]:
+            return compiled["configs"][c]
+        return c.split("|")[1:]
+
+    def compile(self) -> "Configuration":
+        """Expand the configuration into a self-contained one
+
+        The modifier sets of each config are flattened (with the value
+        options applied), and only the runtimes, modifiers and benchmark
+        suites that are used are kept.
+        The flattened configs are stored under COMPILED_KEY, together with a
+        fingerprint of the whole configuration.
+        The classes should not have been resolved.
+        """
+        # Resolving and pruning only replace the top-level values, so the
+        # definitions can be shared with this configuration
+        resolved = Configuration(dict(self.__items))
+        # Only the modifiers are looked up, and they are checked when the
+        # compiled configuration is resolved
+        resolved.resolve_class(lazy=True)
+        items = dict(self.__items)
+        configs = {}
+        for c in items.get("configs") or []:
+            configs[c] = [
+                m
+                for m, _ in expand_modifier_strs(
+                    resolved, resolved.get_modifier_strs(c)
+                )
+            ]
+        if "configs" in items:
+            used_runtimes = {c.split("|")[0].strip() for c in configs}
+            used_modifiers = {
+                m.split("-")[0] for mods in configs.values() for m in mods
+            }
+            for key, used in [
+                ("runtimes", used_runtimes),
+                ("modifiers", used_modifiers),
+            ]:
+                if key in items:
+                    items[key] = {k: v for k, v in items[key].items() if k in used}
+        if "suites" in items and "benchmarks" in items:
+            items["suites"] = {
+                k: v for k, v in items["suites"].items() if k in items["benchmarks"]
+            }
+        items[COMPILED_KEY] = {"version": __VERSION__, "configs": configs}
+        items[COMPILED_KEY]["fingerprint"] = get_fingerprint(items)
+        return Configuration(items)
+
+    def validate(self):
+        """Instantiate the runtimes, modifiers, benchmark suites and benchmarks
+        that are used, so that mistakes are reported before running anything
+
+        The classes should not have been resolved.
+        """
+        Configuration(dict(self.__items)).resolve_class()
+
+    def expand_modifier(
+        self, m: str, path: Tuple[str, ...] = ()
+    ) -> List[Tuple[str, Modifier]]:
+        """Flatten a modifier string, which is the name of a modifier followed
+        by its value options
+
+        The result is memoized on the name and the value options.
+        path is the names of the modifier sets being expanded, which is used
+        to detect modifier sets that include themselves.
+        The classes should have been resolved.
+        """
+        parts = m.split("-")
+        mod_name, mod_value_opts = parts[0], tuple(parts[1:])
+        key = (mod_name, mod_value_opts)
+        if key in self.__expanded_modifiers:
+            return self.__expanded_modifiers[key]
+        if mod_name in path:
+            raise ValueError(
+                "Modifier set '{}' includes itself: {}".format(
+                    mod_name, " -> ".join(path + (mod_name,))
+                )
+            )
+        mod = self.__items["modifiers"].get(mod_name)
+        if mod is None:
+            raise KeyError("Modifier '{}' not defined".format(mod_name))
+        mod = mod.apply_value_opts(list(mod_value_opts))
+        expanded: List[Tuple[str, Modifier]]
+        if isinstance(mod, ModifierSet):
+            expanded = []
+            for inner in mod.val:
+                inner = inner.strip()
+                if not inner:
+                    break
+                expanded.extend(self.expand_modifier(inner, path + (mod_name,)))
+        else:
+            expanded = [(m, mod)]
+        self.__expanded_modifiers[key] = expanded
+        return expanded
+
+    def get_modifiers(self, c: str) -> List[Modifier]:
+        """The flattened modifiers of a config string, memoized
+
+        The classes should have been resolved.
+        """
+        if c not in self.__expanded_configs:
+            self.__expanded_configs[c] = parse_modifier_strs(
+                self, self.get_modifier_strs(c)
+            )
+        return self.__expanded_configs[c]
+
     def override(self, selector: str, new_value: Any):
         current: Any  # Union[Dict[str, Any], List[Any]]
         current = self.__items
         parts = list(selector.split("."))
         for index, p in enumerate(parts):
+            key: Any
+            key = int(p) if p.isnumeric() else p
             if index == len(parts) - 1:
-                if p.isnumeric():
-                    current[int(p)] = new_value
-                else:
-                    current[p] = new_value
+                current[key] = new_value
             else:
-                if p.isnumeric():
-                    current = current[int(p)]
+                # The values along the way are copied, so that the other
+                # aliases of a YAML node are not changed
+                current[key] = copy.copy(current[key])
+                current = current[key]
+
+    def merge(self, other: "Configuration"):
+        """Combine the top-level items of other into self
+
+        Unlike combine, only the top-level values that are combined are
+        copied (the rest is shared), so other should not be used afterwards.
+        The combined values are still copied, because they might be YAML nodes
+        that are aliased elsewhere.
+        """
+        for k, v in other.__items.items():
+            if k in self.__items:
+                if type(self.__items[k]) is list:
+                    self.__items[k] = self.__items[k] + v
                 else:
-                    current = current[p]
+                    if type(self.__items[k]) is not dict:
+                        raise TypeError(
+                            "Key `{}` has been defined in one of the "
+                            "included files, and the value of `{}`, {}, "
+                            "is not an array or a dictionary. "
+                            "Please use overrides instead.".format(k, k, repr(v))
+                        )
+                    self.__items[k] = {**self.__items[k], **v}
+            else:
+                self.__items[k] = v
 
     def combine(self, other: "Configuration") -> "Configuration":
         """Combine top-level items of self.values.
@@ -98,52 +318,92 @@ class Configuration(object):
     def parse_file(path: Path) -> Any:
         with path.open("r") as fd:
             try:
-                config = yaml.safe_load(fd)
+                config = yaml.load(fd, Loader=SafeLoader)
                 return config
             except yaml.YAMLError as e:
                 raise SyntaxError(
                     "Not able to parse the configuration file, {}".format(e)
                 )
 
+    @staticmethod
+    def resolve_path(in_folder: Path, p: str) -> Path:
+        expand_p = os.path.expandvars(p)
+        path = Path(expand_p)
+        if not path.is_absolute():
+            path = in_folder.joinpath(p)
+        return path
+
     @staticmethod
     def from_file(in_folder: Path, p: str) -> "Configuration":
+        """Load a configuration file, and the files it includes
+
+        The result is cached, and the cache is used as long as all the files
+        have the same content, and the includes resolve to the same files.
+        """
+        path = Configuration.resolve_path(in_folder, p)
+        use_cache = os.environ.get(CONFIG_CACHE_ENV) != "0"
+        if use_cache:
+            cached = load_cached_config(path)
+            if cached is not None:
+                logging.info("Loaded config {} from cache".format(path))
+                return Configuration(cached)
+        files: List[ConfigFile]
+        files = []
+        config = Configuration.load_file(in_folder, p, files)
+        if use_cache:
+            save_cached_config(path, files, config.__items)
+        return config
+
+    @staticmethod
+    def load_file(in_folder: Path, p: str, files: List[ConfigFile]) -> "Configuration":
         expand_p = os.path.expandvars(p)
         logging.info(
             "Loading config {}, expanding to {}, relative to {}".format(
                 p, expand_p, in_folder
             )
         )
-        path = Path(expand_p)
-        if path.is_absolute():
+        path = Configuration.resolve_path(in_folder, p)
+        if Path(expand_p).is_absolute():
             logging.info("    is absolute")
         else:
-            path = in_folder.joinpath(p)
             logging.info("    resolved to {}".format(path))
         if not path.exists():
             raise ValueError("Configuration not found at path '{}'".format(path))
         if not path.is_file():
             raise ValueError("Configuration at path '{}' is not a file".format(path))
-        with path.open("r") as fd:
-            try:
-                config = yaml.safe_load(fd)
-            except yaml.YAMLError as e:
-                raise SyntaxError(
-                    "Not able to parse the configuration file, {}".format(e)
-                )
+        content = path.read_bytes()
+        files.append(
+            (str(in_folder), p, str(path), hashlib.sha256(content).hexdigest())
+        )
+        try:
+            config = yaml.load(content, Loader=SafeLoader)
+        except yaml.YAMLError as e:
+            raise SyntaxError("Not able to parse the configuration file, {}".format(e))
         if config is None:
             raise ValueError("Parsed configuration file is None")
+        if COMPILED_KEY in config:
+            check_fingerprint(path, config)
         if "includes" in config:
             includes = [
-                Configuration.from_file(path.parent, p) for p in config["includes"]
+                Configuration.load_file(path.parent, p, files)
+                for p in config["includes"]
             ]
-            base = functools.reduce(lambda left, right: left.combine(right), includes)
+            for include in includes:
+                # The flattened configs of an included compiled configuration
+                # might not hold after merging and overriding
+                include.__items.pop(COMPILED_KEY, None)
+            # Each included configuration is freshly loaded, so they can be
+            # merged without copying everything for each include
+            base = includes[0]
+            for include in includes[1:]:
+                base.merge(include)
             if "overrides" in config:
                 for selector, new_value in config["overrides"].items():
                     base.override(selector, new_value)
                 del config["overrides"]
             del config["includes"]
-            final_config = Configuration(config)
-            final_config = base.combine(final_config)
+            base.merge(Configuration(config))
+            final_config = base
         else:
             if "overrides" in config:
                 raise KeyError(
@@ -151,3 +411,98 @@ class Configuration(object):
                 )
             final_config = Configuration(config)
         return final_config
+
+
+def canonical_keys(value: Any) -> Any:
+    """The value with every key of its mappings as a string
+
+    YAML allows keys of different types in a mapping, such as the benchmark
+    names 1 and "foo" in minheap_values, which cannot be sorted.
+    Keys that are not strings are tagged with their type, so that 1 and "1"
+    stay apart.
+    """
+    if isinstance(value, dict):
+        return {
+            (
+                k if isinstance(k, str) else "<{}>{!r}".format(type(k).__name__, k)
+            ): canonical_keys(v)
+            for k, v in value.items()
+        }
+    elif isinstance(value, list):
+        return [canonical_keys(v) for v in value]
+    return value
+
+
+def get_fingerprint(items: Dict[str, Any]) -> str:
+    """SHA-256 of the configuration, except for the fingerprint itself"""
+    items = dict(items)
+    if COMPILED_KEY in items:
+        items[COMPILED_KEY] = {
+            k: v for k, v in items[COMPILED_KEY].items() if k != "fingerprint"
+        }
+    content = json.dumps(canonical_keys(items), sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def check_fingerprint(path: Path, items: Dict[str, Any]):
+    compiled = items[COMPILED_KEY]
+    if compiled.get("fingerprint") != get_fingerprint(items):
+        raise ValueError(
+            "The compiled configuration {} has been modified since it was "
+            "compiled. Please compile the original configuration "
+            "again.".format(path)
+        )
+    if compiled.get("version") != __VERSION__:
+        logging.warning(
+            "The configuration {} was compiled by running-ng {}, "
+            "and this is {}".format(path, compiled.get("version"), __VERSION__)
+        )
+
+
+def get_config_cache_file(path: Path) -> Path:
+    key = "{}\0{}".format(__VERSION__, path.absolute())
+    return (
+        get_cache_dir()
+        / "config"
+        / "{}.pickle".format(hashlib.sha256(key.encode("utf-8")).hexdigest())
+    )
+
+
+def is_unchanged(f: ConfigFile) -> bool:
+    in_folder, p, resolved, digest = f
+    path = Configuration.resolve_path(Path(in_folder), p)
+    if str(path) != resolved:
+        # For example, an environment variable in an include has changed
+        return False
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest() == digest
+    except OSError:
+        return False
+
+
+def load_cached_config(path: Path) -> Optional[Dict[str, Any]]:
+    cache_file = get_config_cache_file(path)
+    try:
+        with cache_file.open("rb") as fd:
+            files, items = pickle.load(fd)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.debug("Ignoring config cache {}: {}".format(cache_file, e))
+        return None
+    if not all(is_unchanged(f) for f in files):
+        return None
+    return items
+
+
+def save_cached_config(path: Path, files: List[ConfigFile], items: Dict[str, Any]):
+    cache_file = get_config_cache_file(path)
+    tmp = cache_file.with_name("{}.{}.tmp".format(cache_file.name, os.getpid()))
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with tmp.open("wb") as fd:
+            pickle.dump((files, items), fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        # The cache is only an optimization
+        logging.debug("Not caching config {}: {}".format(path, e))
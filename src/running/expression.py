@@ -0,0 +1,257 @@
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+import functools
+import operator
+import re
+
+# A name is a dotted statistic name such as `time.gc`.
+# A segment that is just `*` matches one segment of any name, for example,
+# `work.*.PERF_COUNT_HW_CPU_CYCLES.total` matches the cycles of all work
+# packet types, as in the patterns used by the preprocessing functions.
+NAME = r"[A-Za-z_]\w*(?:\.(?:\w+|\*))*"
+TOKEN = re.compile(
+    r"\s*(?:(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)"
+    r"|(?P<name>{})"
+    r"|(?P<op>\*\*|[-+*/()]))".format(NAME)
+)
+
+Value = Any
+Evaluator = Callable[[Mapping[str, Value]], Value]
+
+
+def divide(x: Value, y: Value) -> Value:
+    # Scalars follow the semantics of numpy arrays instead of raising
+    try:
+        return x / y
+    except ZeroDivisionError:
+        return float("nan")
+
+
+BINARY_OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": divide,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def wildcard(pattern: str) -> Callable[[str], bool]:
+    compiled = re.compile(
+        "\\.".join("\\w+" if p == "*" else re.escape(p) for p in pattern.split("."))
+        + "$"
+    )
+    return functools.lru_cache(maxsize=None)(
+        lambda name: compiled.match(name) is not None
+    )
+
+
+def lookup(name: str) -> Evaluator:
+    if "*" not in name:
+        return lambda stats: stats[name]
+    match = wildcard(name)
+
+    def inner(stats: Mapping[str, Value]) -> List[Value]:
+        values = [v for (k, v) in stats.items() if match(k)]
+        if not values:
+            raise KeyError(name)
+        return values
+
+    return inner
+
+
+def is_column(value: Value) -> bool:
+    # A numpy array with one element per invocation, where NaN means that the
+    # invocation did not report the statistic
+    return getattr(value, "ndim", 0) > 0
+
+
+def total(values: List[Value]) -> Value:
+    if is_column(values[0]):
+        import numpy as np
+
+        stacked = np.stack(values)
+        # Only the values an invocation reported are added, as with scalars
+        return np.where(
+            np.isnan(stacked).all(axis=0), np.nan, np.nansum(stacked, axis=0)
+        )
+    # Unlike the builtin sum, this does not add the values to a start value
+    return functools.reduce(operator.add, values)
+
+
+def count(values: List[Value]) -> Value:
+    if is_column(values[0]):
+        import numpy as np
+
+        counts = np.count_nonzero(~np.isnan(np.stack(values)), axis=0)
+        return np.where(counts == 0, np.nan, counts)
+    return len(values)
+
+
+def binary(func: Callable[[Value, Value], Value], left: Evaluator, right: Evaluator):
+    return lambda stats: func(left(stats), right(stats))
+
+
+# Functions that take the values matching a wildcard name
+AGGREGATES = {"sum": total, "count": count}
+FUNCTIONS: Dict[str, Callable[..., Value]]
+FUNCTIONS = {"abs": abs}
+
+
+class Expression(object):
+    """An arithmetic expression over the statistics of a block
+
+    The expression is parsed once into a tree of closures, and can be
+    evaluated with a mapping from names to either numbers or equally sized
+    numpy arrays, in which case all the rows are computed at once.
+    Evaluating an expression that refers to a missing name raises KeyError.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.evaluate = self.parse_sum()
+        if self.peek() is not None:
+            self.error("unexpected {}".format(self.peek()))
+        del self.tokens
+
+    def __call__(self, stats: Mapping[str, Value]) -> Value:
+        return self.evaluate(stats)
+
+    def __repr__(self):
+        return "Expression({!r})".format(self.text)
+
+    def error(self, message: str):
+        raise ValueError("Invalid expression '{}': {}".format(self.text, message))
+
+    def peek(self) -> Optional[str]:
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][1]
+        return None
+
+    def next(self) -> Tuple[str, str]:
+        if self.pos >= len(self.tokens):
+            self.error("unexpected end")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def expect(self, op: str):
+        if self.next()[1] != op:
+            self.error("expected {}".format(op))
+
+    def parse_binary(self, ops: Tuple[str, ...], operand) -> Evaluator:
+        left = operand()
+        while self.peek() in ops:
+            func = BINARY_OPERATORS[self.next()[1]]
+            right = operand()
+            left = binary(func, left, right)
+        return left
+
+    def parse_sum(self) -> Evaluator:
+        return self.parse_binary(("+", "-"), self.parse_product)
+
+    def parse_product(self) -> Evaluator:
+        return self.parse_binary(("*", "/"), self.parse_unary)
+
+    def parse_unary(self) -> Evaluator:
+        if self.peek() == "-":
+            self.next()
+            operand = self.parse_unary()
+            return lambda stats: -operand(stats)
+        if self.peek() == "+":
+            self.next()
+            return self.parse_unary()
+        return self.parse_power()
+
+    def parse_power(self) -> Evaluator:
+        base = self.parse_atom()
+        if self.peek() == "**":
+            self.next()
+            # Right associative, and binds tighter than unary minus on the left
+            return binary(operator.pow, base, self.parse_unary())
+        return base
+
+    def parse_atom(self) -> Evaluator:
+        kind, text = self.next()
+        if kind == "number":
+            number = float(text)
+            return lambda stats: number
+        if kind == "name":
+            if self.peek() == "(":
+                return self.parse_call(text)
+            if "*" in text:
+                self.error("{} must be used in an aggregate function".format(text))
+            return lookup(text)
+        if text == "(":
+            inner = self.parse_sum()
+            self.expect(")")
+            return inner
+        self.error("unexpected {}".format(text))
+        raise AssertionError("unreachable")
+
+    def parse_call(self, func: str) -> Evaluator:
+        self.expect("(")
+        if func in AGGREGATES:
+            kind, name = self.next()
+            if kind != "name":
+                self.error("{}() takes a name".format(func))
+            self.expect(")")
+            aggregate = AGGREGATES[func]
+            values = lookup(name)
+            if "*" in name:
+                return lambda stats: aggregate(values(stats))
+            return lambda stats: aggregate([values(stats)])
+        if func in FUNCTIONS:
+            arg = self.parse_sum()
+            self.expect(")")
+            f = FUNCTIONS[func]
+            return lambda stats: f(arg(stats))
+        self.error("unknown function {}".format(func))
+        raise AssertionError("unreachable")
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = TOKEN.match(text, pos)
+        if m is None:
+            raise ValueError(
+                "Invalid expression '{}': unexpected character at {}".format(text, pos)
+            )
+        kind = m.lastgroup
+        assert kind is not None
+        tokens.append((kind, m.group(kind)))
+        pos = m.end()
+    return tokens
+
+
+def parse_definitions(val: Any) -> List[Tuple[str, Expression]]:
+    """Parse derived metrics, given as a mapping from names to expressions,
+    or as a list of `NAME = EXPRESSION` strings
+
+    The definitions are kept in order, so a definition can use the ones
+    before it.
+    """
+    if isinstance(val, str):
+        val = [val]
+    if isinstance(val, dict):
+        items = list(val.items())
+    else:
+        items = []
+        for d in val:
+            name, sep, text = d.partition("=")
+            if not sep:
+                raise ValueError(
+                    "Derived metric '{}' should be NAME = EXPRESSION".format(d)
+                )
+            items.append((name, text))
+    definitions = []
+    for name, text in items:
+        name = name.strip()
+        if not re.fullmatch(r"[A-Za-z_][\w.]*", name):
+            raise ValueError("Invalid derived metric name '{}'".format(name))
+        definitions.append((name, Expression(str(text).strip())))
+    return definitions
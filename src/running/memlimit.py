@@ -0,0 +1,118 @@
+"""Run a program with a hard limit on its memory
+
+This is the heap size modifier of NativeExecutable, so that minheap can
+search for the smallest limit that a native program runs with, and runbms can
+run it with multiples of that limit.
+
+    python -m running.memlimit rlimit SIZE PROGRAM [ARGS...]
+    python -m running.memlimit cgroup SIZE --cgroup PARENT PROGRAM [ARGS...]
+
+SIZE is in MB.
+`rlimit` limits the address space of the program with RLIMIT_AS, so
+allocations beyond the limit fail.
+`cgroup` runs the program in a new cgroup v2 under PARENT with memory.max set
+to SIZE (and no swap), so the program is killed by the OOM killer once it
+uses more memory than the limit.
+If the program fails, a line starting with MESSAGE_PREFIX is printed, so that
+OOM-kills and other failures can be told apart from the output.
+"""
+
+from pathlib import Path
+from typing import Callable, List, Optional
+import argparse
+import ctypes
+import os
+import resource
+import signal
+import subprocess
+import sys
+
+MESSAGE_PREFIX = "running.memlimit: "
+OOM_MESSAGE = MESSAGE_PREFIX + "out of memory"
+PR_SET_PDEATHSIG = 1
+
+
+def setup_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m running.memlimit")
+    parser.add_argument("MODE", choices=["rlimit", "cgroup"])
+    parser.add_argument("SIZE", type=int, help="the limit in MB")
+    parser.add_argument(
+        "--cgroup", type=Path, help="the cgroup to create the cgroup of the program in"
+    )
+    parser.add_argument("PROGRAM", nargs=argparse.REMAINDER)
+    return parser
+
+
+def set_parent_death_signal():
+    # A timeout kills this wrapper, and the program should not outlive it
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+    except (AttributeError, OSError):
+        pass
+
+
+def create_cgroup(parent: Path, size: int) -> Path:
+    if not (parent / "cgroup.procs").exists():
+        raise ValueError("{} is not a cgroup v2 directory".format(parent))
+    cgroup = parent / "running-memlimit-{}".format(os.getpid())
+    cgroup.mkdir()
+    (cgroup / "memory.max").write_text(str(size))
+    if (cgroup / "memory.swap.max").exists():
+        (cgroup / "memory.swap.max").write_text("0")
+    return cgroup
+
+
+def is_oom_killed(cgroup: Path) -> bool:
+    for line in (cgroup / "memory.events").read_text().splitlines():
+        key, _, value = line.partition(" ")
+        if key == "oom_kill":
+            return int(value) > 0
+    return False
+
+
+def get_preexec(size: int, cgroup: Optional[Path]) -> Callable[[], None]:
+    def preexec():
+        set_parent_death_signal()
+        if cgroup is not None:
+            (cgroup / "cgroup.procs").write_text(str(os.getpid()))
+        else:
+            resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+    return preexec
+
+
+def describe_failure(returncode: int) -> str:
+    if returncode < 0:
+        return MESSAGE_PREFIX + "killed by signal {}".format(-returncode)
+    return MESSAGE_PREFIX + "exited with status {}".format(returncode)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = setup_parser().parse_args(argv)
+    if not args.PROGRAM:
+        raise ValueError("No program to run")
+    size = args.SIZE * 1024 * 1024
+    cgroup = None
+    if args.MODE == "cgroup":
+        if args.cgroup is None:
+            raise ValueError("--cgroup is required by the cgroup mode")
+        cgroup = create_cgroup(args.cgroup, size)
+    oom = False
+    try:
+        p = subprocess.Popen(args.PROGRAM, preexec_fn=get_preexec(size, cgroup))
+        for sig in [signal.SIGTERM, signal.SIGINT]:
+            signal.signal(sig, lambda signum, _frame: p.send_signal(signum))
+        returncode = p.wait()
+    finally:
+        if cgroup is not None:
+            oom = is_oom_killed(cgroup)
+            cgroup.rmdir()
+    if returncode != 0:
+        print(OOM_MESSAGE if oom else describe_failure(returncode), file=sys.stderr)
+    # Like a shell, so that the exit status tells a signal apart
+    return returncode if returncode >= 0 else 128 - returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,5 @@
 from typing import Any, Dict, List, TYPE_CHECKING
-from running.util import register, smart_quote, split_quoted, parse_modifier_strs
+from running.util import register, smart_quote, split_quoted
 import copy
 
 if TYPE_CHECKING:
@@ -65,7 +65,18 @@ class ModifierSet(Modifier):
         self.val = self._kwargs["val"].split("|")
 
     def flatten(self, configuration: "Configuration") -> List[Modifier]:
-        return parse_modifier_strs(configuration, self.val)
+        # Expanded by the configuration, which memoizes the expansion and
+        # reports a modifier set that includes itself
+        mods: List[Modifier]
+        mods = []
+        for m in self.val:
+            m = m.strip()
+            if not m:
+                break
+            mods.extend(
+                mod for _, mod in configuration.expand_modifier(m, (self.name,))
+            )
+        return mods
 
     def __str__(self) -> str:
         return "{} ModifierSet {}".format(super().__str__(), "|".join(self.val))
@@ -1,10 +1,40 @@
 from pathlib import Path
-from typing import Any, Dict, Optional, TYPE_CHECKING
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+import importlib
 
 if TYPE_CHECKING:
     from running.benchmark import Benchmark
 
 
+# The module that defines each plugin, and the extra of running-ng that
+# installs its dependencies if any
+# The module is only imported when a config uses the plugin, so that the
+# dependencies of the plugins that are not used are never imported
+PLUGIN_MODULES: Dict[str, Tuple[str, Optional[str]]]
+PLUGIN_MODULES = {
+    "CopyFile": ("running.plugin.runbms.copyfile", None),
+    "Zulip": ("running.plugin.runbms.zulip", "zulip"),
+}
+
+
+def load_plugin(plugin_type: str):
+    module, extra = PLUGIN_MODULES[plugin_type]
+    try:
+        importlib.import_module(module)
+    except ImportError as e:
+        hint = ""
+        if extra is not None:
+            hint = " Try pip install running-ng[{}] to install the extra dependencies.".format(
+                extra
+            )
+        raise RuntimeError(
+            "Trying to create an instance of the {} plugin for runbms, "
+            "but the import failed ({}). "
+            "This is most likely due to the required dependencies not "
+            "being installed.{}".format(plugin_type, e, hint)
+        )
+
+
 class RunbmsPlugin(object):
     CLS_MAPPING: Dict[str, Any]
     CLS_MAPPING = {}
@@ -28,7 +58,12 @@ class RunbmsPlugin(object):
 
     @staticmethod
     def from_config(name: str, config: Dict[str, str]) -> Any:
-        return RunbmsPlugin.CLS_MAPPING[config["type"]](name=name, **config)
+        plugin_type = config["type"]
+        if plugin_type not in RunbmsPlugin.CLS_MAPPING:
+            if plugin_type not in PLUGIN_MODULES:
+                raise KeyError("Unknown runbms plugin type {}".format(plugin_type))
+            load_plugin(plugin_type)
+        return RunbmsPlugin.CLS_MAPPING[plugin_type](name=name, **config)
 
     def __str__(self) -> str:
         return "RunbmsPlugin {}".format(self.name)
@@ -89,27 +124,3 @@ class RunbmsPlugin(object):
         _passed: bool,
     ):
         pass
-
-
-# !!! Do NOT remove this import nor change its position
-# This is to make sure that the plugin classes are correctly registered
-from running.plugin.runbms.copyfile import CopyFile
-
-if TYPE_CHECKING:
-    from running.plugin.runbms.zulip import Zulip
-else:
-    try:
-        from running.plugin.runbms.zulip import Zulip
-    except:
-        from running.util import register
-
-        @register(RunbmsPlugin)
-        class Zulip(RunbmsPlugin):
-            def __init__(self, **kwargs):
-                raise RuntimeError(
-                    "Trying to create an instance of the Zulip "
-                    "plugin for runbms, but the import failed. "
-                    "This is most likely due to the required "
-                    "dependencies not being installed. Try pip "
-                    "install running-ng[zulip] to install the extra dependencies."
-                )
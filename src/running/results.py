@@ -0,0 +1,199 @@
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, TextIO
+import gzip
+import itertools
+import re
+import yaml
+from running.util import CONFIG_NAMES_FILENAME, config_str_encode
+
+# runbms writes a prologue at the start of each invocation, and the prologue
+# always starts with this line (see runbms.get_log_prologue)
+INVOCATION_MARKER = "mkdir -p PLOTTY_WORKAROUND; timedrun; "
+MMTk_HEADER = (
+    "============================ MMTk Statistics Totals ============================"
+)
+MMTk_FOOTER = (
+    "------------------------------ End MMTk Statistics -----------------------------"
+)
+DACAPO_PASSED = re.compile(r"===== DaCapo .* PASSED in (\d+) msec =====")
+LOG_SUFFIX = ".log.gz"
+
+
+class WorkUnit(NamedTuple):
+    """The parts of a log filename produced by runbms.get_filename_no_ext"""
+
+    benchmark: str
+    hfac: str
+    size: str
+    config: str
+    suite: str
+
+    def filename_no_ext(self) -> str:
+        return ".".join(self)
+
+
+def parse_log_filename(filename: str) -> Optional[WorkUnit]:
+    """Split a log filename into its work unit
+
+    Returns None if the filename is not one produced by runbms.
+    The encoded config can contain dots, so it is everything between the size
+    and the suite name.
+    """
+    if not filename.endswith(LOG_SUFFIX):
+        return None
+    parts = filename[: -len(LOG_SUFFIX)].split(".")
+    if len(parts) < 5:
+        return None
+    benchmark, hfac, size = parts[:3]
+    if not (hfac.isdigit() and size.isdigit()):
+        return None
+    return WorkUnit(benchmark, hfac, size, ".".join(parts[3:-1]), parts[-1])
+
+
+def parse_invocations(lines: Iterable[str]) -> List[Dict[str, float]]:
+    """Extract the metrics of each invocation in a log
+
+    The MMTk statistics are reported using their names (e.g., `time.gc`), and
+    the execution time reported by a passing DaCapo iteration as `time`.
+    When an invocation reports the same metric more than once, the last one
+    wins, which is the timing iteration.
+    """
+    invocations: List[Dict[str, float]]
+    invocations = []
+    current: Optional[Dict[str, float]]
+    current = None
+    names: Optional[List[str]]
+    names = None
+    in_stats = False
+    for line in lines:
+        if line.startswith(INVOCATION_MARKER):
+            current = {}
+            invocations.append(current)
+            continue
+        if current is None:
+            continue
+        stripped = line.strip()
+        if stripped == MMTk_HEADER:
+            in_stats = True
+            names = None
+        elif stripped == MMTk_FOOTER:
+            in_stats = False
+        elif in_stats:
+            if names is None:
+                names = stripped.split("\t")
+            elif stripped:
+                try:
+                    values = [float(v) for v in stripped.split("\t")]
+                except ValueError:
+                    # The `Total time` line after the values
+                    continue
+                current.update(zip(names, values))
+        elif "PASSED in" in line:
+            m = DACAPO_PASSED.search(line)
+            if m:
+                current["time"] = float(m.group(1))
+    return invocations
+
+
+def parse_output(output: str) -> Dict[str, float]:
+    """Extract the metrics of the output of a single invocation
+
+    Unlike a log, the output does not start with the prologue of runbms.
+    """
+    return parse_invocations(itertools.chain([INVOCATION_MARKER], output.splitlines()))[
+        0
+    ]
+
+
+class ResultTable(object):
+    """Per-invocation results of a run, stored column by column
+
+    Each row is one metric of one invocation of one work unit.
+    """
+
+    def __init__(self):
+        self.work_units: List[WorkUnit]
+        self.work_units = []
+        self.invocations: List[int]
+        self.invocations = []
+        self.metrics: List[str]
+        self.metrics = []
+        self.values: List[float]
+        self.values = []
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add_invocation(self, wu: WorkUnit, invocation: int, stats: Dict[str, float]):
+        n = len(stats)
+        self.work_units.extend([wu] * n)
+        self.invocations.extend([invocation] * n)
+        self.metrics.extend(stats.keys())
+        self.values.extend(stats.values())
+
+    def select(self, metrics: Iterable[str]) -> "ResultTable":
+        wanted = set(metrics)
+        table = ResultTable()
+        for row in zip(self.work_units, self.invocations, self.metrics, self.values):
+            if row[2] in wanted:
+                table.work_units.append(row[0])
+                table.invocations.append(row[1])
+                table.metrics.append(row[2])
+                table.values.append(row[3])
+        return table
+
+
+def load_log(path: Path) -> List[Dict[str, float]]:
+    with gzip.open(path, "rt", errors="replace") as fd:
+        return parse_invocations(fd)
+
+
+def load_config_names(run_dir: Path) -> Dict[str, str]:
+    """The encoded configs of the hashed config names in the log filenames of
+    a run directory (see util.config_filename_encode)"""
+    path = run_dir / CONFIG_NAMES_FILENAME
+    if not path.exists():
+        return {}
+    with path.open() as fd:
+        names = yaml.safe_load(fd) or {}
+    return {name: config_str_encode(c) for (name, c) in names.items()}
+
+
+def load_run(run_dir: Path, metrics: Optional[Iterable[str]] = None) -> ResultTable:
+    """Load the per-invocation results of all the logs in a run directory
+
+    If metrics is specified, the other metrics are discarded while loading.
+    """
+    if not run_dir.is_dir():
+        raise ValueError("{} is not a directory".format(run_dir))
+    wanted = set(metrics) if metrics else None
+    config_names = load_config_names(run_dir)
+    table = ResultTable()
+    for path in sorted(run_dir.glob("*" + LOG_SUFFIX)):
+        wu = parse_log_filename(path.name)
+        if wu is None:
+            continue
+        if wu.config in config_names:
+            wu = wu._replace(config=config_names[wu.config])
+        for i, stats in enumerate(load_log(path)):
+            if wanted is not None:
+                stats = {k: v for (k, v) in stats.items() if k in wanted}
+            table.add_invocation(wu, i, stats)
+    return table
+
+
+TABLE_FORMATS = ["tsv", "markdown"]
+
+
+def write_table(fd: TextIO, header: List[str], rows: Iterable[List[str]], fmt: str):
+    if fmt == "tsv":
+        fd.write("\t".join(header) + "\n")
+        for row in rows:
+            fd.write("\t".join(row) + "\n")
+    elif fmt == "markdown":
+        fd.write("| {} |\n".format(" | ".join(header)))
+        fd.write("|{}\n".format(" --- |" * len(header)))
+        for row in rows:
+            fd.write("| {} |\n".format(" | ".join(row)))
+    else:
+        raise ValueError("Table format {} not supported".format(fmt))
@@ -1,9 +1,12 @@
-from running.modifier import JVMArg, Modifier, JSArg, EnvVar
-from typing import Any, Dict, List, Union
+from running.modifier import JVMArg, Modifier, JSArg, EnvVar, Wrapper
+from typing import Any, Dict, List, Optional, Union
 from pathlib import Path
 import logging
-from running.util import register
+import re
+from running.util import register, smart_quote
+from running import memlimit
 import os.path
+import sys
 
 
 class Runtime(object):
@@ -20,12 +23,36 @@ class Runtime(object):
     def get_executable(self) -> Union[str, Path]:
         raise NotImplementedError
 
+    def get_artifacts(self) -> List[Path]:
+        """The files the runtime loads besides its executable, whose content
+        affects the results, such as the shared library of a JVM"""
+        return []
+
     def get_heapsize_modifiers(self, size: int) -> List[Modifier]:
         raise NotImplementedError
 
     def is_oom(self, _output: bytes) -> bool:
         raise NotImplementedError
 
+    def get_gc_log_modifiers(self) -> List[Modifier]:
+        """Modifiers that make the runtime log the heap usage after each GC
+
+        An empty list means that GC logging is not supported.
+        """
+        return []
+
+    def get_peak_heap_after_gc(self, _output: bytes) -> Optional[float]:
+        """The peak heap usage after GC in MB, from the output of a run with
+        the GC log modifiers
+        """
+        return None
+
+    def get_gc_pause(self, _line: bytes) -> Optional[float]:
+        """The length in seconds of the GC pause logged by a line of output
+        of a run with the GC log modifiers, or None if it does not log one
+        """
+        return None
+
 
 class DummyRuntime(Runtime):
     def __init__(self, executable: str):
@@ -39,15 +66,64 @@ class DummyRuntime(Runtime):
         return False
 
 
+# How a native program reports that it failed to allocate memory
+NATIVE_OOM_PATTERNS = [
+    memlimit.OOM_MESSAGE.encode(),
+    b"Cannot allocate memory",
+    b"std::bad_alloc",
+    b"memory allocation of",  # Rust
+    b"runtime: out of memory",  # Go
+    b"MemoryError",
+]
+
+
 @register(Runtime)
 class NativeExecutable(Runtime):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        # Opt-in, so that the programs are run as they are by default
+        self.memory_limit: Optional[str]
+        self.memory_limit = kwargs.get("memory_limit")
+        if self.memory_limit not in [None, "rlimit", "cgroup"]:
+            raise ValueError(
+                "memory_limit {} of {} not recognized".format(
+                    self.memory_limit, self.name
+                )
+            )
+        self.cgroup: Optional[str]
+        self.cgroup = kwargs.get("cgroup")
+        if self.memory_limit == "cgroup" and not self.cgroup:
+            raise KeyError(
+                "A cgroup is required to limit the memory of {} with a cgroup".format(
+                    self.name
+                )
+            )
 
     def get_executable(self) -> Union[str, Path]:
         return ""
 
-    def is_oom(self, _output: bytes) -> bool:
+    def get_heapsize_modifiers(self, size: int) -> List[Modifier]:
+        # The program is run with a hard memory limit instead of a heap size
+        if self.memory_limit is None:
+            raise ValueError(
+                "Set the memory_limit of {} to run it with a heap size".format(
+                    self.name
+                )
+            )
+        cmd = [sys.executable, "-m", "running.memlimit", self.memory_limit, str(size)]
+        if self.cgroup and self.memory_limit == "cgroup":
+            cmd.extend(["--cgroup", self.cgroup])
+        return [
+            Wrapper(
+                name="heap{}M".format(size),
+                val=" ".join(smart_quote(x) for x in cmd),
+            )
+        ]
+
+    def is_oom(self, output: bytes) -> bool:
+        for pattern in NATIVE_OOM_PATTERNS:
+            if pattern in output:
+                return True
         return False
 
 
@@ -81,6 +157,13 @@ class JVM(Runtime):
         return False
 
 
+OPENJDK_HEAP_USAGE = re.compile(rb"\d+[KMG]->(\d+)([KMG])\(\d+[KMG]\)")
+OPENJDK_UNITS = {b"K": 1 / 1024, b"M": 1, b"G": 1024}
+# Concurrent phases are also logged with their lengths, but are not pauses
+OPENJDK_UNIFIED_PAUSE = re.compile(rb"GC\(\d+\) Pause .* (\d+(?:\.\d+)?)ms\s*$")
+OPENJDK_LEGACY_PAUSE = re.compile(rb"\[(?:Full )?GC .*, (\d+(?:\.\d+)?) secs\]")
+
+
 @register(Runtime)
 class OpenJDK(JVM):
     def __init__(self, **kwargs):
@@ -102,6 +185,38 @@ class OpenJDK(JVM):
     def get_executable(self) -> Path:
         return self.executable
 
+    def get_artifacts(self) -> List[Path]:
+        # libjvm.so (and a third-party heap, if any) is in lib/server since
+        # JDK 9, and in jre/lib/ARCH/server before
+        return sorted(self.home.glob("lib/server/*.so")) + sorted(
+            self.home.glob("jre/lib/*/server/*.so")
+        )
+
+    def get_gc_log_modifiers(self) -> List[Modifier]:
+        # Unified logging replaced -verbose:gc in JDK 9
+        val = "-Xlog:gc" if self.release >= 9 else "-verbose:gc"
+        return [JVMArg(name="gc_log", val=val)]
+
+    def get_peak_heap_after_gc(self, output: bytes) -> Optional[float]:
+        # Both formats log the heap usage as BEFORE->AFTER(CAPACITY), e.g.,
+        # [0.050s][info][gc] GC(0) Pause Young (Normal) (G1 Evacuation Pause) 24M->3M(256M) 1.2ms
+        # [GC (Allocation Failure)  65536K->1304K(251392K), 0.0014 secs]
+        peak = None
+        for m in OPENJDK_HEAP_USAGE.finditer(output):
+            after = int(m.group(1)) * OPENJDK_UNITS[m.group(2)]
+            if peak is None or after > peak:
+                peak = after
+        return peak
+
+    def get_gc_pause(self, line: bytes) -> Optional[float]:
+        m = OPENJDK_UNIFIED_PAUSE.search(line)
+        if m:
+            return float(m.group(1)) / 1000
+        m = OPENJDK_LEGACY_PAUSE.search(line)
+        if m:
+            return float(m.group(1))
+        return None
+
     def __str__(self):
         return "{} OpenJDK {} {}".format(super().__str__(), self.release, self.home)
 
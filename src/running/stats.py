@@ -0,0 +1,177 @@
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+import logging
+import numpy as np
+from running.expression import Expression
+from running.results import ResultTable
+
+# Upper bound of the number of elements materialized at once when bootstrapping
+BOOTSTRAP_BUDGET = 1 << 22
+
+
+class Groups(object):
+    """Values partitioned by keys
+
+    The values are reordered so that each group occupies a contiguous range,
+    so the statistics of all groups are computed by a handful of array
+    operations instead of a Python loop per group.
+    NaNs are discarded, and therefore a key might end up with an empty group.
+    """
+
+    def __init__(self, keys: Sequence[Hashable], values: Sequence[float]):
+        index: dict
+        index = {}
+        codes = np.fromiter(
+            (index.setdefault(k, len(index)) for k in keys),
+            dtype=np.int64,
+            count=len(keys),
+        )
+        self.keys: List[Hashable]
+        self.keys = list(index)
+        vals = np.asarray(values, dtype=np.float64)
+        keep = ~np.isnan(vals)
+        codes = codes[keep]
+        vals = vals[keep]
+        # Sort by group, and then by value within a group for the medians
+        order = np.lexsort((vals, codes))
+        self.values = vals[order]
+        self.counts = np.bincount(codes, minlength=len(self.keys))
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1])).astype(
+            np.int64
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _sums(self, values: np.ndarray) -> np.ndarray:
+        sums = np.zeros(len(self.keys))
+        nonempty = self.counts > 0
+        sums[nonempty] = np.add.reduceat(values, self.starts[nonempty])
+        return sums
+
+    def mean(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._sums(self.values) / self.counts
+
+    def geomean(self) -> np.ndarray:
+        """Geometric means, which are NaN for groups with non-positive values"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            logs = np.log(np.where(self.values > 0, self.values, np.nan))
+            return np.exp(self._sums(logs) / self.counts)
+
+    def median(self) -> np.ndarray:
+        medians = np.full(len(self.keys), np.nan)
+        nonempty = self.counts > 0
+        starts = self.starts[nonempty]
+        counts = self.counts[nonempty]
+        lower = self.values[starts + (counts - 1) // 2]
+        upper = self.values[starts + counts // 2]
+        medians[nonempty] = (lower + upper) / 2
+        return medians
+
+    def bootstrap_means(
+        self, groups: np.ndarray, iterations: int, rng: np.random.Generator
+    ) -> np.ndarray:
+        """Means of the groups resampled with replacement
+
+        groups are the indices of nonempty groups.
+        Returns an array of shape (iterations, len(groups)).
+        """
+        counts = self.counts[groups]
+        assert np.all(counts > 0)
+        total = int(counts.sum())
+        # For each record, the start and the size of the group it belongs to
+        rec_starts = np.repeat(self.starts[groups], counts)
+        rec_counts = np.repeat(counts, counts)
+        local_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        means = np.empty((iterations, len(groups)))
+        batch = max(1, BOOTSTRAP_BUDGET // max(1, total))
+        for i in range(0, iterations, batch):
+            n = min(batch, iterations - i)
+            picks = rec_starts + (rng.random((n, total)) * rec_counts).astype(np.int64)
+            sums = np.add.reduceat(self.values[picks], local_starts, axis=1)
+            means[i : i + n] = sums / counts
+        return means
+
+    def bootstrap_ci(
+        self, iterations: int, confidence: float, rng: np.random.Generator
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Percentile bootstrap confidence intervals of the means
+
+        The intervals are NaNs if iterations is zero.
+        """
+        lows = np.full(len(self.keys), np.nan)
+        highs = np.full(len(self.keys), np.nan)
+        if iterations <= 0:
+            return lows, highs
+        nonempty = np.flatnonzero(self.counts > 0)
+        # Bootstrap a chunk of groups at a time to bound the memory usage
+        limit = max(1, BOOTSTRAP_BUDGET // iterations)
+        chunk_ids = np.cumsum(self.counts[nonempty]) // limit
+        for chunk in np.split(nonempty, np.flatnonzero(np.diff(chunk_ids)) + 1):
+            if len(chunk) == 0:
+                continue
+            means = self.bootstrap_means(chunk, iterations, rng)
+            lows[chunk], highs[chunk] = percentile_ci(means, confidence)
+        return lows, highs
+
+
+def derive_metrics(table: ResultTable, definitions: List[Tuple[str, Expression]]):
+    """Add derived metrics to every invocation of a table
+
+    The table is pivoted so that each metric is a column with one element per
+    invocation (NaN if the invocation did not report the metric), and each
+    expression is evaluated once over the whole columns.
+    """
+    index: dict
+    index = {}
+    rows = np.fromiter(
+        (
+            index.setdefault(k, len(index))
+            for k in zip(table.work_units, table.invocations)
+        ),
+        dtype=np.int64,
+        count=len(table),
+    )
+    names: dict
+    names = {}
+    cols = np.fromiter(
+        (names.setdefault(m, len(names)) for m in table.metrics),
+        dtype=np.int64,
+        count=len(table),
+    )
+    matrix = np.full((len(names), len(index)), np.nan)
+    matrix[cols, rows] = table.values
+    columns: Dict[str, np.ndarray]
+    columns = {name: matrix[i] for (name, i) in names.items()}
+    invocations = list(index)
+    for name, expression in definitions:
+        try:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = expression(columns)
+        except KeyError as e:
+            logging.warning("Cannot derive {}, {} not found".format(name, e))
+            continue
+        values = np.broadcast_to(np.asarray(values, dtype=np.float64), len(index))
+        columns[name] = values
+        keep = np.flatnonzero(~np.isnan(values))
+        table.work_units.extend(invocations[i][0] for i in keep)
+        table.invocations.extend(invocations[i][1] for i in keep)
+        table.metrics.extend([name] * len(keep))
+        table.values.extend(values[keep].tolist())
+
+
+def percentile_ci(
+    samples: np.ndarray, confidence: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Percentile confidence intervals of bootstrap samples, one column per group"""
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(samples, [alpha, 1 - alpha], axis=0)
+    return low, high
+
+
+def make_rng(seed: Optional[int]) -> np.random.Generator:
+    return np.random.default_rng(seed)
+
+
+def format_float(v: float) -> str:
+    return "" if np.isnan(v) else "{:.6g}".format(v)
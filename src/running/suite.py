@@ -8,6 +8,7 @@ from running.benchmark import (
     JuliaBenchmark,
 )
 import logging
+from running import memlimit
 from running.util import register, split_quoted
 import os.path
 
@@ -58,12 +59,46 @@ class BenchmarkSuite(object):
     def get_minheap(self, _bm: Benchmark) -> int:
         raise NotImplementedError
 
+    def has_minheap_values(self) -> bool:
+        """Whether the minheap values come from minheap_values, instead of
+        being fixed by the suite"""
+        return False
+
+    def get_known_minheap(
+        self, _bm_name: str, _key: Optional[str] = None
+    ) -> Optional[int]:
+        """Look up a minheap value without falling back to a default
+
+        The key selects an entry of the minheap values, and defaults to the
+        one selected by the suite.
+        """
+        return None
+
     def is_passed(self, _output: bytes) -> bool:
         raise NotImplementedError
 
 
+class MinheapValuesMixin(object):
+    """For suites whose minheap values are selected by `minheap` from
+    `minheap_values`"""
+
+    minheap: Optional[str]
+    minheap_values: Dict[str, Dict[str, int]]
+
+    def has_minheap_values(self) -> bool:
+        return True
+
+    def get_known_minheap(
+        self, bm_name: str, key: Optional[str] = None
+    ) -> Optional[int]:
+        key = key or self.minheap
+        if not key or key not in self.minheap_values:
+            return None
+        return self.minheap_values[key].get(bm_name)
+
+
 @register(BenchmarkSuite)
-class BinaryBenchmarkSuite(BenchmarkSuite):
+class BinaryBenchmarkSuite(MinheapValuesMixin, BenchmarkSuite):
     def __init__(self, programs: Dict[str, Dict[str, str]], **kwargs):
         super().__init__(**kwargs)
         self.programs: Dict[str, Dict[str, Any]]
@@ -72,6 +107,27 @@ class BinaryBenchmarkSuite(BenchmarkSuite):
             for k, v in programs.items()
         }
         self.timeout = kwargs.get("timeout")
+        self.minheap: Optional[str]
+        self.minheap = kwargs.get("minheap")
+        self.minheap_values: Dict[str, Dict[str, int]]
+        self.minheap_values = kwargs.get("minheap_values", {})
+        if not isinstance(self.minheap_values, dict):
+            raise TypeError(
+                "The minheap_values of {} should be a dictionary".format(self.name)
+            )
+        if self.minheap:
+            if not isinstance(self.minheap, str):
+                raise TypeError(
+                    "The minheap of {} should be a string that selects from a minheap_values".format(
+                        self.name
+                    )
+                )
+            if self.minheap not in self.minheap_values:
+                raise KeyError(
+                    "{} is not a valid entry of {}.minheap_values".format(
+                        self.name, self.name
+                    )
+                )
 
     def get_benchmark(self, bm_spec: Union[str, Dict[str, Any]]) -> "BinaryBenchmark":
         assert type(bm_spec) is str
@@ -85,13 +141,21 @@ class BinaryBenchmarkSuite(BenchmarkSuite):
         )
 
     def get_minheap(self, bm: Benchmark) -> int:
-        logging.warning("minheap is not respected for BinaryBenchmarkSuite")
         assert isinstance(bm, BinaryBenchmark)
-        return 0
+        name = bm.name
+        if not self.minheap:
+            logging.warning("No minheap_value of {} is selected".format(self))
+            return DEFAULT_MINHEAP
+        minheap = self.minheap_values[self.minheap]
+        if name not in minheap:
+            logging.warning("Minheap for {} of {} not set".format(name, self))
+            return DEFAULT_MINHEAP
+        return minheap[name]
 
-    def is_passed(self, _output: bytes) -> bool:
-        # FIXME no generic way to know
-        return True
+    def is_passed(self, output: bytes) -> bool:
+        # FIXME no generic way to know, other than a failure reported by
+        # the memory limit of NativeExecutable
+        return memlimit.MESSAGE_PREFIX.encode() not in output
 
 
 class JavaBenchmarkSuite(BenchmarkSuite):
@@ -103,7 +167,7 @@ class JavaBenchmarkSuite(BenchmarkSuite):
 
 
 @register(BenchmarkSuite)
-class DaCapo(JavaBenchmarkSuite):
+class DaCapo(MinheapValuesMixin, JavaBenchmarkSuite):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.release: str
@@ -329,7 +393,7 @@ class SPECjbb2015(JavaBenchmarkSuite):
 
 
 @register(BenchmarkSuite)
-class Octane(BenchmarkSuite):
+class Octane(MinheapValuesMixin, BenchmarkSuite):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.path: Path
@@ -461,7 +525,7 @@ class SPECjvm98(JavaBenchmarkSuite):
 
 
 @register(BenchmarkSuite)
-class JuliaGCBenchmarks(BenchmarkSuite):
+class JuliaGCBenchmarks(MinheapValuesMixin, BenchmarkSuite):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.path: Path
@@ -4,15 +4,22 @@ if TYPE_CHECKING:
     from running.config import Configuration
     from running.modifier import Modifier
     from running.runtime import Runtime
+import os
+from pathlib import Path
 import shlex
 import socket
-import urllib.request
 import enum
 import getpass
+import hashlib
 from datetime import datetime
 import subprocess
 import time
 
+# Leave enough room for the benchmark name, the heap size and the suite name
+# in a log filename
+MAX_CONFIG_FILENAME_LEN = 128
+CONFIG_NAMES_FILENAME = "config_names.yml"
+
 
 def system(cmd, check=True) -> str:
     return subprocess.run(
@@ -29,52 +36,55 @@ def register(parent_class):
 
 
 def config_index_to_chr(i: int) -> str:
-    if i < 0 or i >= 52:
+    """a-z and A-Z for the first 52 configs, and then base 52 numbers written
+    with the same letters, such as ba for 52"""
+    if i < 0:
         raise ValueError("Cannot convert {} into a character".format(i))
     elif i < 26:
         return chr(ord("a") + i)
-    else:
+    elif i < 52:
         return chr(ord("A") + i - 26)
+    else:
+        return config_index_to_chr(i // 52) + config_index_to_chr(i % 52)
 
 
-def parse_modifier_strs(
+def expand_modifier_strs(
     configuration: "Configuration", mod_strs: List[str]
-) -> List["Modifier"]:
-    # Some modifiers could be a modifier set, and we need to flatten it
-    from running.modifier import ModifierSet
+) -> List[Tuple[str, "Modifier"]]:
+    """Flatten the modifier sets in mod_strs
 
+    Each of the returned strings names a modifier that is not a modifier set,
+    followed by its value options, and comes with the modifier it
+    instantiates.
+    """
     mods = []
     for m in mod_strs:
         m = m.strip()
         if not m:
             break
-        mod_name = m.split("-")[0]
-        mod_value_opts = m.split("-")[1:]
-        mod = configuration.get("modifiers").get(mod_name)
-        if mod is None:
-            raise KeyError("Modifier '{}' not defined".format(mod_name))
-        mod = mod.apply_value_opts(mod_value_opts)
-        if isinstance(mod, ModifierSet):
-            for m_inner in mod.flatten(configuration):
-                mods.append(m_inner)
-        else:
-            mods.append(mod)
+        mods.extend(configuration.expand_modifier(m))
     return mods
 
 
+def parse_modifier_strs(
+    configuration: "Configuration", mod_strs: List[str]
+) -> List["Modifier"]:
+    # Some modifiers could be a modifier set, and we need to flatten it
+    return [mod for _, mod in expand_modifier_strs(configuration, mod_strs)]
+
+
 def parse_config_str(
     configuration: "Configuration", c: str
 ) -> Tuple["Runtime", List["Modifier"]]:
     runtime = configuration.get("runtimes")[c.split("|")[0].strip()]
-    mods = parse_modifier_strs(configuration, c.split("|")[1:])
+    mods = list(configuration.get_modifiers(c))
     return runtime, mods
 
 
 def dont_emit_heapsize_modifier(configuration: "Configuration", c: str) -> bool:
-    mods = parse_modifier_strs(configuration, c.split("|")[1:])
     from running.modifier import NoImplicitHeapsizeModifier
 
-    for mod in mods:
+    for mod in configuration.get_modifiers(c):
         if isinstance(mod, NoImplicitHeapsizeModifier):
             return True
     return False
@@ -84,6 +94,27 @@ def config_str_encode(c: str) -> str:
     return ".".join([x.strip() for x in c.split("|")])
 
 
+def config_filename_encode(c: str) -> str:
+    """The encoded config as part of a log filename
+
+    Most file systems limit a filename to 255 bytes, so an encoded config that
+    is too long is replaced by a short hash of it.
+    The hashed names are mapped back to the configs by CONFIG_NAMES_FILENAME
+    in the log directory.
+    """
+    encoded = config_str_encode(c)
+    if len(encoded.encode("utf-8")) <= MAX_CONFIG_FILENAME_LEN:
+        return encoded
+    return "config-{}".format(hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16])
+
+
+def get_cache_dir() -> Path:
+    """The directory for the caches of running-ng, following the XDG base
+    directory specification"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "running-ng"
+
+
 def split_quoted(s: str) -> List[str]:
     return shlex.split(s)
 
@@ -158,6 +189,9 @@ class Moma(object):
                 MomaReservationStatus.NOT_MOMA, None, None, None
             )
         else:
+            # Only used by the Zulip plugin, and slow to import
+            import urllib.request
+
             with urllib.request.urlopen(self.reserve_time_url) as response:
                 html = response.read()
                 if not html:
@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    # Keep the caches of running-ng, such as the parsed configuration files,
+    # out of the home directory of whoever runs the tests
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
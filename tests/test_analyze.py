@@ -0,0 +1,127 @@
+from running.command.analyze import analyze
+from running.results import (
+    MMTk_FOOTER,
+    MMTk_HEADER,
+    ResultTable,
+    WorkUnit,
+    parse_invocations,
+    parse_log_filename,
+)
+from running.expression import parse_definitions
+from running.stats import Groups, derive_metrics, make_rng
+import pytest
+
+
+def test_parse_log_filename():
+    wu = parse_log_filename(
+        "fop.2000.42.jdk11.ms.s.c2.mmtk_gc-Immix.dacapochopin.log.gz"
+    )
+    assert wu == WorkUnit(
+        "fop", "2000", "42", "jdk11.ms.s.c2.mmtk_gc-Immix", "dacapochopin"
+    )
+    assert (
+        wu.filename_no_ext() == "fop.2000.42.jdk11.ms.s.c2.mmtk_gc-Immix.dacapochopin"
+    )
+    assert parse_log_filename("runbms.yml") is None
+    assert parse_log_filename("fop.foo.42.jdk11.dacapochopin.log.gz") is None
+
+
+def test_parse_invocations():
+    lines = [
+        "some noise before the first invocation\n",
+        "mkdir -p PLOTTY_WORKAROUND; timedrun; java -jar dacapo.jar fop\n",
+        "===== DaCapo 23.11 fop completed warmup 1 in 800 msec =====\n",
+        MMTk_HEADER + "\n",
+        "time.gc\ttime.mu\n",
+        "10.0\t100.0\n",
+        "Total time: 110.00 ms\n",
+        MMTk_FOOTER + "\n",
+        "===== DaCapo 23.11 fop PASSED in 500 msec =====\n",
+        "mkdir -p PLOTTY_WORKAROUND; timedrun; java -jar dacapo.jar fop\n",
+        "===== DaCapo 23.11 fop FAILED warmup =====\n",
+    ]
+    invocations = parse_invocations(lines)
+    assert invocations == [{"time.gc": 10.0, "time.mu": 100.0, "time": 500.0}, {}]
+
+
+def test_groups():
+    groups = Groups(["a", "b", "a", "b", "a", "c"], [1, 2, 4, 8, 16, float("nan")])
+    assert groups.keys == ["a", "b", "c"]
+    assert list(groups.counts) == [3, 2, 0]
+    means = groups.mean()
+    assert means[0] == pytest.approx(7)
+    assert means[1] == pytest.approx(5)
+    medians = groups.median()
+    assert medians[0] == 4
+    assert medians[1] == 5
+    geomeans = groups.geomean()
+    assert geomeans[0] == pytest.approx(4)
+    assert geomeans[1] == pytest.approx(4)
+
+
+def test_bootstrap_ci():
+    values = [float(v) for v in range(100)]
+    groups = Groups(["a"] * 100 + ["b"] * 3, values + [5, 5, 5])
+    lows, highs = groups.bootstrap_ci(1000, 0.95, make_rng(0))
+    assert lows[0] < 49.5 < highs[0]
+    assert lows[1] == highs[1] == 5
+    # deterministic given the same seed
+    again = groups.bootstrap_ci(1000, 0.95, make_rng(0))
+    assert list(again[0]) == list(lows)
+
+
+def test_analyze_normalize():
+    table = ResultTable()
+    for config, time in [("base", 100.0), ("new", 80.0)]:
+        for bm in ["fop", "avrora"]:
+            wu = WorkUnit(bm, "2000", "42", config, "dacapo")
+            for i in range(3):
+                table.add_invocation(wu, i, {"time": time})
+    header, rows = analyze(table, "base", 100, 0.95, 0)
+    norm = header.index("norm_mean")
+    normalized = {(r[1], r[3]): r[norm] for r in rows}
+    assert normalized[("fop", "base")] == "1"
+    assert normalized[("fop", "new")] == "0.8"
+    assert normalized[("geomean", "new")] == "0.8"
+
+
+def test_derive_metrics():
+    table = ResultTable()
+    wu = WorkUnit("fop", "2000", "42", "base", "dacapo")
+    table.add_invocation(wu, 0, {"time.gc": 1.0, "time.mu": 3.0})
+    table.add_invocation(wu, 1, {"time.gc": 2.0, "time.mu": 2.0})
+    table.add_invocation(wu, 2, {"time.gc": 2.0})
+    derive_metrics(table, parse_definitions(["gc = time.gc / (time.gc + time.mu)"]))
+    derived = [
+        (i, v)
+        for (i, m, v) in zip(table.invocations, table.metrics, table.values)
+        if m == "gc"
+    ]
+    assert derived == [(0, 0.25), (1, 0.5)]
+
+
+def test_derive_metrics_wildcard():
+    table = ResultTable()
+    fop = WorkUnit("fop", "2000", "42", "base", "dacapo")
+    lusearch = WorkUnit("lusearch", "2000", "42", "base", "dacapo")
+    # The benchmarks report different work packets
+    table.add_invocation(fop, 0, {"work.A.total": 1.0, "work.B.total": 2.0})
+    table.add_invocation(lusearch, 0, {"work.A.total": 4.0})
+    table.add_invocation(lusearch, 1, {"time.gc": 1.0})
+    derive_metrics(
+        table,
+        parse_definitions(["s = sum(work.*.total)", "n = count(work.*.total)"]),
+    )
+    derived = {
+        (wu.benchmark, i, m): v
+        for (wu, i, m, v) in zip(
+            table.work_units, table.invocations, table.metrics, table.values
+        )
+        if m in ["s", "n"]
+    }
+    assert derived == {
+        ("fop", 0, "s"): 3.0,
+        ("fop", 0, "n"): 2.0,
+        ("lusearch", 0, "s"): 4.0,
+        ("lusearch", 0, "n"): 1.0,
+    }
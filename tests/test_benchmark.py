@@ -0,0 +1,29 @@
+from running.benchmark import BinaryBenchmark, SubprocessrExit
+from running.runtime import DummyRuntime
+from pathlib import Path
+import threading
+import time
+
+
+def test_run_cancel():
+    b = BinaryBenchmark(
+        Path("/bin/sh"),
+        ["-c", "echo started; sleep 10"],
+        suite_name="test",
+        name="sleep",
+    )
+    cancel = threading.Event()
+    threading.Timer(0.5, cancel.set).start()
+    start = time.monotonic()
+    output, _, subprocess_exit = b.run(DummyRuntime(""), cancel=cancel)
+    assert subprocess_exit is SubprocessrExit.Cancelled
+    assert output == b"started\n"
+    assert time.monotonic() - start < 5
+
+
+def test_run_cancellable_timeout():
+    b = BinaryBenchmark(
+        Path("/bin/sh"), ["-c", "sleep 10"], suite_name="test", name="sleep", timeout=1
+    )
+    _, _, subprocess_exit = b.run(DummyRuntime(""), cancel=threading.Event())
+    assert subprocess_exit is SubprocessrExit.Timeout
@@ -0,0 +1,29 @@
+from running.command.compare import compare
+from running.results import ResultTable, WorkUnit
+
+
+def make_table(times):
+    table = ResultTable()
+    for bm, values in times.items():
+        wu = WorkUnit(bm, "2000", "42", "jdk11.g1", "dacapo")
+        for i, v in enumerate(values):
+            table.add_invocation(wu, i, {"time": v})
+    return table
+
+
+def test_compare():
+    table_a = make_table(
+        {"fop": [100, 101, 99, 100, 102], "avrora": [50, 51, 49, 50, 50]}
+    )
+    table_b = make_table(
+        {
+            "fop": [120, 121, 119, 122, 120],
+            "avrora": [50, 50, 51, 49, 50],
+            "lusearch": [10, 10, 10],
+        }
+    )
+    rows, regressions = compare(table_a, table_b, 0.02, 1000, 0.95, 0)
+    assert regressions == 1
+    verdicts = {r[1]: r[-1] for r in rows}
+    # lusearch only exists in one of the runs
+    assert verdicts == {"avrora": "", "fop": "regression"}
@@ -1,5 +1,6 @@
-from running.config import Configuration
+from running.config import Configuration, COMPILED_KEY
 import pytest
+from running.util import parse_config_str
 
 
 def test_override():
@@ -80,3 +81,173 @@ def test_resolve_jvms():
     jdk8 = c.get("runtimes")["adoptopenjdk-8"]
     assert str(jdk8.executable) == "/usr/lib/jvm/adoptopenjdk-8-hotspot-amd64/bin/java"
     assert jdk8.release == 8
+
+
+def test_merge():
+    c1 = Configuration({"a": {"b": 1, "c": 42}, "d": ["foo", "bar"]})
+    c1.merge(Configuration({"a": {"b": 2}, "d": ["fizz"], "f": 100}))
+    assert c1.get("a") == {"b": 2, "c": 42}
+    assert c1.get("d") == ["foo", "bar", "fizz"]
+    assert c1.get("f") == 100
+    with pytest.raises(TypeError):
+        c1.merge(Configuration({"f": 101}))
+
+
+def test_from_file_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("RUNNING_NG_TEST_DIR", str(tmp_path / "one"))
+    for d in ["one", "two"]:
+        (tmp_path / d).mkdir()
+        (tmp_path / d / "base.yml").write_text("configs: [{}]\n".format(d))
+    (tmp_path / "main.yml").write_text(
+        'includes: ["$RUNNING_NG_TEST_DIR/base.yml"]\n'
+        'overrides: {"invocations": 3}\n'
+        "configs: [main]\n"
+    )
+
+    def load():
+        return Configuration.from_file(tmp_path, "main.yml")
+
+    assert load().get("configs") == ["one", "main"]
+    assert len(list((tmp_path / "cache").glob("running-ng/config/*.pickle"))) == 1
+    cached = load()
+    assert cached.get("configs") == ["one", "main"]
+    assert cached.get("invocations") == 3
+    # Changes to included files and to where they are are picked up
+    (tmp_path / "one" / "base.yml").write_text("configs: [uno]\n")
+    assert load().get("configs") == ["uno", "main"]
+    monkeypatch.setenv("RUNNING_NG_TEST_DIR", str(tmp_path / "two"))
+    assert load().get("configs") == ["two", "main"]
+
+
+def test_resolve_lazily():
+    c = Configuration(
+        {
+            "runtimes": {
+                "native": {"type": "NativeExecutable"},
+                # Never instantiated, so the unknown type does not matter
+                "unused": {"type": "NoSuchRuntime"},
+            },
+            "suites": {
+                "bin": {
+                    "type": "BinaryBenchmarkSuite",
+                    "programs": {"ls": {"path": "/bin/ls", "args": ""}},
+                },
+                "unused": {"type": "NoSuchSuite"},
+            },
+            "benchmarks": {"bin": ["ls"]},
+        }
+    )
+    c.resolve_class()
+    runtimes = c.get("runtimes")
+    assert "unused" in runtimes and len(runtimes) == 2
+    assert runtimes["native"] is runtimes["native"]
+    (ls,) = c.get("benchmarks")["bin"]
+    assert ls.name == "ls"
+    with pytest.raises(KeyError):
+        runtimes["unused"]
+
+
+def test_compile(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    c = Configuration(
+        {
+            "runtimes": {
+                "native": {"type": "NativeExecutable"},
+                "unused": {"type": "NoSuchRuntime"},
+            },
+            "modifiers": {
+                "a": {"type": "ProgramArg", "val": "-a{0}"},
+                "b": {"type": "ProgramArg", "val": "-b"},
+                "set": {"type": "ModifierSet", "val": "a-{0}|b"},
+                "unused": {"type": "ProgramArg", "val": "-u"},
+            },
+            "suites": {
+                "bin": {
+                    "type": "BinaryBenchmarkSuite",
+                    "programs": {"ls": {"path": "/bin/ls", "args": ""}},
+                },
+                "unused": {"type": "NoSuchSuite"},
+            },
+            "benchmarks": {"bin": ["ls"]},
+            "configs": ["native|set-1", "native|b"],
+        }
+    )
+    compiled = c.compile()
+    compiled.validate()
+    assert compiled.get(COMPILED_KEY)["configs"] == {
+        "native|set-1": ["a-1", "b"],
+        "native|b": ["b"],
+    }
+    assert list(compiled.get("runtimes")) == ["native"]
+    assert sorted(compiled.get("modifiers")) == ["a", "b"]
+    assert list(compiled.get("suites")) == ["bin"]
+    # The definitions are shared, but the configuration itself is unchanged
+    assert c.get(COMPILED_KEY) is None
+    assert "unused" in c.get("modifiers")
+    # The set is gone, and the flattened configs are used instead
+    compiled.resolve_class()
+    _, mods = parse_config_str(compiled, "native|set-1")
+    assert [m.val for m in mods] == [["-a1"], ["-b"]]
+
+    path = tmp_path / "compiled.yml"
+    with path.open("w") as fd:
+        c.compile().save_to_file(fd)
+    loaded = Configuration.from_file(tmp_path, str(path))
+    assert loaded.compile().get(COMPILED_KEY) == c.compile().get(COMPILED_KEY)
+    path.write_text(path.read_text().replace("-b", "-c"))
+    with pytest.raises(ValueError):
+        Configuration.from_file(tmp_path, str(path))
+
+
+def test_resolve_class_referenced(tmp_path):
+    (tmp_path / "main.yml").write_text(
+        "runtimes: {native: {type: NativeExecutable}}\n"
+        "suites:\n"
+        "  bin: {type: BinaryBenchmarkSuite, programs: {ls: {path: /bin/ls, args: ''}}}\n"
+        "  bogus: {type: DaCapo, release: nope, path: /dev/null, timing_iteration: 1}\n"
+        "benchmarks: {bin: [ls]}\n"
+        "configs: [native]\n"
+    )
+    # Definitions that nothing uses are never instantiated
+    Configuration.from_file(tmp_path, "main.yml").resolve_class()
+    (tmp_path / "main.yml").write_text(
+        (tmp_path / "main.yml")
+        .read_text()
+        .replace("{bin: [ls]}", "{bin: [ls], bogus: [fop]}")
+    )
+    c = Configuration.from_file(tmp_path, "main.yml")
+    with pytest.raises(ValueError, match="nope"):
+        c.resolve_class()
+
+
+def test_compile_mixed_keys(tmp_path):
+    # Benchmark names that YAML parses as numbers
+    (tmp_path / "main.yml").write_text(
+        "suites:\n"
+        "  bin:\n"
+        "    type: BinaryBenchmarkSuite\n"
+        "    programs: {foo: {path: /bin/ls, args: ''}}\n"
+        "    minheap_values: {native: {foo: 1, 505: 2, '505': 3}}\n"
+        "benchmarks: {bin: [foo]}\n"
+    )
+    compiled = Configuration.from_file(tmp_path, "main.yml").compile()
+    with (tmp_path / "compiled.yml").open("w") as fd:
+        compiled.save_to_file(fd)
+    loaded = Configuration.from_file(tmp_path, "compiled.yml")
+    assert loaded.get(COMPILED_KEY) == compiled.get(COMPILED_KEY)
+
+
+def test_from_file_aliases(tmp_path):
+    (tmp_path / "base.yml").write_text(
+        "benchmarks: &bms {dacapo: [fop]}\nbackup: *bms\n"
+    )
+    (tmp_path / "main.yml").write_text(
+        "includes: [base.yml]\n"
+        'overrides: {"benchmarks.dacapo": [avrora]}\n'
+        "benchmarks: {other: [foo]}\n"
+    )
+    c = Configuration.from_file(tmp_path, "main.yml")
+    assert c.get("benchmarks") == {"dacapo": ["avrora"], "other": ["foo"]}
+    # The other aliases of the node are not changed by merging or overriding
+    assert c.get("backup") == {"dacapo": ["fop"]}
@@ -0,0 +1,41 @@
+from running.command.curve import load_curves, table_rows
+from running.command.minheap import ContinueSearch, Journal
+from running.results import parse_output
+
+
+def test_parse_output():
+    output = "===== DaCapo 23.11 fop PASSED in 1234 msec =====\n"
+    assert parse_output(output) == {"time": 1234.0}
+    assert parse_output("") == {}
+
+
+def test_load_curves(tmp_path):
+    journal = Journal(tmp_path / "result.journal.jsonl")
+    search = journal.for_search("c", "dacapo", "fop")
+
+    def probe(exit, outcome, time=None):
+        def run(details):
+            details["exit"] = exit
+            details["duration"] = 1.5
+            details["metrics"] = {} if time is None else {"time": time}
+            return outcome
+
+        return run
+
+    search.probe(200, "search", probe("pass", ContinueSearch.HeapTooBig, 10), print)
+    search.probe(50, "search", probe("oom", ContinueSearch.HeapTooSmall), print)
+    search.probe(100, "search", probe("pass", ContinueSearch.HeapTooBig, 20), print)
+    search.probe(100, "confirm", probe("pass", ContinueSearch.HeapTooBig, 30), print)
+    search.probe(100, "confirm", probe("timeout", ContinueSearch.HeapTooSmall), print)
+    search.minheap(100, 5.0)
+    journal.close()
+
+    curves = load_curves(journal.path, "time")
+    assert curves[("c", "dacapo", "fop")].minheap == 100
+    assert table_rows(curves) == [
+        ["c", "dacapo", "fop", "50", "0.500", "0", "1", ""],
+        ["c", "dacapo", "fop", "100", "1.000", "2", "3", "25.000"],
+        ["c", "dacapo", "fop", "200", "2.000", "1", "1", "10.000"],
+    ]
+    durations = load_curves(journal.path, "duration")
+    assert table_rows(durations)[1][-1] == "1.500"
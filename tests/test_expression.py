@@ -0,0 +1,42 @@
+from running.expression import Expression, parse_definitions
+import pytest
+
+
+def test_expression():
+    stats = {
+        "time.gc": 1.0,
+        "time.mu": 3.0,
+        "work.foo.PERF_COUNT_HW_CPU_CYCLES.total": 10.0,
+        "work.bar.PERF_COUNT_HW_CPU_CYCLES.total": 20.0,
+        "work.PERF_COUNT_HW_CPU_CYCLES.total": 30.0,
+    }
+    assert Expression("time.gc / (time.gc + time.mu)")(stats) == 0.25
+    assert Expression("-2 ** 2 + 3 * time.mu")(stats) == 5
+    assert Expression("sum(work.*.PERF_COUNT_HW_CPU_CYCLES.total)")(stats) == 30
+    assert Expression("count(work.*.PERF_COUNT_HW_CPU_CYCLES.total)")(stats) == 2
+    assert Expression("abs(time.gc - time.mu)")(stats) == 2
+    assert Expression("time.gc / 0")(stats) != Expression("time.gc / 0")(stats)
+    with pytest.raises(KeyError):
+        Expression("time.foo + 1")(stats)
+    with pytest.raises(KeyError):
+        Expression("sum(work.*.PERF_COUNT_HW_INSTRUCTIONS.total)")(stats)
+
+
+@pytest.mark.parametrize(
+    "text", ["time.gc +", "(time.gc", "time.gc)", "open(x)", "work.*.x", "a $ b"]
+)
+def test_invalid_expression(text):
+    with pytest.raises(ValueError):
+        Expression(text)
+
+
+def test_parse_definitions():
+    definitions = parse_definitions(["a = time.gc * 2", "b=a+1"])
+    assert [name for (name, _) in definitions] == ["a", "b"]
+    stats = {"time.gc": 1.0}
+    for name, expression in definitions:
+        stats[name] = expression(stats)
+    assert stats["b"] == 3
+    assert parse_definitions({"c": "1"})[0][0] == "c"
+    with pytest.raises(ValueError):
+        parse_definitions(["time.gc * 2"])
@@ -1,10 +1,18 @@
 from running.command.log_preprocessor import (
+    MMTk_FOOTER,
+    MMTk_HEADER,
+    Manifest,
+    compile_preprocessing,
+    process,
+    process_lines,
     filter_stats,
     reduce_stats,
     sum_work_perf_event,
     calc_work_ipc,
     ratio_work_perf_event,
 )
+from running.config import Configuration
+import gzip
 
 
 def test_filter():
@@ -60,3 +68,125 @@ def test_ipc():
     print(ipcs)
     assert ipcs["work.foo.INSTRUCTIONS_PER_CYCLE.ratio"] == 0.2
     assert ipcs["work.bar.INSTRUCTIONS_PER_CYCLE.ratio"] == 0.5
+
+
+def test_process_parallel(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    for bm in ["fop", "avrora", "lusearch"]:
+        with gzip.open(source / "{}.0.0.jdk.dacapo.log.gz".format(bm), "wt") as fd:
+            fd.writelines(
+                [
+                    MMTk_HEADER + "\n",
+                    "work.foo.PERF_COUNT_HW_CPU_CYCLES.total\ttime.gc\n",
+                    "20\t1\n",
+                    "Total time: 1.00 ms\n",
+                    MMTk_FOOTER + "\n",
+                ]
+            )
+    (source / "broken.0.0.jdk.dacapo.log.gz").write_text("not gzipped")
+    configuration = Configuration(
+        {"preprocessing": [{"name": "filter_stats", "val": "time"}]}
+    )
+    outputs = []
+    for jobs in [1, 2]:
+        target = tmp_path / "target{}".format(jobs)
+        target.mkdir()
+        failed = process(configuration, source, target, jobs)
+        assert [f.name for (f, _) in failed] == ["broken.0.0.jdk.dacapo.log.gz"]
+        assert not (target / "broken.0.0.jdk.dacapo.log.gz").exists()
+        outputs.append(
+            {f.name: gzip.open(f, "rt").read() for f in sorted(target.iterdir())}
+        )
+    assert outputs[0] == outputs[1]
+    assert "time.gc\n1.0\n" in outputs[0]["fop.0.0.jdk.dacapo.log.gz"]
+
+
+def test_process_manifest(tmp_path):
+    source = tmp_path / "source"
+    target = tmp_path / "target"
+    source.mkdir()
+    target.mkdir()
+    log = source / "fop.0.0.jdk.dacapo.log.gz"
+    with gzip.open(log, "wt") as fd:
+        fd.write("hello\n")
+    # Still being compressed by runbms
+    (source / "avrora.0.0.jdk.dacapo.log").write_text("hello\n")
+    (source / "avrora.0.0.jdk.dacapo.log.gz").write_bytes(b"")
+    configuration = Configuration({"preprocessing": []})
+    manifest = Manifest(target, configuration)
+    assert process(configuration, source, target, manifest=manifest) == []
+    assert [f.name for f in target.glob("*.log.gz")] == [log.name]
+    manifest = Manifest(target, configuration)
+    assert manifest.is_up_to_date(log, target / log.name)
+    with gzip.open(log, "wt") as fd:
+        fd.write("changed\n")
+    assert not manifest.is_up_to_date(log, target / log.name)
+    process(configuration, source, target, manifest=manifest)
+    assert manifest.is_up_to_date(log, target / log.name)
+    # Changing the preprocessing invalidates the outputs
+    changed = Configuration({"preprocessing": [{"name": "calc_ipc"}]})
+    assert not Manifest(target, changed).is_up_to_date(log, target / log.name)
+
+
+def test_derive():
+    configuration = Configuration(
+        {
+            "preprocessing": [
+                {
+                    "name": "derive",
+                    "val": {
+                        "gc_fraction": "time.gc / (time.gc + time.mu)",
+                        "cycles": "sum(work.*.PERF_COUNT_HW_CPU_CYCLES.total)",
+                    },
+                }
+            ]
+        }
+    )
+    stats = compile_preprocessing(configuration)({"time.gc": 1.0, "time.mu": 3.0})
+    assert stats == {"time.gc": 1.0, "time.mu": 3.0, "gc_fraction": 0.25}
+
+
+def test_process_lines_streaming():
+    consumed = []
+
+    def lines():
+        for line in [
+            "before\n",
+            MMTk_HEADER + "\n",
+            "time.gc\ttime.mu\tfoo\n",
+            "1\t3\t5\n",
+            "Total time: 4.00 ms\n",
+            MMTk_FOOTER + "\n",
+            "after\n",
+        ]:
+            consumed.append(line)
+            yield line
+
+    configuration = Configuration(
+        {"preprocessing": [{"name": "filter_stats", "val": "time"}]}
+    )
+    output = process_lines(configuration, lines())
+    # Lines outside of the statistics are passed through without buffering
+    assert next(output) == "before\n"
+    assert len(consumed) == 1
+    assert list(output) == [
+        MMTk_HEADER + "\n",
+        "time.mu\ttime.gc\n",
+        "3.0\t1.0\n",
+        "Total time: 4.00 ms\n",
+        MMTk_FOOTER + "\n",
+        "after\n",
+    ]
+
+
+def test_process_lines_truncated():
+    configuration = Configuration(
+        {"preprocessing": [{"name": "filter_stats", "val": "time"}]}
+    )
+    block = [MMTk_HEADER + "\n", "time.gc\tfoo\n", "1\t5\n"]
+    # The first iteration crashed before the footer
+    lines = block + ["crash\n"] + block + [MMTk_FOOTER + "\n"]
+    output = list(process_lines(configuration, lines))
+    processed = [MMTk_HEADER + "\n", "time.gc\n", "1.0\n"]
+    assert output == processed + ["crash\n"] + processed + [MMTk_FOOTER + "\n"]
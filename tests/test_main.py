@@ -0,0 +1,29 @@
+import subprocess
+import sys
+from running.__main__ import get_command, setup_parser
+
+
+def test_get_command():
+    assert get_command(["-v", "-d", "runbms", "-i", "1"]) == "runbms"
+    assert get_command(["fillin", "prog", "3"]) == "fillin"
+    assert get_command(["--help"]) is None
+    assert get_command(["foo"]) is None
+
+
+def test_setup_parser():
+    parser = setup_parser(["fillin", "prog", "3"])
+    args = vars(parser.parse_args(["fillin", "prog", "3"]))
+    assert args["which"] == "fillin"
+    assert args["LEVELS"] == 3
+
+
+def test_lazy_import():
+    # The benchmark suites and runtimes are not needed by fillin
+    code = (
+        "import sys\n"
+        "from running.__main__ import setup_parser\n"
+        "setup_parser(['fillin', 'prog', '3'])\n"
+        "assert 'running.suite' not in sys.modules\n"
+        "assert 'running.command.runbms' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
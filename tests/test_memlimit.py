@@ -0,0 +1,26 @@
+from running import memlimit
+import sys
+
+
+def test_rlimit(capfd):
+    allocate = "x = bytearray({} * 1024 * 1024)"
+    assert (
+        memlimit.main(["rlimit", "512", sys.executable, "-c", allocate.format(1)]) == 0
+    )
+    assert memlimit.main(["rlimit", "512", sys.executable, "-c", allocate.format(1024)])
+    assert "MemoryError" in capfd.readouterr().err
+
+
+def test_failure(capfd):
+    assert memlimit.main(["rlimit", "512", "sh", "-c", "kill -SEGV $$"]) == 139
+    assert capfd.readouterr().err == "running.memlimit: killed by signal 11\n"
+
+
+def test_cgroup(tmp_path):
+    (tmp_path / "cgroup.procs").touch()
+    cgroup = memlimit.create_cgroup(tmp_path, 64 * 1024 * 1024)
+    assert (cgroup / "memory.max").read_text() == str(64 * 1024 * 1024)
+    (cgroup / "memory.events").write_text("low 0\nhigh 0\nmax 3\noom 1\noom_kill 0\n")
+    assert not memlimit.is_oom_killed(cgroup)
+    (cgroup / "memory.events").write_text("oom 1\noom_kill 1\n")
+    assert memlimit.is_oom_killed(cgroup)
@@ -0,0 +1,150 @@
+from running.benchmark import BinaryBenchmark
+from running.command import minheap
+from running.modifier import ProgramArg
+from running.runtime import NativeExecutable
+from running.command.minheap import (
+    ContinueSearch,
+    Journal,
+    MinheapCache,
+    ThrashingDetector,
+    bracket,
+    confirm,
+    partition_cpus,
+    speculative_sizes,
+)
+
+
+def test_partition_cpus(monkeypatch):
+    monkeypatch.setattr(minheap.shutil, "which", lambda _: "/usr/bin/taskset")
+    monkeypatch.setattr(
+        minheap.os, "sched_getaffinity", lambda _: {0, 1, 2, 3, 4, 5, 8}, raising=False
+    )
+    assert partition_cpus(3) == [[0, 1], [2, 3], [4, 5, 8]]
+    assert partition_cpus(1) == [[0, 1, 2, 3, 4, 5, 8]]
+    # Not enough CPUs to give each job its own
+    assert partition_cpus(8) == []
+
+
+def test_speculative_sizes():
+    assert speculative_sizes(2, 1000, 1) == [501]
+    assert speculative_sizes(2, 1002, 3) == [252, 502, 752]
+    # Never probe the ends of the interval
+    assert speculative_sizes(10, 12, 3) == [11]
+
+
+def probe_with_minheap(minheap, probed):
+    def probe(size):
+        probed.append(size)
+        if size >= minheap:
+            return ContinueSearch.HeapTooBig
+        return ContinueSearch.HeapTooSmall
+
+    return probe
+
+
+def test_bracket():
+    probed = []
+    # The guess passes, so search downwards
+    assert bracket(probe_with_minheap(95, probed), 100, 1000) == (90, 100, 100)
+    assert probed == [100, 90]
+    probed = []
+    assert bracket(probe_with_minheap(130, probed), 100, 1000) == (110, 130, 130)
+    assert probed == [100, 110, 130]
+    # Nothing passes up to the maximum heap size
+    assert bracket(probe_with_minheap(2000, []), 100, 1000)[2] == float("inf")
+
+
+def test_confirm():
+    # Passes reliably from 103, and half of the time at 100 to 102
+    counts = {}
+
+    def probe(size):
+        counts[size] = counts.get(size, 0) + 1
+        if size >= 103 or (size >= 100 and counts[size] % 2 == 0):
+            return ContinueSearch.HeapTooBig
+        return ContinueSearch.HeapTooSmall
+
+    confirmation = confirm(probe, 100, 1000, 4, 1.0)
+    assert confirmation["minheap"] == 103
+    assert confirmation["passes"] == confirmation["runs"] == 4
+    # Stops as soon as one run fails
+    assert (confirmation["below_passes"], confirmation["below_runs"]) == (0, 1)
+    assert 0 < confirmation["pass_rate_lower_bound"] < 1
+    # Half of the runs passing is good enough
+    assert confirm(probe, 100, 1000, 4, 0.5)["minheap"] == 100
+
+
+class PauseRuntime(object):
+    def get_gc_pause(self, line):
+        return float(line[len("pause ") :]) if line.startswith(b"pause ") else None
+
+
+def test_thrashing_detector():
+    now = [0.0]
+    detector = ThrashingDetector(PauseRuntime(), 1.0, 0.5, clock=lambda: now[0])
+    # A burst of GCs before a full window has passed is not thrashing
+    assert not detector(b"pause 0.4\npause 0.4\n")
+    now[0] = 1.2
+    # The burst is now outside the window
+    assert not detector(b"pau")
+    assert not detector(b"se 0.2\n")
+    now[0] = 1.5
+    assert detector(b"pause 0.3\n")
+    rate = ThrashingDetector(PauseRuntime(), 1.0, 0.5, 3, clock=lambda: now[0])
+    now[0] = 2.6
+    assert rate(b"pause 0.01\n" * 3)
+
+
+def test_journal(tmp_path):
+    journal = Journal(tmp_path / "result.journal.jsonl")
+    search = journal.for_search("c", "dacapo", "fop")
+    assert search.probe(500, "search", lambda **_: ContinueSearch.HeapTooBig, print)
+    search.probe(250, "search", lambda **_: ContinueSearch.HeapTooSmall, print)
+    # Neither confirmation runs nor cancelled probes are replayed
+    search.probe(300, "confirm", lambda **_: ContinueSearch.HeapTooBig, print)
+    search.probe(400, "search", lambda **_: ContinueSearch.Cancelled, print)
+    journal.for_search("c", "dacapo", "avrora").minheap(
+        100, 1.0, {"minheap": 100, "passes": 2, "runs": 2}
+    )
+    journal.close()
+    with journal.path.open("a") as fd:
+        fd.write('{"type": "pro')
+
+    result: dict = {}
+    confirmations: dict = {}
+    resumed = Journal(journal.path)
+    resumed.replay(result, confirmations)
+    assert result == {"c": {"dacapo": {"avrora": 100}}}
+    assert confirmations["c"]["dacapo"]["avrora"]["runs"] == 2
+    assert resumed.probes == {
+        ("c", "dacapo", "fop", 500): ContinueSearch.HeapTooBig,
+        ("c", "dacapo", "fop", 250): ContinueSearch.HeapTooSmall,
+    }
+    log = []
+    search = resumed.for_search("c", "dacapo", "fop")
+    assert search.probe(500, "search", None, log.append) is ContinueSearch.HeapTooBig
+    assert log == [" o* "]
+    search.minheap(300, 2.0)
+    resumed.close()
+    # The record after the truncated one is intact
+    result = {}
+    Journal(journal.path).replay(result, {})
+    assert result["c"]["dacapo"]["fop"] == 300
+
+
+def test_minheap_cache(tmp_path):
+    program = tmp_path / "program"
+    program.write_text("")
+    runtime = NativeExecutable(name="native")
+    b = BinaryBenchmark(program, [], suite_name="bin", name="program")
+    fingerprint = MinheapCache.get_fingerprint(runtime, b)
+    with_arg = b.attach_modifiers([ProgramArg(name="arg", val="-x")])
+    assert MinheapCache.get_fingerprint(runtime, with_arg) != fingerprint
+    cache = MinheapCache(tmp_path / "cache" / "minheap.yml")
+    assert cache.get(fingerprint) is None
+    cache.put(fingerprint, {"benchmark": "program", "minheap": 42})
+    # Shared with other runs through the file
+    assert MinheapCache(cache.path).get(fingerprint) == 42
+    # A rebuilt program has to be measured again
+    program.write_text("rebuilt")
+    assert MinheapCache.get_fingerprint(runtime, b) != fingerprint
@@ -3,6 +3,7 @@ from running.modifier import *
 from running.config import Configuration
 from running.runtime import OpenJDK
 from running.util import dont_emit_heapsize_modifier
+import pytest
 
 
 def test_jvm_arg():
@@ -18,7 +19,7 @@ def test_jvm_classpath():
         jvm_args=[], program_args=[], cp=["fizzbuzz"], suite_name="dacapo", name="fop"
     )
     jb = jb.attach_modifiers([j])
-    assert jb.cp == ["fizzbuzz", "/bin", "/foo", "/Users/John Citizen/"]
+    assert jb.cp == ("fizzbuzz", "/bin", "/foo", "/Users/John Citizen/")
 
 
 def test_jvm_classpath_append():
@@ -29,7 +30,7 @@ def test_jvm_classpath_append():
         jvm_args=[], program_args=[], cp=["fizzbuzz"], suite_name="dacapo", name="fop"
     )
     jb = jb.attach_modifiers([j])
-    assert jb.cp == ["fizzbuzz", "/bin", "/foo", "/Users/John Citizen/"]
+    assert jb.cp == ("fizzbuzz", "/bin", "/foo", "/Users/John Citizen/")
 
 
 def test_jvm_classpath_prepend():
@@ -40,7 +41,7 @@ def test_jvm_classpath_prepend():
         jvm_args=[], program_args=[], cp=["fizzbuzz"], suite_name="dacapo", name="fop"
     )
     jb = jb.attach_modifiers([j])
-    assert jb.cp == ["/bin", "/foo", "/Users/John Citizen/", "fizzbuzz"]
+    assert jb.cp == ("/bin", "/foo", "/Users/John Citizen/", "fizzbuzz")
 
 
 def test_program_arg():
@@ -77,6 +78,41 @@ def test_modifier_set():
     assert len(mods) == 3
 
 
+def test_modifier_set_memoized():
+    c = Configuration(
+        {
+            "modifiers": {
+                "a": {"type": "JVMArg", "val": "-XX:GC={0}"},
+                "b": {"type": "EnvVar", "var": "FOO", "val": "BAR"},
+                "set": {"type": "ModifierSet", "val": "a-{0}|b"},
+            }
+        }
+    )
+    c.resolve_class()
+    a1, b = c.get_modifiers("jdk|set-NoGC")
+    a2, _, _ = c.get_modifiers("jdk|a-NoGC|set-Epsilon")
+    assert a1 is a2
+    assert a1.val == ["-XX:GC=NoGC"]
+    assert [m for m, _ in c.expand_modifier("set-Epsilon")] == ["a-Epsilon", "b"]
+
+
+def test_modifier_set_cycle():
+    c = Configuration(
+        {
+            "modifiers": {
+                "a": {"type": "EnvVar", "var": "FOO", "val": "BAR"},
+                "x": {"type": "ModifierSet", "val": "a|y"},
+                "y": {"type": "ModifierSet", "val": "x-{0}"},
+            }
+        }
+    )
+    c.resolve_class()
+    with pytest.raises(ValueError, match="x -> y -> x"):
+        c.get_modifiers("jdk|x")
+    with pytest.raises(ValueError, match="x -> y -> x"):
+        c.get("modifiers")["x"].flatten(c)
+
+
 def test_no_includes_no_excludes():
     c = Configuration(
         {"modifiers": {"a": {"type": "EnvVar", "var": "FOO", "val": "BAR"}}}
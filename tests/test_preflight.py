@@ -0,0 +1,50 @@
+from pathlib import Path
+from running.command import preflight
+from running.config import Configuration
+import running
+
+
+def test_preflight(monkeypatch):
+    # The smoke runs are wrapped by running.memlimit in their own directories
+    monkeypatch.setenv("PYTHONPATH", str(Path(running.__file__).parent.parent))
+    preflight.configuration = Configuration(
+        {
+            "runtimes": {
+                "native": {"type": "NativeExecutable", "memory_limit": "rlimit"}
+            },
+            "modifiers": {"a": {"type": "ProgramArg", "val": "-a"}},
+            "suites": {
+                "bin": {
+                    "type": "BinaryBenchmarkSuite",
+                    "programs": {
+                        "true": {"path": "/bin/true", "args": ""},
+                        "false": {"path": "/bin/false", "args": ""},
+                    },
+                    "timeout": 10,
+                    "minheap": "native",
+                    "minheap_values": {"native": {"true": 100}},
+                }
+            },
+            "benchmarks": {"bin": ["true", "false"]},
+            "configs": ["native|a", "native|b", "jdk"],
+        }
+    )
+    preflight.configuration.resolve_class(lazy=True)
+    preflight.problems = {}
+    configs = preflight.configuration.get("configs")
+    preflight.check_configs(configs)
+    checked = preflight.check_benchmarks(True)
+    assert "Modifier 'b' not defined" in preflight.problems["native|b"][0]
+    assert "Runtime 'jdk' not defined" in preflight.problems["jdk"][0]
+    assert "Minheap for false" in preflight.problems["bin-false"][0]
+    assert "bin-true" not in preflight.problems
+
+    outcomes = preflight.smoke_test(checked, configs, 2, 1.0, 10, None)
+    assert outcomes == {
+        ("bin-true", "native|a"): preflight.PASS,
+        ("bin-true", "native|b"): preflight.SKIPPED,
+        ("bin-true", "jdk"): preflight.SKIPPED,
+        ("bin-false", "native|a"): preflight.FAIL,
+        ("bin-false", "native|b"): preflight.SKIPPED,
+        ("bin-false", "jdk"): preflight.SKIPPED,
+    }
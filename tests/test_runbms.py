@@ -146,3 +146,95 @@ def test_config_randomization_logic():
 
     # With 5 configs shuffled 10 times, we should get at least some different orders
     assert different_orders > 0, "Shuffling should produce different orders"
+
+
+def test_result_cache(tmp_path, monkeypatch):
+    from running.benchmark import BinaryBenchmark
+    from running.command.runbms import ResultCache
+    from running.runtime import NativeExecutable
+
+    program = tmp_path / "program"
+    program.write_text("v1")
+    runtime = NativeExecutable(name="native")
+    b = BinaryBenchmark(
+        program=program, program_args=["-n", "1"], suite_name="bin", name="p"
+    )
+    cache = ResultCache(tmp_path / "cache")
+    key = cache.get_key(runtime, b)
+    assert cache.get(key, 0) is None
+    cache.put(key, 0, b"log 0")
+    assert cache.get(key, 0) == b"log 0"
+    assert cache.get(key, 1) is None
+    # Different arguments, or a rebuilt program, are measured again
+    other = BinaryBenchmark(
+        program=program, program_args=["-n", "2"], suite_name="bin", name="p"
+    )
+    assert cache.get_key(runtime, other) != key
+    program.write_text("v2")
+    assert ResultCache(tmp_path / "cache").get_key(runtime, b) != key
+    # So does a benchmark that inherits a different environment
+    key = cache.get_key(runtime, other)
+    monkeypatch.setenv("MMTK_THREADS", "1")
+    assert cache.get_key(runtime, other) != key
+    key = cache.get_key(runtime, other)
+    monkeypatch.setenv("PWD", str(tmp_path))
+    assert cache.get_key(runtime, other) == key
+
+
+def test_config_names(tmp_path):
+    from running.command.runbms import save_config_names
+    from running.results import load_config_names
+    from running.util import config_filename_encode, config_str_encode
+
+    short_c = "openjdk|ms"
+    long_c = "|".join(["openjdk"] + ["mod{}-{}".format(i, i) for i in range(50)])
+    save_config_names([short_c], tmp_path)
+    assert not (tmp_path / "config_names.yml").exists()
+    save_config_names([short_c, long_c], tmp_path)
+    assert load_config_names(tmp_path) == {
+        config_filename_encode(long_c): config_str_encode(long_c)
+    }
+
+
+def test_measure_missing_minheap(tmp_path, monkeypatch):
+    from pathlib import Path
+    from running.command import runbms
+    from running.command.minheap import MinheapCache
+    from running.config import Configuration
+    import running
+
+    monkeypatch.setenv("PYTHONPATH", str(Path(running.__file__).parent.parent))
+    configuration = Configuration(
+        {
+            "runtimes": {
+                "native": {"type": "NativeExecutable", "memory_limit": "rlimit"}
+            },
+            "suites": {
+                "bin": {
+                    "type": "BinaryBenchmarkSuite",
+                    "programs": {"false": {"path": "/bin/false", "args": ""}},
+                    "timeout": 10,
+                },
+                # The minheap of SPECjbb2015 is fixed, so it is never measured
+                "jbb": {
+                    "type": "SPECjbb2015",
+                    "release": "1.03",
+                    "path": str(tmp_path / "specjbb2015.jar"),
+                },
+            },
+            "benchmarks": {"bin": ["false"], "jbb": ["composite"]},
+            "configs": ["native"],
+        }
+    )
+    configuration.resolve_class()
+    monkeypatch.setattr(runbms, "configuration", configuration, raising=False)
+    with pytest.raises(RuntimeError) as e:
+        runbms.measure_missing_minheap(
+            configuration.get("suites"),
+            configuration.get("benchmarks"),
+            "native",
+            MinheapCache(tmp_path / "minheap.yml"),
+            16,
+        )
+    assert "bin-false" in str(e.value)
+    assert "jbb" not in str(e.value)
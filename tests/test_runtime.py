@@ -1,3 +1,4 @@
+import pytest
 from running.config import Configuration
 
 
@@ -27,3 +28,70 @@ def test_openjdk_path_ennvvar():
     assert "$DAHKDLHDIWHEIUWHEIWEHIJHDJKAGDKJADGUQDGIQUWDGI" in str(
         temurin_21_bogus.home
     )
+
+
+def test_openjdk_peak_heap_after_gc():
+    c = Configuration(
+        {
+            "runtimes": {
+                "jdk8": {"type": "OpenJDK", "release": 8, "home": "/jdk8"},
+                "jdk21": {"type": "OpenJDK", "release": 21, "home": "/jdk21"},
+            }
+        }
+    )
+    c.resolve_class()
+    jdk8 = c.get("runtimes")["jdk8"]
+    jdk21 = c.get("runtimes")["jdk21"]
+    assert jdk8.get_gc_log_modifiers()[0].val == ["-verbose:gc"]
+    assert jdk21.get_gc_log_modifiers()[0].val == ["-Xlog:gc"]
+    output = (
+        b"[0.050s][info][gc] GC(0) Pause Young (Normal) (G1 Evacuation Pause) "
+        b"24M->3M(256M) 1.234ms\n"
+        b"[0.090s][info][gc] GC(1) Pause Full (System.gc()) 30M->7M(256M) 5.678ms\n"
+    )
+    assert jdk21.get_peak_heap_after_gc(output) == 7
+    output = b"[GC (Allocation Failure)  65536K->1024K(251392K), 0.0014 secs]\n"
+    assert jdk8.get_peak_heap_after_gc(output) == 1
+    assert jdk21.get_peak_heap_after_gc(b"no GC\n") is None
+
+
+def test_openjdk_gc_pause():
+    c = Configuration(
+        {"runtimes": {"jdk": {"type": "OpenJDK", "release": 21, "home": "/jdk"}}}
+    )
+    c.resolve_class()
+    jdk = c.get("runtimes")["jdk"]
+    pause = jdk.get_gc_pause(
+        b"[0.050s][info][gc] GC(0) Pause Young (Normal) (G1 Evacuation Pause) "
+        b"24M->3M(256M) 1.500ms"
+    )
+    assert pause == 0.0015
+    assert jdk.get_gc_pause(b"[GC (Allocation Failure)  65K->1K(251K), 0.25 secs]")
+    assert jdk.get_gc_pause(b"[1.0s][info][gc] GC(2) Concurrent Mark 12.0ms") is None
+
+
+def test_native_executable_memory_limit():
+    c = Configuration(
+        {
+            "runtimes": {
+                "native_unlimited": {"type": "NativeExecutable"},
+                "native": {"type": "NativeExecutable", "memory_limit": "rlimit"},
+                "native_cgroup": {
+                    "type": "NativeExecutable",
+                    "memory_limit": "cgroup",
+                    "cgroup": "/sys/fs/cgroup/running",
+                },
+            }
+        }
+    )
+    c.resolve_class()
+    with pytest.raises(ValueError):
+        c.get("runtimes")["native_unlimited"].get_heapsize_modifiers(64)
+    native = c.get("runtimes")["native"]
+    (wrapper,) = native.get_heapsize_modifiers(64)
+    assert wrapper.val[-4:] == ["-m", "running.memlimit", "rlimit", "64"]
+    (wrapper,) = c.get("runtimes")["native_cgroup"].get_heapsize_modifiers(64)
+    assert wrapper.val[-3:] == ["64", "--cgroup", "/sys/fs/cgroup/running"]
+    assert native.is_oom(b"running.memlimit: out of memory\n")
+    assert native.is_oom(b"terminate called after throwing 'std::bad_alloc'\n")
+    assert not native.is_oom(b"running.memlimit: killed by signal 11\n")
@@ -104,3 +104,16 @@ def test_dacapo_path_ennvvar():
     assert "$DAHKDLHDIWHEIUWHEIWEHIJHDJKAGDKJADGUQDGIQUWDGI" in str(
         dacapo2006_bogus.path
     )
+
+
+def test_binary_benchmark_suite_minheap():
+    b = BinaryBenchmarkSuite(
+        name="foobar",
+        programs={"ls": {"path": "/bin/ls", "args": ""}},
+        minheap="glibc",
+        minheap_values={"glibc": {"ls": 3}, "jemalloc": {"ls": 2}},
+    )
+    assert b.get_minheap(b.get_benchmark("ls")) == 3
+    assert b.get_known_minheap("ls", "jemalloc") == 2
+    assert b.is_passed(b"foo\n")
+    assert not b.is_passed(b"running.memlimit: killed by signal 11\n")
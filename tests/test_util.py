@@ -5,7 +5,11 @@ from running.util import (
     smart_quote,
     split_quoted,
     detect_rogue_processes,
+    config_index_to_chr,
+    config_filename_encode,
 )
+import re
+import pytest
 
 
 def test_split_quoted():
@@ -105,3 +109,27 @@ no PID header"""
     # Test with empty output
     rogue_processes = detect_rogue_processes("")
     assert len(rogue_processes) == 0
+
+
+def test_config_index_to_chr():
+    assert config_index_to_chr(0) == "a"
+    assert config_index_to_chr(51) == "Z"
+    assert config_index_to_chr(52) == "ba"
+    assert config_index_to_chr(52 * 52 - 1) == "ZZ"
+    assert config_index_to_chr(52 * 52) == "baa"
+    codes = [config_index_to_chr(i) for i in range(1000)]
+    assert len(set(codes)) == 1000
+    with pytest.raises(ValueError):
+        config_index_to_chr(-1)
+
+
+def test_config_filename_encode():
+    plotty = re.compile(r"^[a-zA-Z0-9_\-\.\:\,]+$")
+    c = "openjdk|ms|s|c2|common_mmtk|mmtk_gc-Immix"
+    assert config_filename_encode(c) == "openjdk.ms.s.c2.common_mmtk.mmtk_gc-Immix"
+    long_c = "|".join(["openjdk"] + ["mod{}-{}".format(i, i) for i in range(50)])
+    encoded = config_filename_encode(long_c)
+    assert encoded.startswith("config-")
+    assert plotty.match(encoded)
+    assert encoded == config_filename_encode(long_c.replace("|", " | "))
+    assert encoded != config_filename_encode(long_c + "|extra")